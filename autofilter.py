@@ -0,0 +1,121 @@
+"""Escolha automática do filtro de redução de ruído, imagem por imagem.
+
+A imagem reduzida, em que o ruído já foi atenuado pela média dos pixels, serve de
+referência. O ruído da imagem é separado em um recorte central em resolução completa (a
+diferença para a mediana 3x3, que mantém ruído impulsivo e não gaussiano como ele é) e
+somado à referência; cada filtro candidato é aplicado a essa versão ruidosa e o
+resultado é comparado com a referência pelo SSIM (desempate pelo PSNR). Só o vencedor é
+aplicado à imagem em resolução completa. Imagens sem ruído perceptível, pela energia
+desse mesmo resíduo (que, ao contrário da estimativa do desvio pelos coeficientes
+wavelet, também vê ruído impulsivo), ficam com o primeiro candidato, sem comparação.
+
+O tempo de cada candidato na imagem reduzida, multiplicado pela razão entre os números
+de pixels, dá uma previsão do tempo em resolução completa. Com params["auto_budget"],
+candidatos que não caberiam no tempo da imagem (escolha incluída) são descartados, e a
+comparação para assim que esse tempo se esgota.
+"""
+import time
+
+import cv2 as cv
+import numpy as np
+
+import denoise
+import pipeline
+import profiling
+
+"""Maior lado da imagem reduzida em que os candidatos são comparados"""
+PROXY_SIZE = 256
+
+"""Lado do recorte central em que o ruído é estimado"""
+_NOISE_CROP = 512
+
+"""Valor RMS do resíduo, na escala [0, 1], abaixo do qual a imagem é considerada sem ruído (1 nível em 8 bits)"""
+_MIN_NOISE = 1 / 255
+
+"""Janela gaussiana e constantes do SSIM (Wang et al., 2004), para imagens em [0, 1]"""
+_SSIM_WINDOW = (11, 11)
+_SSIM_SIGMA = 1.5
+_SSIM_C1, _SSIM_C2 = 0.01 ** 2, 0.03 ** 2
+
+
+def _center(img, height, width):
+    top, left = max((img.shape[0] - height) // 2, 0), max((img.shape[1] - width) // 2, 0)
+    return img[top:top + height, left:left + width]
+
+
+def estimate_noise(img):
+    """Desvio do ruído, na escala [0, 1], estimado em um recorte central da imagem"""
+    return denoise.estimate_sigma(pipeline.to_float32(_center(img, _NOISE_CROP, _NOISE_CROP)))
+
+
+def noise_sample(img, shape):
+    """Ruído de um recorte central de img em resolução completa, em float32, com a forma pedida"""
+    crop = _center(img, *shape)
+    return pipeline.to_float32(crop) - pipeline.to_float32(cv.medianBlur(crop, 3))
+
+
+def psnr(reference, img):
+    """PSNR, em dB, entre duas imagens float32 em [0, 1]"""
+    mse = cv.norm(reference, img, cv.NORM_L2SQR) / reference.size
+    return float("inf") if mse == 0 else float(10 * np.log10(1 / mse))
+
+
+def ssim(reference, img):
+    """SSIM médio entre duas imagens float32 em [0, 1], com janela gaussiana 11x11 de desvio 1,5"""
+    def blur(values):
+        return cv.GaussianBlur(values, _SSIM_WINDOW, _SSIM_SIGMA)
+
+    mean_x, mean_y = blur(reference), blur(img)
+    var_x = blur(reference * reference) - mean_x * mean_x
+    var_y = blur(img * img) - mean_y * mean_y
+    cov = blur(reference * img) - mean_x * mean_y
+    ssim_map = ((2 * mean_x * mean_y + _SSIM_C1) * (2 * cov + _SSIM_C2)
+                / ((mean_x * mean_x + mean_y * mean_y + _SSIM_C1) * (var_x + var_y + _SSIM_C2)))
+    return float(cv.mean(ssim_map)[0])
+
+
+def choose(img, params):
+    """Escolhe o filtro para img; devolve o índice em pipeline.FILTROS e as notas dos candidatos.
+
+    As notas ficam em um dicionário por nome de filtro, com ssim, psnr e os tempos na imagem
+    reduzida e o previsto em resolução completa. Candidatos que não chegaram a ser
+    comparados, por falta de tempo ou de ruído, ficam de fora.
+    """
+    if not params["auto_candidates"] or "auto" in params["auto_candidates"]:
+        raise ValueError("auto_candidates deve listar ao menos um filtro, sem incluir \"auto\"")
+    start = time.perf_counter()
+    budget = params["auto_budget"]
+    with profiling.stage("auto"):
+        reference = pipeline.to_float32(pipeline.make_proxy(img, PROXY_SIZE))
+        # Em imagens menores que PROXY_SIZE a referência é a própria imagem, já com ruído
+        noise = noise_sample(img, reference.shape)
+        if cv.norm(noise, cv.NORM_L2) / np.sqrt(noise.size) < _MIN_NOISE:
+            return pipeline.FILTROS.index(params["auto_candidates"][0]), {}
+        noisy = np.clip(reference + noise, 0, 1, out=noise)
+        noisy = pipeline.to_depth(noisy, np.uint16 if img.dtype == np.uint16 else np.uint8)
+        # Na imagem reduzida não há blocos e o ruído do wavelet é estimado nela mesma
+        candidate_params = dict(params, tile_size=0, wavelet_sigma=None)
+        scale = img.size / reference.size
+        # Importações feitas no primeiro uso de um filtro não entram na previsão de tempo
+        denoise.warm_up()
+
+        scores = {}
+        for name in params["auto_candidates"]:
+            if budget and scores and time.perf_counter() - start > budget:
+                break
+            candidate_start = time.perf_counter()
+            with profiling.stage("auto:" + name):
+                result = pipeline.to_float32(pipeline.apply_denoise(noisy, pipeline.FILTROS.index(name),
+                                                                    candidate_params))
+            seconds = time.perf_counter() - candidate_start
+            scores[name] = {"ssim": ssim(reference, result), "psnr": psnr(reference, result),
+                            "seconds": seconds, "projected": seconds * scale}
+
+    # O vencedor precisa caber no que sobrou do tempo; se nenhum couber, fica o mais rápido
+    elapsed = time.perf_counter() - start
+    fits = [name for name, entry in scores.items() if not budget or elapsed + entry["projected"] <= budget]
+    if fits:
+        winner = max(fits, key=lambda name: (scores[name]["ssim"], scores[name]["psnr"]))
+    else:
+        winner = min(scores, key=lambda name: scores[name]["projected"])
+    return pipeline.FILTROS.index(winner), scores
@@ -0,0 +1,401 @@
+"""Benchmark das etapas do pipeline, sem interface gráfica.
+
+Mede, para imagens sintéticas (e, opcionalmente, imagens de uma pasta) em várias
+resoluções e profundidades de bits: leitura, cada filtro, cada equalização, as
+conversões para uint8, a gravação e o processamento completo de cada combinação,
+com o tempo e o pico de memória de cada etapa.
+Também mede a vazão do lote completo com diferentes números de processos e, com
+--startup, o tempo de abertura do editor (do código-fonte ou do executável do PyInstaller).
+
+    python -m benchmark --sizes 512 1024 2048 --output resultados.json
+    python -m benchmark --startup --output abertura.json
+    python -m benchmark --startup dist/main.exe --output abertura_exe.json
+    python -m benchmark --compare antes.json depois.json
+
+Os resultados são gravados em JSON para comparar execuções de versões diferentes.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2 as cv
+import cv2.ximgproc as xip
+import numpy as np
+from skimage import exposure, filters, restoration
+
+import equalization
+import pipeline
+import saving
+
+DEFAULT_SIZES = (512, 1024, 2048)
+DEFAULT_BIT_DEPTHS = (8, 16)
+DEFAULT_MEDIAN_RADII = (1, 2, 3, 5)
+
+
+def _anisotropic_opencv_bgr(img, params):
+    # Caminho anterior: o filtro do OpenCV só aceita BGR, então a imagem passa por 3 canais
+    img_bgr = cv.cvtColor(pipeline.to_uint8(img), cv.COLOR_GRAY2BGR)
+    filtered_bgr = xip.anisotropicDiffusion(img_bgr, alpha=params["aniso_alpha"], K=params["aniso_k"],
+                                            niters=params["aniso_niters"])
+    return cv.cvtColor(filtered_bgr, cv.COLOR_BGR2GRAY)
+
+
+def _wavelet_skimage(img, params):
+    # Caminho anterior: restoration.denoise_wavelet, em uma thread
+    return restoration.denoise_wavelet(pipeline.to_float32(img), wavelet=params["wavelet"],
+                                       method=params["wavelet_method"], channel_axis=None)
+
+
+def _wiener_skimage(img, params):
+    # Caminho anterior: restoration.wiener refaz o filtro no domínio da frequência a cada chamada
+    psf_size = params["wiener_psf_size"]
+    psf = np.full((psf_size, psf_size), 1 / psf_size ** 2, dtype=np.float32)
+    return restoration.wiener(pipeline.to_float32(img), psf, balance=params["wiener_balance"])
+
+
+def _equalize_hist_skimage(img, params):
+    # Caminho anterior: histograma e interpolação em float64, convertidos para uint8 depois
+    return pipeline.to_uint8(exposure.equalize_hist(img))
+
+
+def _equalize_hist_shared_lut(img, params):
+    # Modo de lote com histograma compartilhado: por imagem, só a aplicação da tabela
+    return equalization.equalize_hist(img, params["hist_lut"])
+
+
+def _clahe_new_instance(img, params):
+    # Caminho anterior: um objeto CLAHE novo a cada imagem, em uma chamada só
+    tiles = params["clahe_tile_grid"]
+    return cv.createCLAHE(clipLimit=params["clahe_clip_limit"], tileGridSize=(tiles, tiles)).apply(img)
+
+
+"""Implementações anteriores (ou de referência) de cada filtro, medidas ao lado da atual"""
+REFERENCE_DENOISE = {
+    0: (("skimage", _wavelet_skimage),),
+    1: (("skimage", _wiener_skimage),),
+    3: (("opencv_bgr", _anisotropic_opencv_bgr),),
+}
+REFERENCE_EQUALIZE = {
+    0: (("skimage", _equalize_hist_skimage), ("shared_lut", _equalize_hist_shared_lut)),
+    1: (("new_instance", _clahe_new_instance),),
+}
+
+
+def synthetic_image(size, bit_depth=8, noise=0.08, seed=0):
+    """Imagem quadrada com gradiente, bordas e texturas, mais ruído gaussiano"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size] / size
+    img = 0.6 * x + 0.2 * (np.sin(40 * x) * np.sin(30 * y) > 0) + 0.2 * ((x - 0.5) ** 2 + (y - 0.5) ** 2 < 0.1)
+    img = np.clip(img + rng.normal(0, noise, img.shape), 0, 1)
+    if bit_depth == 16:
+        return (img * 65535).astype(np.uint16)
+    return (img * 255).astype(np.uint8)
+
+
+def measure(func, repeat=3):
+    """Executa func repetidas vezes; devolve tempos (mínimo e mediana), pico de memória e o último resultado"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+
+    # O pico de memória é medido em uma execução separada, porque o tracemalloc deixa tudo mais lento.
+    # Só conta alocações feitas pelo Python e pelo numpy (incluindo arrays devolvidos pelo OpenCV)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds_min": min(times),
+        "seconds_median": statistics.median(times),
+        "peak_bytes": peak,
+    }, result
+
+
+def benchmark_image(image_path, label, repeat, filter_indices=None, equalizations=None, bit_depth=8):
+    """Mede todas as etapas para uma imagem; devolve a lista de registros.
+
+    Com bit_depth 16, a imagem é lida e processada em 16 bits (keep_16bit), como no lote
+    com --keep-16bit; as diferenças para as referências são medidas em 8 bits.
+    """
+    filter_indices = range(len(pipeline.FILTROS)) if filter_indices is None else filter_indices
+    equalizations = range(len(pipeline.EQUALIZACOES)) if equalizations is None else equalizations
+    params = pipeline.resolve_params({"keep_16bit": bit_depth == 16})
+    dtype = pipeline.working_dtype(params)
+    records = []
+
+    def record(stage, option, stats):
+        records.append({"image": label, "stage": stage, "option": option, **stats})
+
+    stats, img = measure(lambda: pipeline.load_image(image_path, dtype), repeat)
+    record("decode", None, stats)
+
+    for filtro_index in filter_indices:
+        name = pipeline.FILTROS[filtro_index]
+        stats, denoised = measure(lambda: pipeline.apply_denoise(img, filtro_index, params), repeat)
+        record("denoise", name, stats)
+        for reference_name, reference in REFERENCE_DENOISE.get(filtro_index, ()):
+            stats, reference_result = measure(lambda: reference(img, params), repeat)
+            # Maior diferença, em níveis de cinza, entre a referência e a implementação atual
+            stats["max_abs_diff"] = int(np.abs(pipeline.to_uint8(reference_result).astype(np.int16)
+                                               - pipeline.to_uint8(denoised)).max())
+            record("denoise_reference", f"{name}:{reference_name}", stats)
+        stats, filtered = measure(lambda: pipeline.to_depth(denoised, dtype), repeat)
+        record(f"to_uint{bit_depth}_denoise", name, stats)
+
+        for equalizacao_index in equalizations:
+            eq_name = pipeline.EQUALIZACOES[equalizacao_index]
+            stats, equalized = measure(lambda: pipeline.apply_equalization(filtered, equalizacao_index, params),
+                                       repeat)
+            record("equalize", f"{name}+{eq_name}", stats)
+            # A tabela compartilhada de referência vem do histograma desta mesma imagem
+            lut_params = dict(params, hist_lut=equalization.equalization_lut(equalization.histogram(filtered)))
+            for reference_name, reference in REFERENCE_EQUALIZE.get(equalizacao_index, ()):
+                stats, reference_result = measure(lambda: reference(filtered, lut_params), repeat)
+                stats["max_abs_diff"] = int(np.abs(pipeline.to_uint8(reference_result).astype(np.int16)
+                                                   - pipeline.to_uint8(equalized)).max())
+                record("equalize_reference", f"{name}+{eq_name}:{reference_name}", stats)
+            stats, equalized = measure(lambda: pipeline.to_depth(equalized, dtype), repeat)
+            record(f"to_uint{bit_depth}_equalize", f"{name}+{eq_name}", stats)
+            # Imagem completa, da leitura ao resultado no tipo de trabalho: tempo e memória por imagem
+            stats, _ = measure(lambda: pipeline.process_image(image_path, filtro_index, equalizacao_index, params),
+                               repeat)
+            record("process_image", f"{name}+{eq_name}", stats)
+
+    # Gravação em cada formato, com as opções padrão (ver saving.py), e o tamanho resultante
+    for output_format in saving.OUTPUT_FORMATS[1:]:
+        stats, buffer = measure(lambda: saving.encode(equalized, "." + output_format, params), repeat)
+        stats["bytes"] = int(buffer.size)
+        record("encode", output_format, stats)
+    return records
+
+
+def benchmark_median_radii(image_path, label, radii, repeat, bit_depth=8):
+    """Mediana atual (ver denoise.median) e filters.median, a anterior, para vários raios da janela"""
+    img = pipeline.load_image(image_path, np.uint16 if bit_depth == 16 else np.uint8)
+    records = []
+    for radius in radii:
+        params = pipeline.resolve_params({"median_radius": radius, "keep_16bit": bit_depth == 16})
+        stats, result = measure(lambda: pipeline.apply_denoise(img, 2, params), repeat)
+        records.append({"image": label, "stage": "median_radius", "option": f"r{radius}", **stats})
+
+        footprint = np.ones((2 * radius + 1, 2 * radius + 1), dtype=bool)
+        stats, reference = measure(lambda: filters.median(img, footprint), repeat)
+        stats["max_abs_diff"] = int(np.abs(reference.astype(np.int32) - result).max())
+        records.append({"image": label, "stage": "median_radius_reference", "option": f"r{radius}:skimage", **stats})
+    return records
+
+
+def benchmark_scaling(image_paths, worker_counts, filtro_index=0, equalizacao_index=0):
+    """Vazão do lote completo (leitura, filtro, equalização e gravação) por número de processos"""
+    records = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        for workers in worker_counts:
+            stats = pipeline.run_batch(image_paths, out_dir, filtro_index, equalizacao_index, workers=workers)
+            records.append({
+                "stage": "batch",
+                "option": f"{pipeline.FILTROS[filtro_index]}+{pipeline.EQUALIZACOES[equalizacao_index]}",
+                "workers": workers,
+                "images": stats["images"],
+                "seconds": stats["seconds"],
+                "images_per_sec": stats["images_per_sec"],
+            })
+    return records
+
+
+def benchmark_startup(executable=None, repeat=3):
+    """Tempo de abertura do editor, medido lançando um processo novo a cada repetição.
+
+    Sem executable, mede python main.py; com ele, o executável gerado por main.spec. O
+    editor grava os tempos de cada fase (ver startup.py) e fecha; o total vai do
+    lançamento do processo até o fim e inclui a partida do interpretador e, no executável
+    de arquivo único, a extração dos arquivos, que o editor não consegue medir sozinho.
+    """
+    command = [executable] if executable else [sys.executable, os.path.join(os.path.dirname(__file__), "main.py")]
+    totals = []
+    reports = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        report_path = os.path.join(temp_dir, "abertura.json")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run(command + ["--startup-report", report_path], check=True, timeout=300)
+            totals.append(time.perf_counter() - start)
+            with open(report_path, encoding="utf-8") as file:
+                reports.append(json.load(file))
+
+    phases = {phase: statistics.median(report["phases"][phase] for report in reports)
+              for phase in reports[0]["phases"]}
+    return [{
+        "image": None,
+        "stage": "startup",
+        "option": "executável" if executable else "fonte",
+        "seconds_min": min(totals),
+        "seconds_median": statistics.median(totals),
+        # Tempo fora das fases: partida do interpretador (e extração, no executável de arquivo único)
+        # e encerramento do processo
+        "outside_phases_median": statistics.median(total - report["phases"]["warm"]
+                                                  for total, report in zip(totals, reports)),
+        "phases_median": phases,
+        "modules": reports[0]["modules"],
+    }]
+
+
+def environment():
+    """Informações da máquina e das bibliotecas, para comparar execuções"""
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        revision = ""
+    return {
+        "revision": revision,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv.__version__,
+    }
+
+
+def peak_rss_bytes():
+    """Pico de memória residente do processo (inclui o que o OpenCV aloca internamente)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB; macOS, em bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def compare(old_path, new_path):
+    """Mostra a razão entre os tempos de dois arquivos de resultado"""
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+
+    def index(results):
+        return {(r.get("image"), r["stage"], r.get("option"), r.get("workers")): r for r in results["results"]}
+
+    old_index, new_index = index(old), index(new)
+    print(f"{'imagem':<18} {'etapa':<24} {'opção':<30} {'antes':>9} {'depois':>9} {'razão':>7}")
+    for key, new_record in new_index.items():
+        old_record = old_index.get(key)
+        if old_record is None:
+            continue
+        field = "seconds" if new_record["stage"] == "batch" else "seconds_min"
+        before, after = old_record[field], new_record[field]
+        ratio = before / after if after else float("inf")
+        image, stage, option, workers = key
+        option = f"{option} x{workers}" if workers else option
+        print(f"{str(image):<18} {stage:<24} {str(option):<30} {before:>9.4f} {after:>9.4f} {ratio:>6.2f}x")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Benchmark das etapas do pipeline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="lados das imagens sintéticas (padrão: %(default)s)")
+    parser.add_argument("--bit-depths", type=int, nargs="+", choices=(8, 16), default=DEFAULT_BIT_DEPTHS,
+                        help="profundidades de bits das imagens sintéticas (padrão: %(default)s)")
+    parser.add_argument("--samples", default=None, help="pasta com imagens reais para incluir no benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="repetições de cada medida (padrão: %(default)s)")
+    parser.add_argument("--median-radii", type=int, nargs="*", default=DEFAULT_MEDIAN_RADII,
+                        help="raios da mediana comparados com filters.median (padrão: %(default)s); "
+                             "sem valores, não compara")
+    parser.add_argument("--workers", type=int, nargs="*", default=None,
+                        help="números de processos para medir a vazão do lote (padrão: 1, 2, 4... até o "
+                             "número de núcleos); sem valores, não mede")
+    parser.add_argument("--batch-images", type=int, default=16,
+                        help="imagens no lote usado para medir a vazão (padrão: %(default)s)")
+    parser.add_argument("--output", default="benchmark.json", help="arquivo JSON de saída (padrão: %(default)s)")
+    parser.add_argument("--startup", nargs="?", const="", default=None, metavar="EXECUTAVEL",
+                        help="mede só o tempo de abertura do editor, de python main.py ou do executável "
+                             "informado")
+    parser.add_argument("--compare", nargs=2, metavar=("ANTES", "DEPOIS"),
+                        help="compara dois arquivos de resultado em vez de medir")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    if args.startup is not None:
+        return main_startup(args)
+
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        images = []
+        for size in args.sizes:
+            for bit_depth in args.bit_depths:
+                path = os.path.join(temp_dir, f"sintetica_{size}_{bit_depth}bits.png")
+                cv.imwrite(path, synthetic_image(size, bit_depth))
+                images.append((path, f"{size}px/{bit_depth}bits", bit_depth))
+        if args.samples:
+            images += [(path, os.path.basename(path), 8) for path in pipeline.list_images(args.samples)]
+
+        for path, label, bit_depth in images:
+            print(f"Medindo {label}...", file=sys.stderr)
+            results += benchmark_image(path, label, args.repeat, bit_depth=bit_depth)
+            results += benchmark_median_radii(path, label, args.median_radii, args.repeat, bit_depth)
+
+        if args.workers is None:
+            cpu_count = os.cpu_count() or 1
+            worker_counts = sorted({min(2 ** i, cpu_count) for i in range(cpu_count.bit_length() + 1)})
+        else:
+            worker_counts = args.workers
+        if worker_counts:
+            print("Medindo a vazão do lote...", file=sys.stderr)
+            size = args.sizes[0]
+            batch = []
+            for i in range(args.batch_images):
+                path = os.path.join(temp_dir, f"lote_{i}.png")
+                cv.imwrite(path, synthetic_image(size, 8, seed=i))
+                batch.append(path)
+            results += benchmark_scaling(batch, worker_counts)
+
+    report = {"environment": environment(), "peak_rss_bytes": peak_rss_bytes(), "results": results}
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    for r in results:
+        if r["stage"] == "batch":
+            print(f"lote {r['option']:<30} {r['workers']:>3} processos  {r['images_per_sec']:8.2f} imagens/s")
+        else:
+            print(f"{r['image']:<18} {r['stage']:<24} {str(r['option']):<30} {r['seconds_min'] * 1000:9.1f} ms "
+                  f"{r['peak_bytes'] / 1024 ** 2:9.1f} MB")
+    print(f"Resultados gravados em {args.output}")
+    return 0
+
+
+def main_startup(args):
+    results = benchmark_startup(args.startup or None, args.repeat)
+    report = {"environment": environment(), "results": results}
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    for r in results:
+        phases = ", ".join(f"{phase} {seconds:.3f} s" for phase, seconds in r["phases_median"].items())
+        print(f"abertura ({r['option']}): total {r['seconds_median']:.3f} s (mínimo {r['seconds_min']:.3f} s), "
+              f"fora das fases {r['outside_phases_median']:.3f} s; fases: {phases}")
+        print(f"módulos carregados ao exibir a janela: {', '.join(r['modules'].get('shown', []))}")
+    print(f"Resultados gravados em {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""Cache em disco dos resultados das etapas do pipeline.
+
+Cada resultado é um arquivo .npy cujo nome é o hash do conteúdo da imagem de entrada,
+da etapa (índice do filtro ou da equalização) e dos parâmetros usados. Arquivos são
+removidos do mais antigo para o mais novo (LRU, pela data de modificação, atualizada
+a cada acerto) quando o tamanho total passa do limite.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+import uuid
+
+import numpy as np
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def default_cache_dir():
+    """Pasta de cache do usuário, conforme o sistema operacional"""
+    if sys.platform == 'win32':
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "editor-de-imagens", "resultados")
+
+
+def file_digest(path):
+    """Hash do conteúdo de um arquivo, lido em blocos"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_key(*parts):
+    """Combina as partes (strings, números, dicionários) em uma chave estável"""
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=20).hexdigest()
+
+
+class ResultCache:
+    """Cache de arrays numpy em disco com limite de tamanho e remoção LRU"""
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Evita recalcular o hash de arquivos que não mudaram desde a última consulta
+        self._source_keys = {}
+        # Ocupação em bytes; contada só quando é preciso (ver _current_size), porque listar
+        # um cache com milhares de arquivos atrasaria a abertura do editor
+        self._size = None
+
+    def source_key(self, image_path):
+        """Chave do conteúdo de uma imagem de entrada"""
+        stat = os.stat(image_path)
+        memo_key = (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
+        key = self._source_keys.get(memo_key)
+        if key is None:
+            key = file_digest(image_path)
+            self._source_keys[memo_key] = key
+        return key
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def get(self, key):
+        """Devolve o array guardado para a chave, ou None"""
+        path = self._path(key)
+        try:
+            array = np.load(path)
+            # Atualiza a data de modificação, que define a ordem de remoção
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return array
+
+    def put(self, key, array):
+        """Guarda o array; a escrita é atômica, então leitores nunca veem arquivos pela metade"""
+        path = self._path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            # Sobrescrever uma chave troca o arquivo: o tamanho do anterior sai da conta
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(temp_path, "wb") as file:
+                np.save(file, array)
+            os.replace(temp_path, path)
+        except OSError:
+            # Cache cheio ou sem permissão não deve interromper o processamento
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        with self._lock:
+            if self._size is None:
+                # A contagem a partir da pasta já inclui o arquivo novo
+                self._current_size()
+            else:
+                self._size += os.path.getsize(path) - old_size
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def get_or_compute(self, key, compute):
+        """Devolve o resultado em cache ou calcula com compute() e guarda"""
+        array = self.get(key)
+        if array is None:
+            array = compute()
+            self.put(key, array)
+        return array
+
+    def _current_size(self):
+        # Chamado com self._lock
+        if self._size is None:
+            self._size = sum(size for _, _, size in self._entries())
+        return self._size
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, entry.path, stat.st_size))
+        return entries
+
+    def evict(self):
+        """Remove os resultados usados há mais tempo até o cache caber no limite"""
+        with self._lock:
+            # Outros processos podem escrever na mesma pasta, então o tamanho é recontado
+            entries = sorted(self._entries())
+            size = sum(entry_size for _, _, entry_size in entries)
+            for _, path, entry_size in entries:
+                if size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                size -= entry_size
+            self._size = size
+
+    def clear(self):
+        with self._lock:
+            for _, path, _ in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._size = 0
+
+    def stats(self):
+        """Contadores de acertos e faltas e ocupação atual do cache"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "bytes": self._current_size(),
+                    "max_bytes": self.max_bytes}
@@ -0,0 +1,301 @@
+"""Implementações próprias dos filtros de redução de ruído, em escala de cinza.
+
+Substituem as versões das bibliotecas quando estas exigem conversões de tipo ou de
+número de canais que não fazem sentido para imagens em escala de cinza.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2 as cv
+import numpy as np
+import pywt
+
+"""Metade da vizinhança de 8 pixels; o fluxo entre dois vizinhos é calculado uma vez só"""
+_HALF_NEIGHBORS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+"""Maior passo (alfa) da difusão em que cada pixel continua uma média ponderada dos vizinhos"""
+MAX_ANISO_ALPHA = 0.125
+
+"""Erro máximo, em níveis de cinza por iteração, aceito para tratar a difusão como linear"""
+_LINEAR_TOLERANCE = 0.05
+
+"""Threads das FFTs; -1 usa todos os núcleos (os processos do lote usam 1, ver pipeline._init_worker)"""
+fft_workers = -1
+
+"""Filtros de Wiener no domínio da frequência já calculados, por (forma, PSF, balance), do uso mais
+antigo para o mais recente; o total é limitado em bytes porque imagens grandes têm filtros grandes"""
+_WIENER_CACHE_BYTES = 256 * 1024 ** 2
+_wiener_filters = OrderedDict()
+_wiener_lock = threading.Lock()
+
+"""Quantil 75% da normal padrão, para estimar o desvio do ruído pela mediana dos coeficientes"""
+_GAUSSIAN_Q75 = 0.6744897501960817
+
+"""Abaixo deste número de pixels a wavelet roda em uma thread só; o custo das threads não compensa"""
+_WAVELET_PARALLEL_PIXELS = 1024 ** 2
+
+
+def _conduction(K):
+    """g(d) para todas as diferenças absolutas entre pixels uint8, como tabela do cv.LUT"""
+    d = np.arange(256, dtype=np.float64)
+    # Mesma função do cv.ximgproc.anisotropicDiffusion, com a diferença normalizada por 255
+    return np.exp(-(d / (255 * K)) ** 2).astype(np.float32).reshape(1, 256)
+
+
+def median(img, radius):
+    """Mediana com janela quadrada de lado 2 * radius + 1 e borda replicada, em uint8 ou uint16.
+
+    Em uint8 o cv.medianBlur usa um histograma deslizante para janelas maiores que 5x5, com
+    custo que não cresce com o raio; em uint16 ele só aceita janelas de até 5x5 e as maiores
+    ficam com o scipy.ndimage.
+    """
+    size = 2 * radius + 1
+    if img.dtype == np.uint8 or size <= 5:
+        return cv.medianBlur(img, size)
+    from scipy import ndimage
+    return ndimage.median_filter(img, size=size, mode="nearest")
+
+
+def anisotropic_diffusion(img, alpha=0.05, K=70, niters=5):
+    """Difusão anisotrópica de Perona-Malik em uma imagem uint8 ou uint16 de um canal.
+
+    Cada iteração soma ao pixel alpha * g(d) * d para os 8 vizinhos, com
+    g(d) = exp(-(d / MK)^2), em que M é o maior valor do tipo (255 em uint8), repetindo a
+    borda da imagem e arredondando para o tipo da entrada ao final da iteração, como
+    cv.ximgproc.anisotropicDiffusion faz em BGR. Com alpha acima de MAX_ANISO_ALPHA a
+    difusão oscila; os valores fora da faixa do tipo são saturados.
+    """
+    if K <= 0:
+        raise ValueError("K deve ser maior que zero")
+    maxval = np.iinfo(img.dtype).max
+    # Em uint8 g(d) vem de uma tabela de 256 entradas; em uint16 é calculado a cada iteração
+    conduction = _conduction(K) if img.dtype == np.uint8 else None
+
+    if 8 * alpha * maxval * (1 - np.exp(-1 / K ** 2)) < _LINEAR_TOLERANCE:
+        # Com K grande, g(d) é praticamente 1 e a difusão vira uma convolução 3x3 por iteração;
+        # só muda o desempate do arredondamento em valores terminados em exatamente 0,5
+        kernel = np.full((3, 3), alpha, dtype=np.float32)
+        kernel[1, 1] = 1 - 8 * alpha
+        for _ in range(niters):
+            img = cv.filter2D(img, -1, kernel, borderType=cv.BORDER_REPLICATE)
+        return img
+
+    height, width = img.shape[0] + 2, img.shape[1] + 2
+    total = np.empty((height, width), dtype=np.float32)
+    for _ in range(niters):
+        padded = cv.copyMakeBorder(img, 1, 1, 1, 1, cv.BORDER_REPLICATE)
+        padded_float = padded.astype(np.float32)
+        total.fill(0)
+        for dy, dx in _HALF_NEIGHBORS:
+            first = (slice(0, height - dy), slice(max(0, -dx), width - max(dx, 0)))
+            second = (slice(dy, height), slice(max(dx, 0), width + min(dx, 0)))
+            # O fluxo de second para first é o mesmo, com sinal trocado, de first para second
+            diff = cv.subtract(padded_float[second], padded_float[first])
+            if conduction is not None:
+                weight = cv.LUT(cv.absdiff(padded[second], padded[first]), conduction)
+            else:
+                weight = cv.exp(cv.multiply(diff, diff, scale=-1 / (maxval * K) ** 2))
+            flux = cv.multiply(diff, weight)
+            total_first, total_second = total[first], total[second]
+            cv.add(total_first, flux, dst=total_first)
+            cv.subtract(total_second, flux, dst=total_second)
+        result = cv.scaleAdd(total[1:-1, 1:-1], alpha, padded_float[1:-1, 1:-1])
+        if conduction is not None and alpha <= MAX_ANISO_ALPHA:
+            # convertScaleAbs arredonda e satura para uint8; com alpha <= 1/8 os valores nunca ficam negativos
+            img = cv.convertScaleAbs(result)
+        elif conduction is not None:
+            np.rint(result, out=result)
+            img = np.clip(result, 0, maxval, out=result).astype(np.uint8)
+        else:
+            np.rint(result, out=result)
+            img = np.clip(result, 0, maxval, out=result).astype(np.uint16)
+    return img
+
+
+def warm_up():
+    """Carrega os módulos que os filtros só importam no primeiro uso.
+
+    O scipy.fft leva uns 200 ms para carregar e só o filtro de Wiener precisa dele; a
+    interface chama esta função em segundo plano depois que a janela aparece.
+    """
+    from scipy import fft  # noqa: F401
+
+
+def _transfer_function(impulse_response, shape):
+    """FFT real da resposta ao impulso, centrada na origem, no tamanho da imagem (como uft.ir2tf)"""
+    # Importado aqui para não atrasar a abertura do editor (ver warm_up)
+    from scipy import fft
+    padded = np.zeros(shape, dtype=np.float64)
+    padded[:impulse_response.shape[0], :impulse_response.shape[1]] = impulse_response
+    padded = np.roll(padded, (-(impulse_response.shape[0] // 2), -(impulse_response.shape[1] // 2)), axis=(0, 1))
+    return fft.rfft2(padded)
+
+
+def wiener_filter(shape, psf_size, balance):
+    """Filtro de Wiener-Hunt no domínio da frequência para imagens de tamanho shape.
+
+    É o mesmo de restoration.wiener com PSF média psf_size x psf_size e regularização
+    laplaciana: conj(H) / (|H|^2 + balance * |L|^2). O resultado é guardado, então um
+    lote de imagens (ou blocos) do mesmo tamanho calcula o filtro uma vez só.
+    """
+    key = (tuple(shape), psf_size, balance)
+    with _wiener_lock:
+        transfer = _wiener_filters.get(key)
+        if transfer is not None:
+            _wiener_filters.move_to_end(key)
+            return transfer
+
+    psf = np.full((psf_size, psf_size), 1 / psf_size ** 2)
+    laplacian = np.array([[0, -1, 0], [-1, 4, -1], [0, -1, 0]], dtype=np.float64)
+    psf_tf = _transfer_function(psf, shape)
+    reg_tf = _transfer_function(laplacian, shape)
+    transfer = (np.conj(psf_tf) / (np.abs(psf_tf) ** 2 + balance * np.abs(reg_tf) ** 2)).astype(np.complex64)
+
+    with _wiener_lock:
+        _wiener_filters[key] = transfer
+        total = sum(array.nbytes for array in _wiener_filters.values())
+        while total > _WIENER_CACHE_BYTES and len(_wiener_filters) > 1:
+            _, removed = _wiener_filters.popitem(last=False)
+            total -= removed.nbytes
+    return transfer
+
+
+def wiener(images, psf_size=5, balance=0.1):
+    """Deconvolução de Wiener de uma imagem float32 ou de uma pilha (N, altura, largura).
+
+    Todas as imagens da pilha têm o mesmo tamanho e passam por uma única FFT real.
+    """
+    from scipy import fft
+    shape = images.shape[-2:]
+    transfer = wiener_filter(shape, psf_size, balance)
+    spectrum = fft.rfft2(images, workers=fft_workers)
+    spectrum *= transfer
+    return fft.irfft2(spectrum, s=shape, workers=fft_workers, overwrite_x=True)
+
+
+def _parallel(func, count, workers):
+    if workers == 1 or count == 1:
+        for i in range(count):
+            func(i)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(func, range(count)))
+
+
+def _stripes(length, count):
+    bounds = np.linspace(0, length, count + 1).astype(int)
+    return [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def _dwt_axis(data, wavelet, axis, workers):
+    """DWT de um nível ao longo de axis; as linhas (ou colunas) são divididas entre as threads"""
+    length = pywt.dwt_coeff_len(data.shape[axis], wavelet.dec_len, "symmetric")
+    shape = (length, data.shape[1]) if axis == 0 else (data.shape[0], length)
+    approx, detail = np.empty(shape, data.dtype), np.empty(shape, data.dtype)
+    stripes = _stripes(data.shape[1 - axis], workers)
+
+    def run(i):
+        region = (slice(None), stripes[i]) if axis == 0 else (stripes[i], slice(None))
+        approx[region], detail[region] = pywt.dwt(data[region], wavelet, mode="symmetric", axis=axis)
+
+    _parallel(run, len(stripes), workers)
+    return approx, detail
+
+
+def _idwt_axis(approx, detail, wavelet, axis, workers):
+    """Inversa de _dwt_axis"""
+    length = 2 * approx.shape[axis] - wavelet.rec_len + 2
+    shape = (length, approx.shape[1]) if axis == 0 else (approx.shape[0], length)
+    out = np.empty(shape, approx.dtype)
+    stripes = _stripes(approx.shape[1 - axis], workers)
+
+    def run(i):
+        region = (slice(None), stripes[i]) if axis == 0 else (stripes[i], slice(None))
+        out[region] = pywt.idwt(approx[region], detail[region], wavelet, mode="symmetric", axis=axis)
+
+    _parallel(run, len(stripes), workers)
+    return out
+
+
+def _dwt2(data, wavelet, workers):
+    # Transformada separável: primeiro as colunas, depois as linhas, como pywt.dwt2
+    low, high = _dwt_axis(data, wavelet, 0, workers)
+    approx, detail_h = _dwt_axis(low, wavelet, 1, workers)
+    detail_v, detail_d = _dwt_axis(high, wavelet, 1, workers)
+    return approx, [detail_h, detail_v, detail_d]
+
+
+def _idwt2(approx, details, wavelet, workers):
+    detail_h, detail_v, detail_d = details
+    # Em tamanhos ímpares a aproximação do nível seguinte tem uma amostra a mais (como em pywt.waverec2)
+    approx = approx[:detail_h.shape[0], :detail_h.shape[1]]
+    low = _idwt_axis(approx, detail_h, wavelet, 1, workers)
+    high = _idwt_axis(detail_v, detail_d, wavelet, 1, workers)
+    return _idwt_axis(low, high, wavelet, 0, workers)
+
+
+def wavelet_levels(shape, wavelet):
+    """Níveis de decomposição padrão: três a menos que o máximo possível, como no scikit-image"""
+    return max(pywt.dwt_max_level(min(shape), pywt.Wavelet(wavelet).dec_len) - 3, 1)
+
+
+def estimate_sigma(img, wavelet="db1"):
+    """Desvio padrão do ruído pela mediana dos coeficientes diagonais do nível mais fino"""
+    wavelet = pywt.Wavelet(wavelet)
+    _, (_, _, detail_d) = _dwt2(np.asarray(img, dtype=np.float32), wavelet, 1)
+    detail_d = np.abs(detail_d[detail_d != 0])
+    return float(np.median(detail_d) / _GAUSSIAN_Q75) if detail_d.size else 0.0
+
+
+def _soft_threshold(coeffs, threshold):
+    # Encolhe os coeficientes em direção a zero sem alocar outro array do tamanho da sub-banda
+    magnitude = np.abs(coeffs)
+    magnitude -= threshold
+    np.maximum(magnitude, 0, out=magnitude)
+    np.copysign(magnitude, coeffs, out=coeffs)
+
+
+def wavelet(img, wavelet="db1", levels=None, method="BayesShrink", sigma=None, workers=None):
+    """Redução de ruído por limiarização suave dos coeficientes wavelet, em float32.
+
+    Mesmo algoritmo de restoration.denoise_wavelet (BayesShrink ou VisuShrink, ruído
+    estimado no nível mais fino quando sigma é None), com os coeficientes limiarizados
+    no próprio lugar e as transformadas divididas em faixas entre workers threads.
+    Passar sigma permite reaproveitar a mesma estimativa em um lote inteiro.
+    """
+    img = np.asarray(img, dtype=np.float32)
+    name = wavelet
+    wavelet = pywt.Wavelet(name)
+    levels = levels or wavelet_levels(img.shape, name)
+    if workers is None or img.size < _WAVELET_PARALLEL_PIXELS:
+        workers = 1 if img.size < _WAVELET_PARALLEL_PIXELS else os.cpu_count() or 1
+
+    approx = img
+    details = []
+    for _ in range(levels):
+        approx, level_details = _dwt2(approx, wavelet, workers)
+        details.append(level_details)
+
+    if sigma is None:
+        finest = details[0][2]
+        finest = np.abs(finest[finest != 0])
+        sigma = float(np.median(finest) / _GAUSSIAN_Q75) if finest.size else 0.0
+
+    subbands = [coeffs for level_details in details for coeffs in level_details]
+    if method == "VisuShrink":
+        thresholds = [sigma * np.sqrt(2 * np.log(img.size))] * len(subbands)
+    elif method == "BayesShrink":
+        var = sigma ** 2
+        eps = np.finfo(np.float32).eps
+        # Variância de cada sub-banda (média zero) sem criar o array coeffs * coeffs
+        thresholds = [var / np.sqrt(max(np.vdot(c.ravel(), c.ravel()) / c.size - var, eps)) for c in subbands]
+    else:
+        raise ValueError(f"Método de limiarização desconhecido: {method}")
+
+    _parallel(lambda i: _soft_threshold(subbands[i], thresholds[i]), len(subbands), workers)
+
+    for level_details in reversed(details):
+        approx = _idwt2(approx, level_details, wavelet, workers)
+    return approx[:img.shape[0], :img.shape[1]]
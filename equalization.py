@@ -0,0 +1,117 @@
+"""Implementações próprias das técnicas de ajuste de contraste, para imagens uint8 e uint16.
+
+Para imagens uint8 a equalização de histograma é só uma tabela (LUT) de 256 entradas,
+aplicada com cv.LUT em uma passada; em uint16 a tabela tem 65536 entradas e é aplicada
+por indexação. A tabela pode vir do histograma da própria imagem ou de um histograma
+somado sobre uma série inteira de imagens. O CLAHE reaproveita os objetos do OpenCV e,
+em imagens grandes, divide as linhas de blocos entre threads.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2 as cv
+import numpy as np
+
+
+"""cv.calcHist conta em float32, exato só até 2^24; imagens maiores são contadas em faixas"""
+_HIST_EXACT_PIXELS = 2 ** 24
+
+"""Abaixo deste número de pixels o CLAHE roda em uma chamada só; dividir não compensa"""
+_CLAHE_PARALLEL_PIXELS = 1024 ** 2
+
+"""Objetos CLAHE por thread: o mesmo objeto não pode ser usado por duas threads ao mesmo tempo"""
+_clahe_local = threading.local()
+
+
+def levels(img):
+    """Número de níveis de cinza do tipo da imagem: 256 em uint8, 65536 em uint16"""
+    return np.iinfo(img.dtype).max + 1
+
+
+def histogram(img):
+    """Histograma de uma imagem uint8 (256 posições) ou uint16 (65536), com contagens exatas em int64"""
+    rows = max(_HIST_EXACT_PIXELS // max(img.shape[1], 1), 1)
+    size = levels(img)
+    hist = np.zeros(size, dtype=np.int64)
+    for top in range(0, img.shape[0], rows):
+        band = np.ascontiguousarray(img[top:top + rows])
+        hist += cv.calcHist([band], [0], None, [size], [0, size]).ravel().astype(np.int64)
+    return hist
+
+
+def equalization_lut(hist):
+    """Tabela da equalização de histograma: o valor v vai para a CDF(v) escalada para [0, N - 1].
+
+    N é o número de posições do histograma; a tabela é uint8 com 256 posições e uint16 com
+    65536. Em uint8 dá o mesmo resultado de exposure.equalize_hist seguido da conversão
+    para uint8 (truncando, em float32), que é o que o pipeline fazia antes.
+    """
+    size = len(hist)
+    dtype = np.uint8 if size <= 256 else np.uint16
+    cdf = np.cumsum(hist, dtype=np.float64)
+    if cdf[-1] == 0:
+        return np.arange(size, dtype=dtype)
+    cdf /= cdf[-1]
+    return np.multiply(cdf, size - 1, dtype=np.float32).astype(dtype)
+
+
+def apply_lut(img, lut):
+    """Aplica uma tabela do mesmo tipo da imagem: cv.LUT em uint8, indexação em uint16"""
+    if img.dtype == np.uint8:
+        return cv.LUT(img, lut)
+    return lut[img]
+
+
+def equalize_hist(img, lut=None):
+    """Equaliza uma imagem uint8 ou uint16 com a tabela informada ou com a do seu próprio histograma"""
+    if lut is None:
+        lut = equalization_lut(histogram(img))
+    return apply_lut(img, np.asarray(lut, dtype=img.dtype))
+
+
+def clahe_instance(clip_limit, tiles_x, tiles_y):
+    """Objeto CLAHE com a configuração pedida, criado uma vez por thread e reaproveitado"""
+    instances = getattr(_clahe_local, "instances", None)
+    if instances is None:
+        instances = _clahe_local.instances = {}
+    key = (clip_limit, tiles_x, tiles_y)
+    instance = instances.get(key)
+    if instance is None:
+        instance = instances[key] = cv.createCLAHE(clipLimit=clip_limit, tileGridSize=(tiles_x, tiles_y))
+    return instance
+
+
+def clahe(img, clip_limit=2.0, tile_grid=8, workers=None):
+    """CLAHE de uma imagem uint8 ou uint16 com tile_grid x tile_grid blocos.
+
+    Em imagens grandes, as linhas de blocos são divididas em faixas processadas em
+    paralelo. Cada faixa leva uma linha de blocos a mais acima e abaixo, de onde vêm as
+    tabelas que a interpolação usa perto das bordas da faixa, e só o seu interior é
+    copiado para a saída. O resultado é o mesmo da imagem inteira, a não ser por
+    arredondamentos dos pesos da interpolação (no máximo 1 nível, em raros pixels).
+    """
+    workers = workers or os.cpu_count() or 1
+    bands = min(workers, tile_grid)
+    if bands < 2 or img.size < _CLAHE_PARALLEL_PIXELS:
+        return clahe_instance(clip_limit, tile_grid, tile_grid).apply(img)
+
+    # O OpenCV completa a imagem até um múltiplo do número de blocos com BORDER_REFLECT_101;
+    # completando aqui do mesmo jeito, todas as faixas têm blocos do mesmo tamanho da imagem inteira
+    height, width = img.shape
+    tile_height, tile_width = -(-height // tile_grid), -(-width // tile_grid)
+    padded = cv.copyMakeBorder(img, 0, tile_height * tile_grid - height, 0, tile_width * tile_grid - width,
+                               cv.BORDER_REFLECT_101)
+    out = np.empty_like(padded)
+    bounds = np.linspace(0, tile_grid, bands + 1).astype(int)
+
+    def run(band):
+        first, last = bounds[band], bounds[band + 1]
+        top, bottom = max(first - 1, 0), min(last + 1, tile_grid)
+        result = clahe_instance(clip_limit, tile_grid, bottom - top).apply(
+            padded[top * tile_height:bottom * tile_height])
+        out[first * tile_height:last * tile_height] = result[(first - top) * tile_height:(last - top) * tile_height]
+
+    with ThreadPoolExecutor(max_workers=bands) as executor:
+        list(executor.map(run, range(bands)))
+    return out[:height, :width]
@@ -0,0 +1,258 @@
+"""Pipeline declarativo: uma lista ordenada de etapas, que pode ser salva como preset.
+
+Cada etapa é um dicionário com o nome ("stage") e as suas opções, por exemplo
+
+    [{"stage": "denoise", "filter": "median", "median_radius": 2},
+     {"stage": "contrast", "factor": 1.5},
+     {"stage": "equalize", "method": "clahe"}]
+
+Opções que uma etapa não informa vêm dos parâmetros gerais (pipeline.DEFAULT_PARAMS).
+Entre as etapas a imagem é sempre um array uint8 (ou uint16, com keep_16bit) em tons de
+cinza, sem conversões para PIL ou Qt. Etapas pontuais vizinhas (equalização de histograma,
+contraste, brilho, gama) viram uma única tabela de 256 (ou 65536) valores, aplicada em uma
+passada (ver equalization.apply_lut): cada tabela depende só do histograma da sua entrada,
+e o histograma depois de uma tabela é calculado a partir do anterior, sem ler a imagem de
+novo.
+
+Contorno, suavização, contraste e brilho reproduzem ImageFilter.CONTOUR, ImageFilter.SMOOTH
+e ImageEnhance dos protótipos de testes-iniciais (nos filtros, a borda de 1 pixel é
+replicada em vez de copiada da entrada).
+"""
+import json
+import time
+
+import cv2 as cv
+import numpy as np
+
+import equalization
+import pipeline
+import profiling
+from cache import make_key
+
+"""Núcleos 3x3 dos filtros do Pillow usados nos protótipos: (núcleo, divisor, deslocamento)"""
+_CONTOUR = (np.array([[-1, -1, -1], [-1, 8, -1], [-1, -1, -1]], dtype=np.float32), 1, 255)
+_SMOOTH = (np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], dtype=np.float32), 13, 0)
+
+
+def _lut_dtype(levels):
+    return np.uint8 if levels <= 256 else np.uint16
+
+
+def _kernel(spec):
+    kernel, scale, offset = spec
+    # O deslocamento está em níveis de 8 bits; em uint16 é escalado para a mesma fração do máximo
+    return lambda img: cv.filter2D(img, -1, kernel / scale, delta=offset * np.iinfo(img.dtype).max / 255,
+                                   borderType=cv.BORDER_REPLICATE)
+
+
+def _blend(base, factor, levels):
+    # Mesma conta do Image.blend do Pillow, em float32: base + fator * (valor - base), truncado
+    values = np.arange(levels, dtype=np.float32)
+    return np.clip(np.float32(base) + np.float32(factor) * (values - np.float32(base)), 0,
+                   levels - 1).astype(_lut_dtype(levels))
+
+
+def _mean(hist):
+    return int(np.dot(hist, np.arange(len(hist))) / max(hist.sum(), 1) + 0.5)
+
+
+def _denoise(options):
+    filtro_index = pipeline.FILTROS.index(options["filter"])
+
+    def step(img):
+        return pipeline.to_depth(pipeline.apply_denoise(img, filtro_index, options), img.dtype)
+    return "image", step, ("filter",) + pipeline.DENOISE_PARAMS.get(filtro_index, ())
+
+
+def _equalize(options):
+    if options["method"] == "hist":
+        # A tabela vem do histograma da entrada desta etapa, não do da imagem original
+        return "lut", equalization.equalization_lut, ("method",)
+    equalizacao_index = pipeline.EQUALIZACOES.index(options["method"])
+
+    def step(img):
+        return pipeline.to_depth(pipeline.apply_equalization(img, equalizacao_index, options), img.dtype)
+    return "image", step, ("method",) + pipeline.EQUALIZATION_PARAMS.get(equalizacao_index, ())
+
+
+def _contrast(options):
+    # ImageEnhance.Contrast: mistura com um cinza uniforme na média da imagem
+    return "lut", lambda hist: _blend(_mean(hist), options["factor"], len(hist)), ("factor",)
+
+
+def _brightness(options):
+    # ImageEnhance.Brightness: mistura com preto
+    return "lut", lambda hist: _blend(0, options["factor"], len(hist)), ("factor",)
+
+
+def _gamma(options):
+    def lut(hist):
+        top = len(hist) - 1
+        values = np.arange(len(hist), dtype=np.float32)
+        return np.clip(np.rint(top * (values / top) ** options["gamma"]), 0, top).astype(_lut_dtype(len(hist)))
+    return "lut", lut, ("gamma",)
+
+
+def _contour(options):
+    return "image", _kernel(_CONTOUR), ()
+
+
+def _smooth(options):
+    return "image", _kernel(_SMOOTH), ()
+
+
+"""Etapas disponíveis: construtor e opções próprias com os valores padrão.
+
+O construtor recebe as opções já completas e devolve (tipo, função, opções usadas), em
+que tipo é "image" (função da imagem) ou "lut" (função do histograma da entrada que
+devolve uma tabela com uma posição por nível: 256 em uint8, 65536 em uint16)."""
+STAGES = {
+    "denoise": (_denoise, {"filter": pipeline.FILTROS[0]}),
+    "equalize": (_equalize, {"method": pipeline.EQUALIZACOES[0]}),
+    "contrast": (_contrast, {"factor": 1.5}),
+    "brightness": (_brightness, {"factor": 1.2}),
+    "gamma": (_gamma, {"gamma": 1.0}),
+    "contour": (_contour, {}),
+    "smooth": (_smooth, {}),
+}
+
+
+def validate(stages):
+    """Confere a lista de etapas; levanta ValueError com a etapa problemática"""
+    if not isinstance(stages, list) or not stages:
+        raise ValueError("O preset precisa de uma lista com pelo menos uma etapa")
+    for position, stage in enumerate(stages, 1):
+        name = stage.get("stage") if isinstance(stage, dict) else None
+        if name not in STAGES:
+            raise ValueError(f"Etapa {position}: {name!r} não existe (opções: {', '.join(STAGES)})")
+        if name == "denoise" and stage.get("filter", STAGES[name][1]["filter"]) not in pipeline.FILTROS:
+            raise ValueError(f"Etapa {position}: filtro {stage['filter']!r} não existe")
+        if name == "equalize" and stage.get("method", STAGES[name][1]["method"]) not in pipeline.EQUALIZACOES:
+            raise ValueError(f"Etapa {position}: equalização {stage['method']!r} não existe")
+    return stages
+
+
+def stages_for(filtro_index, equalizacao_index):
+    """As duas etapas fixas do editor (filtro e equalização) como lista de etapas"""
+    return [{"stage": "denoise", "filter": pipeline.FILTROS[filtro_index]},
+            {"stage": "equalize", "method": pipeline.EQUALIZACOES[equalizacao_index]}]
+
+
+def load_preset(path):
+    """Lê um preset salvo por save_preset e devolve a lista de etapas"""
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+    return validate(data.get("stages") if isinstance(data, dict) else data)
+
+
+def save_preset(path, stages, name=None):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"name": name, "stages": validate(stages)}, file, ensure_ascii=False, indent=2)
+
+
+def plan(stages, params=None):
+    """Agrupa as etapas em passos: etapas "image" sozinhas e sequências de etapas "lut" juntas.
+
+    Devolve uma lista de passos (rótulo, tipo, funções, descrição para a chave).
+    """
+    params = pipeline.resolve_params(params)
+    steps = []
+    for stage in validate(stages):
+        build, defaults = STAGES[stage["stage"]]
+        options = {**params, **defaults, **stage}
+        kind, func, names = build(options)
+        description = (stage["stage"], {name: options[name] for name in names})
+        if kind == "lut" and steps and steps[-1][1] == "lut":
+            label, _, funcs, descriptions = steps[-1]
+            steps[-1] = (f"{label}+{stage['stage']}", kind, funcs + [func], descriptions + [description])
+        else:
+            steps.append((stage["stage"], kind, [func], [description]))
+    return steps
+
+
+def fused_lut(funcs, hist):
+    """Compõe as tabelas de uma sequência de etapas pontuais a partir do histograma da entrada"""
+    levels = len(hist)
+    lut = np.arange(levels, dtype=_lut_dtype(levels))
+    hist = np.asarray(hist, dtype=np.int64)
+    for func in funcs:
+        step_lut = np.asarray(func(hist), dtype=lut.dtype)
+        lut = step_lut[lut]
+        # Histograma da saída desta etapa: cada nível v leva as suas contagens para step_lut[v]
+        hist = np.bincount(step_lut, weights=hist, minlength=levels).astype(np.int64)
+    return lut
+
+
+def _run_step(step, img):
+    label, kind, funcs, _ = step
+    # Prefixo para não somar com as etapas internas de mesmo nome (pipeline.apply_denoise, por exemplo)
+    with profiling.stage("graph:" + label):
+        if kind == "lut":
+            return equalization.apply_lut(img, fused_lut(funcs, equalization.histogram(img)))
+        return funcs[0](img)
+
+
+def step_keys(source, steps):
+    """Chave de cada passo: a do passo anterior mais a descrição das suas etapas"""
+    keys = []
+    key = source
+    for _, _, _, descriptions in steps:
+        key = make_key(pipeline.CACHE_VERSION, key, "graph", descriptions)
+        keys.append(key)
+    return keys
+
+
+def run(load, stages, params=None, memo=None, item=None, source=None, use_cache=True, report=None):
+    """Executa as etapas e devolve (saída do penúltimo passo, saída final), no tipo da entrada.
+
+    load() lê a imagem de entrada e só é chamada se algum passo precisar ser calculado.
+    Cada passo é procurado no memo e no cache em disco pela sua chave, a partir do fim:
+    mudar só as últimas etapas reaproveita o resultado das anteriores. Só os dois
+    últimos passos, os exibidos, ficam no memo; os demais ficam só no cache em disco.
+    Com report (uma lista), cada passo calculado acrescenta rótulo, tempo e PSNR entre a
+    sua entrada e a sua saída, como os protótipos mostravam para os filtros.
+    """
+    params = pipeline.resolve_params(params)
+    steps = plan(stages, params)
+    # A mesma imagem lida em 8 ou em 16 bits dá resultados diferentes
+    keys = step_keys(make_key(source if source is not None else item, params["keep_16bit"]), steps)
+    results = {}
+
+    def result_at(index):
+        index = max(index, -1)
+        if index in results:
+            return results[index]
+        if index < 0:
+            results[index] = load()
+            return results[index]
+        keep = memo if index >= len(steps) - 2 else None
+        computed = []
+
+        def compute():
+            img = result_at(index - 1)
+            start = time.perf_counter()
+            result = _run_step(steps[index], img)
+            computed.append((time.perf_counter() - start, img, result))
+            return result
+
+        results[index] = pipeline._run_stage(keep, item, ("graph", index), keys[index], compute, use_cache)
+        if report is not None and computed:
+            seconds, img, result = computed[0]
+            psnr = (cv.PSNR(img, result, np.iinfo(img.dtype).max)
+                    if img.shape == result.shape and img.dtype == result.dtype else None)
+            report.append({"step": steps[index][0], "seconds": seconds, "psnr": psnr})
+        return results[index]
+
+    final = result_at(len(steps) - 1)
+    return result_at(len(steps) - 2), final
+
+
+def describe(report):
+    """Resumo do relatório de run(), uma etapa por trecho"""
+    parts = []
+    for entry in report:
+        text = f"{entry['step']} {entry['seconds'] * 1000:.1f} ms"
+        if entry["psnr"] is not None:
+            text += f" (PSNR {entry['psnr']:.2f} dB)"
+        parts.append(text)
+    return ", ".join(parts)
@@ -1,15 +1,27 @@
 import os
 import sys
-import cv2 as cv
-import numpy as np
-from PySide6.QtGui import QPixmap, QImage, Qt
-from PySide6.QtWidgets import QApplication, QMainWindow, QFileDialog
+import time
+# Primeiro import: o tempo de abertura é medido a partir daqui (ver startup.py)
+import startup
+from PySide6.QtGui import QPixmap, Qt
+from PySide6.QtCore import QRect, QSize, QThreadPool, QTimer
+from PySide6.QtWidgets import (QApplication, QMainWindow, QFileDialog, QProgressBar, QPushButton, QCheckBox,
+                               QLabel, QSpinBox, QMenu)
 from ui_main_window import Ui_mainWindow
-import cv2.ximgproc as xip
-from skimage import io, restoration, filters, exposure
+import pipeline
+from workers import BatchProcessor, FolderMonitor, ProxySignals, ProxyTask, SaveProcessor, WarmUpTask
+from params_dialog import ParamsDialog
+from thumbnails import THUMBNAIL_SIZE, ThumbnailLoader
+import preview
+import saving
+import watch
+import graph
+import profiling
 from PySide6.QtGui import QStandardItemModel, QStandardItem
 from PySide6.QtGui import QIcon
 
+startup.mark("imports")
+
 if sys.platform == 'win32':
     import ctypes
     myappid = "editor.de.imagens.final"
@@ -39,153 +51,573 @@ class ImageEditor(QMainWindow):
         self.filtered_images = {}
         self.equalized_images = {}
 
+        """Imagem exibida na pré-visualização e sua versão reduzida (proxy)"""
+        self.preview_path = None
+        self.proxy = None
+
+        """Leitura da imagem reduzida em segundo plano: (caminho, tipo) pedido e ainda não recebido"""
+        self.proxy_request = None
+        self.proxy_signals = ProxySignals()
+        self.proxy_signals.loaded.connect(self.on_proxy_loaded)
+        self.proxy_signals.failed.connect(self.on_proxy_failed)
+
+        """Itens da lista de imagens por caminho, para receber as miniaturas carregadas em segundo plano"""
+        self.image_items = {}
+        self.thumbnails = ThumbnailLoader(parent=self)
+        self.thumbnails.loaded.connect(self.on_thumbnail_loaded)
+        self.ui.imageList.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        # Todos os itens têm a mesma altura; a lista não precisa medir cada um em seleções grandes
+        self.ui.imageList.setUniformItemSizes(True)
+
+        """Configuração (filtro, equalização) das imagens em resolução completa em memória"""
+        self.rendered_settings = None
+
+        """Parâmetros dos filtros e das equalizações, ajustados na janela de parâmetros"""
+        self.params = pipeline.resolve_params()
+
+        """Último resultado de cada etapa por imagem; trocar só a equalização não refaz o filtro"""
+        self.stage_memo = pipeline.StageMemo()
+
+        """Lote em processamento e gravação em andamento, ambos em segundo plano"""
+        self.batch = None
+        self.saver = None
+
+        """Pasta monitorada: imagens novas são processadas e salvas assim que chegam"""
+        self.monitor = None
+
+        """Cache em disco dos resultados de cada etapa, compartilhado entre execuções"""
+        pipeline.configure_cache()
+
+        """Barra de progresso e botão de cancelar na barra de status"""
+        self.progressBar = QProgressBar()
+        self.progressBar.setMaximumWidth(200)
+        self.progressBar.hide()
+        self.cancelButton = QPushButton("Cancelar")
+        self.cancelButton.hide()
+        self.ui.statusbar.addPermanentWidget(self.progressBar)
+        self.ui.statusbar.addPermanentWidget(self.cancelButton)
+
+        """Modo streaming: salva cada imagem assim que fica pronta, mantendo poucas em memória"""
+        self.streamCheck = QCheckBox("Salvar durante o processamento", self.ui.centralwidget)
+        self.streamCheck.setGeometry(QRect(790, 494, 250, 25))
+        self.streamCheck.setFont(self.ui.applyButton.font())
+        self.inFlightLabel = QLabel("Imagens em memória:", self.ui.centralwidget)
+        self.inFlightLabel.setGeometry(QRect(790, 530, 150, 25))
+        self.inFlightLabel.setFont(self.ui.applyButton.font())
+        self.inFlightSpin = QSpinBox(self.ui.centralwidget)
+        self.inFlightSpin.setGeometry(QRect(940, 530, 60, 25))
+        self.inFlightSpin.setRange(1, 256)
+        self.inFlightSpin.setValue(2 * os.cpu_count() if os.cpu_count() else 4)
+
+        """Botão que abre a janela de parâmetros dos filtros"""
+        self.paramsButton = QPushButton("Parâmetros...", self.ui.centralwidget)
+        self.paramsButton.setGeometry(QRect(950, 400, 120, 23))
+        self.paramsButton.setFont(self.ui.applyButton.font())
+
+        """Botão que liga e desliga o monitoramento de uma pasta"""
+        self.watchButton = QPushButton("Monitorar pasta...", self.ui.centralwidget)
+        self.watchButton.setGeometry(QRect(950, 437, 120, 23))
+        self.watchButton.setFont(self.ui.applyButton.font())
+
+        """Presets: lista de etapas salva em JSON, usada no lugar do filtro e da equalização"""
+        self.preset_name = None
+        self.presetButton = QPushButton("Preset...", self.ui.centralwidget)
+        self.presetButton.setGeometry(QRect(950, 466, 120, 23))
+        self.presetButton.setFont(self.ui.applyButton.font())
+        presetMenu = QMenu(self.presetButton)
+        presetMenu.addAction("Carregar preset...", self.load_preset)
+        presetMenu.addAction("Salvar como preset...", self.save_preset)
+        presetMenu.addAction("Usar filtro e equalização", self.clear_preset)
+        self.presetButton.setMenu(presetMenu)
+
+        """Medição do tempo e da memória de cada etapa (ver profiling.py)"""
+        self.profiler = None
+        self.profileCheck = QCheckBox("Medir etapas", self.ui.centralwidget)
+        self.profileCheck.setGeometry(QRect(375, 494, 150, 25))
+        self.profileCheck.setFont(self.ui.applyButton.font())
+        self.exportProfileButton = QPushButton("Exportar medições...", self.ui.centralwidget)
+        self.exportProfileButton.setGeometry(QRect(375, 530, 150, 25))
+        self.exportProfileButton.setFont(self.ui.applyButton.font())
+        self.exportProfileButton.setEnabled(False)
+
         """Conexão dos botões às funções"""
         self.ui.selectButton.clicked.connect(self.select_images)
         self.ui.applyButton.clicked.connect(self.apply_filters)
         self.ui.saveButton.clicked.connect(self.save_images)
-        self.ui.imageList.clicked.connect(self.preview_original)
+        self.ui.imageList.clicked.connect(self.on_image_clicked)
+        self.cancelButton.clicked.connect(self.cancel_processing)
+        self.paramsButton.clicked.connect(self.edit_params)
+        self.watchButton.clicked.connect(self.toggle_watch)
+        self.profileCheck.toggled.connect(self.toggle_profiling)
+        self.exportProfileButton.clicked.connect(self.export_profile)
+
+        """Trocar o filtro ou a equalização atualiza só a pré-visualização reduzida"""
+        self.ui.filterBox.currentIndexChanged.connect(self.update_preview)
+        self.ui.equalizationBox.currentIndexChanged.connect(self.update_preview)
 
     def select_images(self):
         """Abre uma janela para selecionar imagens"""
-        files, _ = QFileDialog.getOpenFileNames(self, "Selecionar Imagens", "", "Imagens (*.png *.jpg *.jpeg)")
+        files, _ = QFileDialog.getOpenFileNames(self, "Selecionar Imagens", "",
+                                                "Imagens (*.png *.jpg *.jpeg *.tif *.tiff)")
 
         if files:
             self.selected_images = files
-
-            # Criar um modelo para o QListView
+            self.preview_path = files[0]
+            self.proxy = None
+            self.stage_memo.clear()
+            self.filtered_images = {}
+            self.equalized_images = {}
+            self.rendered_settings = None
+
+            # Criar um modelo para o QListView; o nome aparece na lista e o caminho completo na dica
             model = QStandardItemModel()
-
+            self.image_items = {}
             for file in files:
-                item = QStandardItem(file)
-                model.appendRow(item)
+                item = QStandardItem(os.path.basename(file))
+                item.setData(file, Qt.ItemDataRole.UserRole)
+                item.setToolTip(file)
+                item.setEditable(False)
+                self.image_items[file] = item
+            model.invisibleRootItem().appendRows(list(self.image_items.values()))
 
             # Definir o modelo no QListView
             self.ui.imageList.setModel(model)
 
+            # As miniaturas chegam aos poucos por on_thumbnail_loaded
+            self.thumbnails.load(files)
+
             # Atualiza a visualização da primeira imagem
             self.preview_original()
+            self.update_preview()
+
+    def current_settings(self):
+        """Filtro e equalização escolhidos no momento"""
+        return self.ui.filterBox.currentIndex(), self.ui.equalizationBox.currentIndex()
+
+    def update_preview(self):
+        """Aplica a configuração escolhida à versão reduzida da imagem de pré-visualização"""
+        if not self.preview_path:
+            return
+
+        if self.proxy is None:
+            # A imagem reduzida é carregada uma vez e reaproveitada a cada troca de opção
+            self.load_proxy()
+            return
+
+        start = time.perf_counter()
+        report = []
+        filtered, equalized = pipeline.process_proxy(self.proxy, *self.current_settings(), params=self.params,
+                                                     memo=self.stage_memo, item=("proxy", self.preview_path),
+                                                     report=report)
+        self.show_processed(filtered, equalized)
+
+        elapsed = time.perf_counter() - start
+        message = f"Pré-visualização em resolução reduzida ({elapsed:.2f} s). " \
+                  f"Use \"Aplicar configuração\" para processar em resolução completa"
+        if self.preset_name:
+            message = f"Preset {self.preset_name}: {graph.describe(report) or 'sem mudanças'}. " + message
+        elif report:
+            # Filtro automático: o filtro escolhido e o tempo da escolha
+            message = f"{graph.describe(report)}. " + message
+        self.ui.statusbar.showMessage(message, 5000)
+
+    def load_proxy(self):
+        """Lê a imagem reduzida no QThreadPool; on_proxy_loaded atualiza a pré-visualização"""
+        request = (self.preview_path, pipeline.working_dtype(self.params))
+        if request == self.proxy_request:
+            return
+        self.proxy_request = request
+        # Prioridade maior: passa na frente das imagens do lote que ainda esperam na fila
+        QThreadPool.globalInstance().start(ProxyTask(self.proxy_signals, *request), 1)
+        self.ui.statusbar.showMessage("Carregando a pré-visualização...")
+
+    def on_proxy_loaded(self, image_path, proxy):
+        """Guarda a imagem reduzida, se ainda for a da pré-visualização, e aplica a configuração atual"""
+        if self.proxy is not None or (image_path, proxy.dtype) != (self.preview_path,
+                                                                    pipeline.working_dtype(self.params)):
+            return
+        self.proxy_request = None
+        self.proxy = proxy
+        self.update_preview()
+
+    def on_proxy_failed(self, image_path, message):
+        """Arquivo ilegível ou corrompido: a mensagem vai para a barra de status"""
+        if image_path != self.preview_path:
+            return
+        self.proxy_request = None
+        self.ui.statusbar.showMessage(f"Erro em {os.path.basename(image_path)}: {message}", 5000)
+
+    def load_preset(self):
+        """Carrega uma lista de etapas salva; ela substitui o filtro e a equalização escolhidos"""
+        path, _ = QFileDialog.getOpenFileName(self, "Carregar preset", "", "Presets (*.json)")
+        if not path:
+            return
+        try:
+            stages = graph.load_preset(path)
+        except (OSError, ValueError) as exc:
+            self.ui.statusbar.showMessage(f"Preset inválido: {exc}", 5000)
+            return
+        self.set_stages(stages, os.path.splitext(os.path.basename(path))[0])
+
+    def save_preset(self):
+        """Salva as etapas em uso (ou o filtro e a equalização escolhidos) como preset"""
+        path, _ = QFileDialog.getSaveFileName(self, "Salvar preset", "", "Presets (*.json)")
+        if not path:
+            return
+        stages = self.params["stages"] or graph.stages_for(*self.current_settings())
+        name = os.path.splitext(os.path.basename(path))[0]
+        try:
+            graph.save_preset(path, stages, name)
+        except OSError as exc:
+            self.ui.statusbar.showMessage(f"Não foi possível salvar o preset: {exc}", 5000)
+            return
+        self.ui.statusbar.showMessage(f"Preset salvo em {path}", 3000)
+
+    def clear_preset(self):
+        """Volta a usar o filtro e a equalização escolhidos nas caixas"""
+        if self.params["stages"]:
+            self.set_stages(None, None)
+
+    def set_stages(self, stages, name):
+        self.params = dict(self.params, stages=stages)
+        self.preset_name = name
+        self.presetButton.setText(f"Preset: {name}" if name else "Preset...")
+        # Com um preset as caixas de filtro e equalização não têm efeito
+        self.ui.filterBox.setEnabled(stages is None)
+        self.ui.equalizationBox.setEnabled(stages is None)
+        self.rendered_settings = None
+        self.update_preview()
+
+    def edit_params(self):
+        """Abre a janela de parâmetros; ao confirmar, atualiza a pré-visualização com os novos valores"""
+        dialog = ParamsDialog(self.params, self)
+        if not dialog.exec() or dialog.params() == self.params:
+            return
+        params = dialog.params()
+        changed = {name for name in params if params[name] != self.params[name]}
+        self.params = params
+        if changed <= set(saving.SAVE_PARAMS):
+            # Só a gravação mudou: as imagens em memória e a pré-visualização continuam valendo
+            return
+        if "keep_16bit" in changed:
+            # A imagem reduzida precisa ser lida de novo no outro tipo
+            self.proxy = None
+        # Os resultados em resolução completa em memória usam os parâmetros anteriores
+        self.rendered_settings = None
+        self.update_preview()
 
     def apply_filters(self):
-        """Aplica o filtro e a equalização escolhidos pelo usuário"""
+        """Aplica o filtro e a equalização escolhidos pelo usuário em resolução completa"""
         if not self.selected_images:
             self.ui.statusbar.showMessage("Nenhuma imagem selecionada", 3000)
             return
 
-        filtro_index = self.ui.filterBox.currentIndex()
-        equalizacao_index = self.ui.equalizationBox.currentIndex()
+        out_dir = None
+        if self.streamCheck.isChecked():
+            out_dir = QFileDialog.getExistingDirectory(self, "Selecione o local para salvar as imagens")
+            if not out_dir:
+                return
+
+        self.start_batch(out_dir)
+
+    def start_batch(self, out_dir=None):
+        """Inicia o processamento em resolução completa; com out_dir, cada imagem é salva ao ficar pronta"""
+        filtro_index, equalizacao_index = self.current_settings()
+
+        # O processamento roda no QThreadPool; cada imagem concluída chega por on_image_processed
+        # No modo streaming nada fica em memória, então os resultados das etapas não são guardados
+        try:
+            batch = BatchProcessor(self.selected_images, filtro_index, equalizacao_index, params=self.params,
+                                   out_dir=out_dir,
+                                   memo=None if out_dir else self.stage_memo,
+                                   preview_path=self.preview_path,
+                                   max_in_flight=self.inFlightSpin.value(), parent=self)
+        except ValueError as exc:
+            # Duas imagens seriam gravadas no mesmo arquivo (ver saving.check_outputs)
+            self.ui.statusbar.showMessage(str(exc), 10000)
+            return
+        self.batch = batch
 
         self.filtered_images = {}
         self.equalized_images = {}
+        self.rendered_settings = None if out_dir else (filtro_index, equalizacao_index)
+        if self.profileCheck.isChecked():
+            # Cada lote começa uma medição nova
+            self.profiler = profiling.start()
+
+        self.batch.result.connect(self.on_image_processed)
+        self.batch.progress.connect(self.on_batch_progress)
+        self.batch.finished.connect(self.on_batch_finished)
+
+        self.ui.applyButton.setEnabled(False)
+        self.ui.saveButton.setEnabled(False)
+        self.progressBar.setRange(0, len(self.selected_images))
+        self.progressBar.setValue(0)
+        self.progressBar.show()
+        self.cancelButton.setEnabled(True)
+        self.cancelButton.show()
+        self.ui.statusbar.showMessage("Processando imagens...")
+
+        self.batch.start()
+
+    def on_image_processed(self, image_path, filtered, equalized):
+        """Guarda o resultado de uma imagem e atualiza a pré-visualização assim que possível"""
+        if filtered is None:
+            # Modo streaming: a imagem já foi salva e não fica em memória
+            return
+        first_result = not self.filtered_images
+        self.filtered_images[image_path] = filtered
+        self.equalized_images[image_path] = equalized
 
-        for image_path in self.selected_images:
-            img = io.imread(image_path, as_gray=True)
-
-            # Aplicando o filtro escolhido
-            if filtro_index == 0:
-                filtered = restoration.denoise_wavelet(img, channel_axis=None)
-            elif filtro_index == 1:
-                filtered = restoration.wiener(img, np.ones((5, 5)) / 25, balance=0.1)
-            elif filtro_index == 2:
-                filtered = filters.median(img)
-            elif filtro_index == 3:
-                # Esse filtro exige imagem BGR uint8, então converte a imagem grayscale para BGR
-                img_bgr = cv.cvtColor((img * 255).astype(np.uint8), cv.COLOR_GRAY2BGR)
-                # Aplica difusão anisotrópica diretamente em BGR uint8
-                filtered_bgr = xip.anisotropicDiffusion(img_bgr, alpha=0.05, K=70, niters=5)
-                # Converte o resultado BGR de volta para escala de cinza
-                filtered = cv.cvtColor(filtered_bgr, cv.COLOR_BGR2GRAY)
-                # Converte para float32 em escala [0, 1] para manter compatibilidade com equalização
-                filtered = filtered.astype(np.float32) / 255.0
-            else:
-                filtered = img  # Sem filtro
-
-            # Aplicando a equalização escolhida
-            if equalizacao_index == 0:
-                equalized = exposure.equalize_hist(filtered)
-            elif equalizacao_index == 1:
-                clahe = cv.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-                equalized = clahe.apply((filtered * 255).astype(np.uint8))
-            else:
-                equalized = filtered  # Sem equalização
+        # Se o usuário já trocou de opção ou de parâmetros, a pré-visualização reduzida da nova opção é mantida
+        if ((self.batch.filtro_index, self.batch.equalizacao_index) != self.current_settings()
+                or self.batch.params != self.params):
+            return
 
-            # Convertendo para formato correto antes de salvar
-            self.filtered_images[image_path] = (filtered * 255).astype(np.uint8)
-            self.equalized_images[image_path] = (equalized * 255).astype(np.uint8)
+        # Mostra a primeira imagem concluída e troca pela imagem de pré-visualização quando ela ficar pronta
+        if first_result or image_path == self.preview_path:
+            self.preview_processed_images(image_path)
+
+    def on_batch_progress(self, done, total, images_per_sec):
+        """Atualiza a barra de status com o progresso e a vazão do lote"""
+        self.progressBar.setValue(done)
+        self.ui.statusbar.showMessage(f"Processando: {done}/{total} imagens ({images_per_sec:.2f} imagens/s)")
+
+    def on_batch_finished(self, stats):
+        """Restaura os controles e mostra o resumo do lote"""
+        self.progressBar.hide()
+        self.cancelButton.hide()
+        self.ui.applyButton.setEnabled(True)
+        self.ui.saveButton.setEnabled(True)
+
+        message = f"{stats['images']} imagens processadas em {stats['seconds']:.1f} s " \
+                  f"({stats['images_per_sec']:.2f} imagens/s)"
+        if stats["out_dir"]:
+            # As imagens já foram salvas; a de pré-visualização não precisa continuar em memória
+            self.filtered_images = {}
+            self.equalized_images = {}
+            message += f" e salvas em {stats['out_dir']}"
+        if stats["cancelled"] or stats["failed"]:
+            # Resultados incompletos não servem para salvar direto da memória
+            self.rendered_settings = None
+        if stats["cancelled"]:
+            message = "Processamento cancelado: " + message
+        if stats["failed"]:
+            message += f", {len(stats['failed'])} com erro"
+        if stats["image_seconds"]:
+            seconds = stats["image_seconds"].values()
+            message += f", {sum(seconds) / len(seconds):.2f} s por imagem"
+        if stats["bytes_written"]:
+            message += f", {stats['bytes_written'] / 1024 ** 2:.1f} MB gravados"
+        if stats["cache_hits"] or stats["cache_misses"]:
+            message += f" - cache: {stats['cache_hits']} acertos, {stats['cache_misses']} faltas"
+        self.ui.statusbar.showMessage(message + self.profile_message(), 5000)
+
+    def toggle_profiling(self, checked):
+        """Liga ou desliga a medição das etapas; as medições feitas continuam disponíveis para exportar"""
+        if checked:
+            self.profiler = profiling.start()
+        else:
+            profiling.stop()
+        self.exportProfileButton.setEnabled(self.profiler is not None)
+
+    def profile_message(self):
+        """Resumo das etapas medidas, para acrescentar à mensagem de fim do lote"""
+        if not self.profileCheck.isChecked() or self.profiler is None:
+            return ""
+        return " - etapas: " + profiling.describe(self.profiler.summary())
+
+    def export_profile(self):
+        """Grava as medições em JSON ou como trace do Chrome (chrome://tracing ou ui.perfetto.dev)"""
+        json_filter, trace_filter = "Relatório JSON (*.json)", "Trace do Chrome (*.json)"
+        path, selected_filter = QFileDialog.getSaveFileName(self, "Exportar medições", "medicoes.json",
+                                                            f"{json_filter};;{trace_filter}")
+        if not path:
+            return
+        try:
+            if selected_filter == trace_filter:
+                self.profiler.write_chrome_trace(path)
+            else:
+                self.profiler.write_json(path)
+        except OSError as exc:
+            self.ui.statusbar.showMessage(f"Não foi possível exportar as medições: {exc}", 5000)
+            return
+        self.ui.statusbar.showMessage(f"Medições exportadas para {path}", 3000)
 
-        # Chama a função de exibição
-        self.preview_processed_images()
+    def toggle_watch(self):
+        """Começa a monitorar uma pasta com a configuração atual ou para o monitoramento em andamento"""
+        if self.monitor is not None and self.monitor.running:
+            self.monitor.stop()
+            self.watchButton.setText("Monitorar pasta...")
+            return
 
-    def preview_original(self):
-        """Exibe a primeira imagem original na label imgOriginal redimensionada para visualização"""
-        if self.selected_images:
-            img_path = self.selected_images[0]
-            pixmap = QPixmap(img_path)
+        in_dir = QFileDialog.getExistingDirectory(self, "Selecione a pasta a monitorar")
+        if not in_dir:
+            return
+        out_dir = QFileDialog.getExistingDirectory(self, "Selecione o local para salvar as imagens")
+        if not out_dir:
+            return
 
-            # Redimensiona a imagem apenas para exibição, mantendo a proporção
-            max_size = 250
-            pixmap = pixmap.scaled(max_size, max_size, Qt.AspectRatioMode.KeepAspectRatio,
-                                   Qt.TransformationMode.SmoothTransformation)
+        try:
+            self.monitor = FolderMonitor(in_dir, out_dir, *self.current_settings(), params=self.params,
+                                         max_in_flight=self.inFlightSpin.value(), parent=self)
+        except ValueError as exc:
+            self.ui.statusbar.showMessage(str(exc), 5000)
+            return
+        self.monitor.status.connect(self.on_watch_status)
+        self.monitor.image_failed.connect(self.on_watch_failed)
+        self.watchButton.setText("Parar monitoramento")
+        self.monitor.start()
+
+    def on_watch_status(self, snapshot):
+        """Mostra a fila e as latências da pasta monitorada na barra de status"""
+        if self.monitor is not None and self.monitor.running:
+            self.ui.statusbar.showMessage(f"Monitorando {self.monitor.in_dir} - " + watch.describe(snapshot))
+        else:
+            self.ui.statusbar.showMessage("Monitoramento parado - " + watch.describe(snapshot), 5000)
+
+    def on_watch_failed(self, image_path, message):
+        self.ui.statusbar.showMessage(f"Erro em {os.path.basename(image_path)}: {message}", 5000)
+
+    def cancel_processing(self):
+        """Cancela as imagens do lote (ou da gravação) que ainda não começaram"""
+        for task in (self.batch, self.saver):
+            if task is not None and task.running:
+                task.cancel()
+                self.cancelButton.setEnabled(False)
+                self.ui.statusbar.showMessage("Cancelando...")
+
+    def on_thumbnail_loaded(self, image_path, image):
+        """Coloca a miniatura carregada em segundo plano no item da lista"""
+        item = self.image_items.get(image_path)
+        if item is not None:
+            item.setIcon(QIcon(QPixmap.fromImage(image)))
+
+    def on_image_clicked(self, index):
+        """Troca a imagem de pré-visualização pela imagem clicada na lista"""
+        image_path = index.data(Qt.ItemDataRole.UserRole)
+        if not image_path or image_path == self.preview_path:
+            return
+        self.preview_path = image_path
+        self.proxy = None
+        self.preview_original()
 
-            self.ui.imgOriginal.setPixmap(pixmap)
-            self.ui.imgOriginal.setScaledContents(True)
+        # Com o resultado em resolução completa em memória para a configuração atual, mostra ele
+        if self.rendered_settings == self.current_settings() and image_path in self.equalized_images:
+            self.preview_processed_images(image_path)
+        else:
+            self.update_preview()
 
-    def preview_processed_images(self):
-        """Exibe as imagens filtradas e equalizadas"""
+    def preview_original(self):
+        """Exibe a imagem original na label imgOriginal redimensionada para visualização"""
+        if self.preview_path:
+            # Lê a imagem já reduzida ao tamanho de exibição, mantendo a proporção
+            try:
+                preview.show_file(self.ui.imgOriginal, self.preview_path)
+            except (OSError, ValueError) as exc:
+                self.ui.statusbar.showMessage(str(exc), 5000)
+
+    def preview_processed_images(self, image_path=None):
+        """Exibe as imagens filtradas e equalizadas (por padrão, as da imagem de pré-visualização)"""
         if not self.filtered_images:
             return
 
-        # Obtém a primeira imagem processada
-        first_image_path = self.selected_images[0]
-        
-        filtered_image = self.filtered_images.get(first_image_path)        
-        if filtered_image is None:
-            return
-        # Criando QImage para QLabel - FILTRADA
-        height, width = filtered_image.shape
-        bytes_per_line = width
-        q_image_filtered = QImage(filtered_image.data, width, height, bytes_per_line, QImage.Format.Format_Grayscale8)
-
-        # Criar um QPixmap e redimensionar para exibição - FILTRADA
-        pixmap_filtered = QPixmap.fromImage(q_image_filtered).scaled(250, 250, Qt.AspectRatioMode.KeepAspectRatio,
-                                                                     Qt.TransformationMode.SmoothTransformation)
-        # Atualizar QLabel de imgFiltrada
-        self.ui.imgFiltrada.setPixmap(pixmap_filtered)
-        self.ui.imgFiltrada.setScaledContents(True)
+        # Obtém a imagem processada
+        first_image_path = image_path or self.preview_path
 
-        
+        filtered_image = self.filtered_images.get(first_image_path)
         equalized_image = self.equalized_images.get(first_image_path)
-        if equalized_image is None:
+        if filtered_image is None or equalized_image is None:
             return
-        # Criando QImage para QLabel - EQUALIZADA
-        height, width = equalized_image.shape
-        bytes_per_line = width
-        q_image_equalized = QImage(equalized_image.data, width, height, bytes_per_line, QImage.Format.Format_Grayscale8)
+        self.show_processed(filtered_image, equalized_image)
 
-        # Criar um QPixmap e redimensionar para exibição - EQUALIZADA
-        pixmap_equalized = QPixmap.fromImage(q_image_equalized).scaled(250, 250, Qt.AspectRatioMode.KeepAspectRatio,
-                                                                       Qt.TransformationMode.SmoothTransformation)
-        # Atualizar QLabel de imgEqualizada
-        self.ui.imgEqualizada.setPixmap(pixmap_equalized)
-        self.ui.imgEqualizada.setScaledContents(True)
+    def show_processed(self, filtered_image, equalized_image):
+        """Exibe um par de imagens filtrada e equalizada (uint8 ou uint16) nas labels de pré-visualização"""
+        # Cada imagem é reduzida a 250 px antes de virar QPixmap; nada em resolução completa passa ao Qt
+        preview.show(self.ui.imgFiltrada, filtered_image)
+        preview.show(self.ui.imgEqualizada, equalized_image)
 
     def save_images(self):
         """Salva as imagens com filtros e equalização"""
-        if not self.filtered_images:
-            self.ui.statusbar.showMessage("Nenhuma imagem processada para salvar", 3000)
+        if not self.selected_images:
+            self.ui.statusbar.showMessage("Nenhuma imagem selecionada", 3000)
             return
 
         save_dir = QFileDialog.getExistingDirectory(self, "Selecione o local para salvar as imagens")
-        if save_dir:
-            for image_path, processed_image in self.equalized_images.items():
-                output_path = f"{save_dir}/{image_path.split('/')[-1]}"
-                cv.imwrite(output_path, processed_image)
+        if not save_dir:
+            return
 
-            self.ui.statusbar.showMessage("Imagens salvas com sucesso!", 3000)
+        if self.rendered_settings != self.current_settings() or not self.equalized_images:
+            # Ainda não há resultado em resolução completa para a configuração atual:
+            # processa agora, salvando cada imagem assim que fica pronta
+            self.start_batch(out_dir=save_dir)
+            return
 
+        # A codificação e a escrita rodam no QThreadPool; a janela continua respondendo
+        try:
+            self.saver = SaveProcessor(self.equalized_images, save_dir, params=self.params, parent=self)
+        except ValueError as exc:
+            self.ui.statusbar.showMessage(str(exc), 10000)
+            return
+        self.saver.progress.connect(self.on_save_progress)
+        self.saver.finished.connect(self.on_save_finished)
+
+        self.ui.applyButton.setEnabled(False)
+        self.ui.saveButton.setEnabled(False)
+        self.progressBar.setRange(0, self.saver.total)
+        self.progressBar.setValue(0)
+        self.progressBar.show()
+        self.cancelButton.setEnabled(True)
+        self.cancelButton.show()
+        self.ui.statusbar.showMessage("Salvando imagens...")
+
+        self.saver.start()
+
+    def on_save_progress(self, done, total, megabytes_per_sec):
+        """Atualiza a barra de status com o progresso da gravação"""
+        self.progressBar.setValue(done)
+        self.ui.statusbar.showMessage(f"Salvando: {done}/{total} imagens ({megabytes_per_sec:.1f} MB/s)")
+
+    def on_save_finished(self, stats):
+        """Restaura os controles e mostra o resumo da gravação"""
+        self.progressBar.hide()
+        self.cancelButton.hide()
+        self.ui.applyButton.setEnabled(True)
+        self.ui.saveButton.setEnabled(True)
+
+        megabytes = stats["bytes_written"] / 1024 ** 2
+        message = f"{stats['images']} imagens salvas em {stats['save_dir']} em {stats['seconds']:.1f} s " \
+                  f"({megabytes:.1f} MB"
+        if stats["encode_seconds"] > 0:
+            message += f", {stats['images'] / stats['encode_seconds']:.1f} imagens/s codificando"
+        message += ")"
+        if stats["cancelled"]:
+            message = "Gravação cancelada: " + message
+        if stats["failed"]:
+            message += f", {len(stats['failed'])} com erro"
+        self.ui.statusbar.showMessage(message + self.profile_message(), 5000)
+
+    def warm_up(self):
+        """Carrega em segundo plano os módulos e o cache que o primeiro processamento usaria"""
+        startup.mark("shown")
+        self.warm_up_task = WarmUpTask()
+        self.warm_up_task.signals.finished.connect(self.on_warmed_up)
+        QThreadPool.globalInstance().start(self.warm_up_task)
+
+    def on_warmed_up(self):
+        """Fim da abertura; com --startup-report, grava os tempos de cada fase e fecha o editor"""
+        startup.mark("warm")
+        report_path = startup.report_path(sys.argv)
+        if report_path:
+            startup.write_report(report_path)
+            QApplication.quit()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = ImageEditor()
+    startup.mark("window")
     window.show()
-    sys.exit(app.exec_())
+    # O aquecimento começa com a janela já exibida e o laço de eventos rodando
+    QTimer.singleShot(0, window.warm_up)
+    sys.exit(app.exec())
 
@@ -26,7 +26,9 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    # Sem UPX: as bibliotecas do Qt e do OpenCV comprimidas precisam ser descomprimidas a cada
+    # abertura, o que atrasa a partida mais do que o arquivo menor economiza na extração
+    upx=False,
     upx_exclude=[],
     runtime_tmpdir=None,
     console=False,
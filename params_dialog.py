@@ -0,0 +1,123 @@
+"""Janela para ajustar os parâmetros dos filtros, das equalizações e da gravação"""
+from PySide6.QtWidgets import (QCheckBox, QComboBox, QDialog, QDialogButtonBox, QDoubleSpinBox, QFormLayout,
+                               QGroupBox, QSpinBox, QVBoxLayout)
+
+import pipeline
+import saving
+
+"""Campos editáveis por seção: (parâmetro, rótulo, mínimo, máximo, casas decimais; 0 para inteiros),
+(parâmetro, rótulo, opções) para listas ou (parâmetro, rótulo, bool) para caixas de seleção"""
+SECTIONS = (
+    ("Wavelet", (
+        ("wavelet", "Família", pipeline.WAVELETS),
+        ("wavelet_levels", "Níveis (0 automático)", 0, 16, 0),
+        ("wavelet_method", "Limiarização", pipeline.WAVELET_METHODS),
+        ("wavelet_share_sigma", "Mesma estimativa de ruído no lote", bool),
+    )),
+    ("Filtro de Wiener", (
+        ("wiener_psf_size", "Lado da PSF (pixels)", 1, 63, 0),
+        ("wiener_balance", "Regularização (balance)", 0.001, 10, 3),
+    )),
+    ("Mediana", (
+        ("median_radius", "Raio da janela (pixels)", 1, 127, 0),
+    )),
+    ("Difusão anisotrópica", (
+        # Acima de 1/8 a soma dos 8 vizinhos passa do valor do pixel e a difusão fica instável
+        ("aniso_alpha", "Passo (alfa)", 0.001, 0.125, 3),
+        ("aniso_k", "Sensibilidade a bordas (K)", 0.01, 1000, 2),
+        ("aniso_niters", "Iterações", 1, 100, 0),
+    )),
+    ("Filtro automático", (
+        ("auto_budget", "Tempo máximo por imagem, s (0 sem limite)", 0, 3600, 1),
+    )),
+    ("Equalização de histograma", (
+        ("hist_shared", "Mesmo histograma para o lote todo", bool),
+    )),
+    ("CLAHE", (
+        ("clahe_clip_limit", "Limite de contraste", 0.1, 40, 1),
+        ("clahe_tile_grid", "Blocos por direção", 1, 64, 0),
+    )),
+    ("Imagens grandes", (
+        ("tile_size", "Lado do bloco (0 desativa)", 0, 65536, 0),
+        ("keep_16bit", "Processar e gravar em 16 bits", bool),
+    )),
+    ("Gravação", (
+        ("output_format", "Formato", saving.OUTPUT_FORMATS),
+        ("png_compression", "Compressão PNG (-1 padrão)", -1, 9, 0),
+        ("jpeg_quality", "Qualidade JPEG", 0, 100, 0),
+        ("webp_lossless", "WebP sem perdas", bool),
+        ("webp_quality", "Qualidade WebP (com perdas)", 1, 100, 0),
+        ("tiff_compression", "Compressão TIFF", tuple(saving.TIFF_COMPRESSIONS)),
+    )),
+)
+
+
+class ParamsDialog(QDialog):
+    """Mostra um campo para cada parâmetro de SECTIONS, já preenchido com os valores atuais"""
+
+    def __init__(self, params, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Parâmetros")
+        self._params = pipeline.resolve_params(params)
+        self._fields = {}
+
+        layout = QVBoxLayout(self)
+        for title, fields in SECTIONS:
+            group = QGroupBox(title, self)
+            form = QFormLayout(group)
+            for name, label, *spec in fields:
+                field = self._make_field(group, spec)
+                self._set_value(field, self._params[name])
+                form.addRow(label, field)
+                self._fields[name] = field
+            layout.addWidget(group)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel
+                                   | QDialogButtonBox.StandardButton.RestoreDefaults, self)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        buttons.button(QDialogButtonBox.StandardButton.RestoreDefaults).clicked.connect(self.restore_defaults)
+        layout.addWidget(buttons)
+
+    @staticmethod
+    def _make_field(parent, spec):
+        if spec == [bool]:
+            return QCheckBox(parent)
+        if len(spec) == 1:
+            field = QComboBox(parent)
+            field.addItems(spec[0])
+            return field
+        minimum, maximum, decimals = spec
+        if decimals:
+            field = QDoubleSpinBox(parent)
+            field.setDecimals(decimals)
+            field.setSingleStep(10 ** -decimals * 10)
+        else:
+            field = QSpinBox(parent)
+        field.setRange(minimum, maximum)
+        return field
+
+    @staticmethod
+    def _set_value(field, value):
+        if isinstance(field, QCheckBox):
+            field.setChecked(value)
+        elif isinstance(field, QComboBox):
+            field.setCurrentText(value)
+        else:
+            field.setValue(value)
+
+    @staticmethod
+    def _value(field):
+        if isinstance(field, QCheckBox):
+            return field.isChecked()
+        if isinstance(field, QComboBox):
+            return field.currentText()
+        return field.value()
+
+    def restore_defaults(self):
+        for name, field in self._fields.items():
+            self._set_value(field, pipeline.DEFAULT_PARAMS[name])
+
+    def params(self):
+        """Parâmetros com os valores escolhidos na janela"""
+        return {**self._params, **{name: self._value(field) for name, field in self._fields.items()}}
@@ -0,0 +1,951 @@
+"""Pipeline de redução de ruído e ajuste de contraste, independente da interface gráfica.
+
+Pode ser importado pelo editor (main.py) ou executado em servidores sem PySide6:
+
+    python -m pipeline pasta_entrada pasta_saida --filter wiener --equalize clahe --workers 16
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import repeat
+
+import cv2 as cv
+import numpy as np
+import pywt
+
+from cache import ResultCache, DEFAULT_MAX_BYTES, make_key
+import denoise
+import equalization
+import profiling
+import saving
+import tiff
+from tiling import process_tiled
+
+"""Nomes das opções, na mesma ordem dos itens de filterBox e equalizationBox; "auto" escolhe
+um dos outros filtros para cada imagem (ver autofilter.py)"""
+FILTROS = ("wavelet", "wiener", "median", "anisotropic", "auto")
+EQUALIZACOES = ("hist", "clahe")
+
+EXTENSOES = (".png", ".jpg", ".jpeg", ".tif", ".tiff")
+
+"""Wavelets (ortogonais) e métodos de limiarização oferecidos para o filtro wavelet"""
+WAVELETS = ("db1", "db2", "db3", "db4", "sym4", "sym8", "coif1", "coif3")
+WAVELET_METHODS = ("BayesShrink", "VisuShrink")
+
+"""Maior lado da versão reduzida usada na pré-visualização interativa"""
+PROXY_SIZE = 512
+
+"""Parâmetros dos filtros e das equalizações"""
+DEFAULT_PARAMS = {
+    "wavelet": "db1",
+    # 0 usa três níveis a menos que o máximo possível para o tamanho da imagem
+    "wavelet_levels": 0,
+    "wavelet_method": "BayesShrink",
+    # Desvio do ruído; None estima em cada imagem
+    "wavelet_sigma": None,
+    # Estima o ruído só na primeira imagem do lote e usa o mesmo valor nas demais (ver batch_params)
+    "wavelet_share_sigma": False,
+    "wiener_psf_size": 5,
+    "wiener_balance": 0.1,
+    # Janela da mediana: (2 * raio + 1) x (2 * raio + 1) pixels
+    "median_radius": 1,
+    "aniso_alpha": 0.05,
+    "aniso_k": 70.0,
+    "aniso_niters": 5,
+    # Filtro automático: candidatos, dos mais rápidos para os mais lentos, e tempo máximo por
+    # imagem em segundos, escolha incluída (0 sem limite)
+    "auto_candidates": ("median", "wavelet", "wiener", "anisotropic"),
+    "auto_budget": 5.0,
+    # Equaliza o lote todo com uma só tabela, do histograma somado das imagens filtradas (ver batch_params)
+    "hist_shared": False,
+    # Tabela (256 valores) da equalização de histograma; None usa o histograma de cada imagem
+    "hist_lut": None,
+    "clahe_clip_limit": 2.0,
+    "clahe_tile_grid": 8,
+    # Processamento em blocos: 0 desativa; imagens com lado maior que tile_size são divididas
+    "tile_size": 0,
+    # Threads usadas em uma imagem (blocos, wavelet e CLAHE); 0 usa todos os núcleos
+    "tile_workers": 0,
+    # Processa em uint16 (imagens de 16 bits sem redução para 8) e grava em 16 bits onde o formato permite
+    "keep_16bit": False,
+    # Lista de etapas (ver graph.py); None usa o filtro e a equalização escolhidos
+    "stages": None,
+    # Gravação (ver saving.py): formato de saída e opções de cada codificador
+    "output_format": "original",
+    # Nível de compressão do PNG (0 a 9); -1 usa o padrão do OpenCV, o mais rápido
+    "png_compression": -1,
+    "jpeg_quality": 95,
+    "webp_lossless": True,
+    "webp_quality": 90,
+    "tiff_compression": "lzw",
+}
+
+"""Parâmetros de que cada filtro e cada equalização dependem (entram na chave do cache)"""
+DENOISE_PARAMS = {
+    # Wavelet e Wiener usam a imagem toda, então o resultado em blocos é uma aproximação
+    0: ("wavelet", "wavelet_levels", "wavelet_method", "wavelet_sigma", "tile_size"),
+    1: ("wiener_psf_size", "wiener_balance", "tile_size"),
+    2: ("median_radius",),
+    3: ("aniso_alpha", "aniso_k", "aniso_niters"),
+}
+# O filtro automático depende dos parâmetros de todos os candidatos
+DENOISE_PARAMS[4] = tuple(dict.fromkeys(name for names in DENOISE_PARAMS.values() for name in names)) + (
+    "auto_candidates", "auto_budget")
+EQUALIZATION_PARAMS = {
+    0: ("hist_lut",),
+    1: ("clahe_clip_limit", "clahe_tile_grid"),
+}
+
+"""Muda sempre que a implementação de alguma etapa muda, invalidando o cache antigo"""
+CACHE_VERSION = 8
+
+"""Cache de resultados usado por process_image; None desativa"""
+_cache = None
+
+
+def resolve_params(params=None):
+    """Completa os parâmetros informados com os valores padrão"""
+    return {**DEFAULT_PARAMS, **(params or {})}
+
+
+def configure_cache(directory=None, max_bytes=DEFAULT_MAX_BYTES, enabled=True):
+    """Ativa (ou desativa) o cache em disco dos resultados das etapas"""
+    global _cache
+    _cache = ResultCache(directory, max_bytes) if enabled else None
+    return _cache
+
+
+def get_cache():
+    return _cache
+
+
+def warm_up():
+    """Adianta, em segundo plano, o que o primeiro processamento faria: carregar os módulos
+    que os filtros importam só quando usados (ver denoise.warm_up) e contar a ocupação do cache"""
+    denoise.warm_up()
+    if _cache is not None:
+        _cache.stats()
+
+
+# Política de tipos: as imagens circulam em uint8 (ou em uint16, com keep_16bit) e só os
+# filtros que precisam de ponto flutuante convertem para float32 em [0, 1], voltando para o
+# tipo inteiro logo em seguida
+
+
+"""Pesos de luminância (ordem BGR) do rgb2gray do scikit-image, usados desde a primeira versão"""
+GRAY_WEIGHTS = np.array([[0.0721, 0.7154, 0.2125]], dtype=np.float32)
+
+
+def working_dtype(params):
+    """Tipo das imagens no pipeline: uint16 com params["keep_16bit"], uint8 caso contrário"""
+    return np.uint16 if params["keep_16bit"] else np.uint8
+
+
+def load_image(image_path, dtype=np.uint8):
+    """Carrega a imagem em escala de cinza como uint8 ou, com dtype=np.uint16, como uint16.
+
+    Em uint8, imagens de 16 bits são reduzidas pelo OpenCV na leitura; em uint16 elas são
+    mantidas e as de 8 bits são ampliadas (v * 257). TIFFs grandes sem compressão, no tipo
+    pedido, são abertos com memmap e lidos do disco à medida que são usados (ver tiff.py).
+    """
+    if image_path.lower().endswith((".tif", ".tiff")) and os.path.getsize(image_path) >= tiff.MMAP_MIN_BYTES:
+        img = tiff.memmap(image_path)
+        if img is not None and img.dtype == dtype:
+            return img
+    flags = cv.IMREAD_ANYCOLOR | (cv.IMREAD_ANYDEPTH if dtype == np.uint16 else 0)
+    # np.fromfile + imdecode aceita caminhos com acentos no Windows, ao contrário de cv.imread
+    with profiling.stage("decode"):
+        img = cv.imdecode(np.fromfile(image_path, dtype=np.uint8), flags)
+    if img is None:
+        raise ValueError(f"Não foi possível ler a imagem {image_path}")
+    if img.ndim == 3:
+        # Imagens coloridas viram cinza direto no tipo lido, com os mesmos pesos de antes
+        weights = GRAY_WEIGHTS if img.shape[2] == 3 else np.pad(GRAY_WEIGHTS, ((0, 0), (0, img.shape[2] - 3)))
+        with profiling.stage("gray"):
+            img = cv.transform(img, weights)
+    return to_depth(img, dtype)
+
+
+def to_float32(img):
+    """Converte uma imagem uint8 ou uint16 para float32 em [0, 1]; imagens float32 são devolvidas sem cópia"""
+    if img.dtype == np.float32:
+        return img
+    with profiling.stage("float32"):
+        if img.dtype not in (np.uint8, np.uint16):
+            return img.astype(np.float32)
+        out = img.astype(np.float32)
+        out *= 1 / np.iinfo(img.dtype).max
+    return out
+
+
+def to_uint8(img):
+    """Converte uma imagem float em [0, 1] (ou uint16) para uint8; imagens uint8 são devolvidas sem cópia"""
+    if img.dtype == np.uint8:
+        return img
+    with profiling.stage("uint8"):
+        if img.dtype == np.uint16:
+            # v / 257 arredondado: 65535 vai para 255
+            return cv.convertScaleAbs(img, alpha=1 / 257)
+        # Uma única cópia em float32, escalada e limitada no próprio lugar
+        out = np.multiply(img, 255, dtype=np.float32)
+        np.clip(out, 0, 255, out=out)
+        return out.astype(np.uint8)
+
+
+def to_uint16(img):
+    """Converte uma imagem float em [0, 1] (ou uint8, como v * 257) para uint16; uint16 é devolvida sem cópia"""
+    if img.dtype == np.uint16:
+        return img
+    with profiling.stage("uint16"):
+        if img.dtype == np.uint8:
+            out = img.astype(np.uint16)
+            out *= 257
+            return out
+        out = np.multiply(img, 65535, dtype=np.float32)
+        np.clip(out, 0, 65535, out=out)
+        return out.astype(np.uint16)
+
+
+def to_depth(img, dtype):
+    """Converte para o tipo inteiro do pipeline (ver working_dtype)"""
+    return to_uint16(img) if dtype == np.uint16 else to_uint8(img)
+
+
+def _as_integer(img):
+    # Mediana, difusão e equalizações trabalham em uint8 ou uint16; float volta para uint8, como antes
+    return img if img.dtype == np.uint16 else to_uint8(img)
+
+
+def tile_wavelet_levels(params, shape):
+    """Níveis da wavelet de uma imagem de forma shape, os mesmos em todos os seus blocos"""
+    return params["wavelet_levels"] or denoise.wavelet_levels(shape[:2], params["wavelet"])
+
+
+def denoise_halo(filtro_index, params, shape):
+    """Margem, em pixels, que cada bloco de uma imagem de forma shape precisa para o filtro escolhido"""
+    if filtro_index == 0:
+        # Suporte das wavelets no nível mais grosso da decomposição da imagem inteira
+        levels = tile_wavelet_levels(params, shape)
+        return (pywt.Wavelet(params["wavelet"]).dec_len - 1) * 2 ** levels
+    elif filtro_index == 1:
+        # A resposta do filtro de Wiener decai rápido; a margem também esconde o efeito de borda da FFT
+        return 8 * params["wiener_psf_size"]
+    elif filtro_index == 2:
+        return params["median_radius"]
+    elif filtro_index == 3:
+        # Cada iteração da difusão propaga a informação por um pixel
+        return params["aniso_niters"] + 1
+    return 0
+
+
+def apply_denoise(img, filtro_index, params=None, report=None):
+    """Aplica o filtro de redução de ruído escolhido.
+
+    Com params["tile_size"] > 0, imagens maiores que o bloco são processadas em blocos
+    com margem (ver tiling.py), a não ser que a margem do filtro seja maior que o bloco, e
+    o resultado já vem em uint8 (ou uint16). O filtro "auto" escolhe o
+    filtro antes (ver autofilter.choose); report (uma lista), se informado, recebe a
+    escolha, o tempo gasto nela e o PSNR do vencedor, no formato de graph.run.
+    """
+    params = resolve_params(params)
+    tile_size = params["tile_size"]
+    with profiling.stage("denoise"):
+        if filtro_index == FILTROS.index("auto"):
+            # Importado aqui: autofilter.py importa este módulo
+            import autofilter
+            start = time.perf_counter()
+            filtro_index, scores = autofilter.choose(img, params)
+            if report is not None:
+                # Sem comparação (imagem sem ruído) não há PSNR
+                report.append({"step": "auto: " + FILTROS[filtro_index], "seconds": time.perf_counter() - start,
+                               "psnr": scores.get(FILTROS[filtro_index], {}).get("psnr")})
+        # Com a margem maior que o bloco, dividir a imagem não economizaria memória
+        if (tile_size and max(img.shape[:2]) > tile_size
+                and denoise_halo(filtro_index, params, img.shape) <= tile_size):
+            return _apply_denoise_tiled(img, filtro_index, params, tile_size)
+        return _apply_denoise(img, filtro_index, params)
+
+
+def _apply_denoise_tiled(img, filtro_index, params, tile_size):
+    tile_params = dict(params, tile_size=0)
+    if filtro_index == 0:
+        # O ruído é estimado uma vez, em um recorte central, para que todos os blocos usem o mesmo limiar
+        height, width = img.shape[:2]
+        if params["wavelet_sigma"] is None:
+            crop = img[max(height // 2 - 1024, 0):height // 2 + 1024, max(width // 2 - 1024, 0):width // 2 + 1024]
+            tile_params["wavelet_sigma"] = denoise.estimate_sigma(to_float32(crop), params["wavelet"])
+        # Os níveis vêm da imagem inteira: com os do bloco, o resultado seria outro, e não o mesmo sem emendas
+        tile_params["wavelet_levels"] = tile_wavelet_levels(params, img.shape)
+        # Os blocos já rodam em paralelo; cada um usa uma thread só
+        tile_params["tile_workers"] = 1
+
+    halo = denoise_halo(filtro_index, params, img.shape)
+    dtype = np.uint16 if img.dtype == np.uint16 else np.uint8
+    return process_tiled(img, lambda tile: to_depth(_apply_denoise(tile, filtro_index, tile_params), dtype),
+                         tile_size=tile_size, halo=halo, workers=params["tile_workers"] or None)
+
+
+def _apply_denoise(img, filtro_index, params):
+    """Aplica o filtro; wavelet e Wiener devolvem float32 em [0, 1], mediana e difusão devolvem uint8 ou uint16"""
+    if filtro_index == 0:
+        # Mesmo algoritmo de restoration.denoise_wavelet, em float32 e com as transformadas em várias threads
+        return denoise.wavelet(to_float32(img), params["wavelet"], params["wavelet_levels"] or None,
+                               params["wavelet_method"], params["wavelet_sigma"],
+                               workers=params["tile_workers"] or None)
+    elif filtro_index == 1:
+        # O filtro no domínio da frequência é reaproveitado entre imagens e blocos do mesmo tamanho
+        return denoise.wiener(to_float32(img), params["wiener_psf_size"], params["wiener_balance"])
+    elif filtro_index == 2:
+        # Mesmo resultado de filters.median com janela quadrada e borda replicada (ver denoise.median)
+        return denoise.median(_as_integer(img), params["median_radius"])
+    elif filtro_index == 3:
+        # Mesma difusão do cv.ximgproc.anisotropicDiffusion, mas em um canal só (ver denoise.py)
+        return denoise.anisotropic_diffusion(_as_integer(img), alpha=params["aniso_alpha"], K=params["aniso_k"],
+                                             niters=params["aniso_niters"])
+    return img  # Sem filtro
+
+
+def apply_equalization(filtered, equalizacao_index, params=None):
+    """Aplica a técnica de ajuste de contraste escolhida"""
+    params = resolve_params(params)
+    with profiling.stage("equalize"):
+        if equalizacao_index == 0:
+            # Uma tabela de 256 entradas (65536 em uint16); mesmo resultado de exposure.equalize_hist em uint8
+            return equalization.equalize_hist(_as_integer(filtered), params["hist_lut"])
+        elif equalizacao_index == 1:
+            # Objetos CLAHE reaproveitados por thread; imagens grandes são divididas em faixas paralelas
+            return equalization.clahe(_as_integer(filtered), params["clahe_clip_limit"],
+                                      params["clahe_tile_grid"], workers=params["tile_workers"] or None)
+    return filtered  # Sem equalização
+
+
+def filtered_histogram(image_path, filtro_index, params, memo=None):
+    """Histograma da imagem depois do filtro, a mesma entrada que a equalização recebe no lote.
+
+    O filtro passa pelo memo e pelo cache com a mesma chave de process_image, então o lote
+    reaproveita o resultado em vez de filtrar a imagem de novo. Com filtro_index None, é o
+    histograma da imagem de entrada.
+    """
+    dtype = working_dtype(params)
+    if filtro_index is None:
+        return equalization.histogram(load_image(image_path, dtype))
+    denoise_key, _ = stage_keys(source_key(image_path), filtro_index, 0, params)
+    filtered = _run_stage(memo, image_path, "denoise", denoise_key,
+                          lambda: to_depth(apply_denoise(load_image(image_path, dtype), filtro_index, params), dtype))
+    return equalization.histogram(filtered)
+
+
+def series_histogram(image_paths, filtro_index, params, memo=None, executor=None):
+    """Histograma somado de todas as imagens de uma série depois do filtro (ver filtered_histogram).
+
+    As imagens são processadas em paralelo em executor (um pool de processos já
+    configurado, como o de run_batch, em que o cache dos processos guarda os resultados do
+    filtro) ou, sem ele, em threads deste processo.
+    """
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as threads:
+            return series_histogram(image_paths, filtro_index, params, memo, threads)
+    hist = np.zeros(np.iinfo(working_dtype(params)).max + 1, dtype=np.int64)
+    # memo só funciona em threads; em um pool de processos, passe memo=None
+    for image_hist in executor.map(filtered_histogram, image_paths, repeat(filtro_index), repeat(params),
+                                   repeat(memo)):
+        hist += image_hist
+    return hist
+
+
+def batch_params(image_paths, filtro_index, equalizacao_index, params=None, memo=None, executor=None):
+    """Parâmetros usados em um lote inteiro.
+
+    Com wavelet_share_sigma, o ruído é estimado uma vez, na primeira imagem, e o valor vai
+    para wavelet_sigma de todas as imagens do lote. Com hist_shared, a tabela da equalização
+    de histograma é calculada uma vez, com o histograma somado das imagens já filtradas, e
+    vai para hist_lut; todas as imagens da série recebem o mesmo mapeamento de contraste.
+    Para isso todas as imagens são filtradas antes do lote (ver series_histogram, que
+    recebe memo e executor); com o cache ou o memo, o lote reaproveita esses resultados.
+    Com params["stages"], o histograma é o das imagens de entrada. Os valores calculados
+    entram na chave do cache, como qualquer outro parâmetro.
+    """
+    params = resolve_params(params)
+    dtype = working_dtype(params)
+    if filtro_index == 0 and params["wavelet_share_sigma"] and params["wavelet_sigma"] is None and image_paths:
+        params["wavelet_sigma"] = denoise.estimate_sigma(to_float32(load_image(image_paths[0], dtype)),
+                                                         params["wavelet"])
+    if equalizacao_index == 0 and params["hist_shared"] and params["hist_lut"] is None and image_paths:
+        hist = series_histogram(image_paths, None if params["stages"] else filtro_index, params, memo, executor)
+        params["hist_lut"] = equalization.equalization_lut(hist).tolist()
+    return params
+
+
+def source_key(image_path):
+    """Identifica o conteúdo de uma imagem de entrada.
+
+    Com o cache ativo é o hash do conteúdo do arquivo; sem ele, caminho, data e tamanho.
+    """
+    if _cache is not None:
+        with profiling.stage("hash"):
+            return _cache.source_key(image_path)
+    stat = os.stat(image_path)
+    return f"{os.path.abspath(image_path)}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def stage_params(params, names):
+    """Seleciona só os parâmetros de que uma etapa depende"""
+    return {name: params[name] for name in names}
+
+
+def stage_keys(source, filtro_index, equalizacao_index, params):
+    """Chaves das etapas de filtro e de equalização.
+
+    Cada etapa depende da sua entrada (e do tipo em que ela é lida), da opção escolhida e
+    apenas dos seus próprios parâmetros. A chave da equalização inclui a do filtro, então
+    mudar o filtro também invalida a equalização, mas mudar só a equalização mantém a
+    chave do filtro.
+    """
+    denoise_key = make_key(CACHE_VERSION, source, params["keep_16bit"], "denoise", filtro_index,
+                           stage_params(params, DENOISE_PARAMS.get(filtro_index, ())))
+    equalize_key = make_key(CACHE_VERSION, denoise_key, "equalize", equalizacao_index,
+                            stage_params(params, EQUALIZATION_PARAMS.get(equalizacao_index, ())))
+    return denoise_key, equalize_key
+
+
+class StageMemo:
+    """Guarda em memória o último resultado de cada etapa por imagem, junto com a sua chave.
+
+    Só um resultado por imagem e etapa é mantido, então a memória usada é a mesma de
+    guardar as imagens filtradas e equalizadas; trocar só a equalização reaproveita o
+    resultado do filtro.
+    """
+
+    def __init__(self):
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def get(self, item, stage, key):
+        with self._lock:
+            entry = self._results.get((item, stage))
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        return None
+
+    def put(self, item, stage, key, result):
+        with self._lock:
+            self._results[(item, stage)] = (key, result)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+
+def _run_stage(memo, item, stage, key, compute, use_cache=True):
+    """Executa uma etapa, reaproveitando o resultado da memória ou do cache em disco quando a chave bate"""
+    if memo is not None:
+        result = memo.get(item, stage, key)
+        if result is not None:
+            return result
+    if use_cache and _cache is not None:
+        # O tempo próprio desta etapa é o de ler ou gravar o cache; o cálculo aparece à parte
+        with profiling.stage("cache"):
+            result = _cache.get_or_compute(key, compute)
+    else:
+        result = compute()
+    if memo is not None:
+        memo.put(item, stage, key, result)
+    return result
+
+
+def process_image(image_path, filtro_index, equalizacao_index, params=None, memo=None):
+    """Processa uma imagem e devolve as versões filtrada e equalizada em uint8.
+
+    A equalização é aplicada sobre a imagem filtrada já em uint8, a mesma que é exibida e
+    guardada. Cada etapa é procurada primeiro em memo (se informado) e depois no cache em
+    disco, e só é recalculada quando a sua chave mudou. Com params["stages"], a lista de
+    etapas é executada no lugar do filtro e da equalização (ver graph.run).
+    """
+    params = resolve_params(params)
+    dtype = working_dtype(params)
+    with profiling.image(image_path):
+        if params["stages"]:
+            return _process_stages(lambda: load_image(image_path, dtype), params, memo, image_path,
+                                   source_key(image_path))
+        denoise_key, equalize_key = stage_keys(source_key(image_path), filtro_index, equalizacao_index, params)
+        filtered = _run_stage(memo, image_path, "denoise", denoise_key,
+                              lambda: to_depth(apply_denoise(load_image(image_path, dtype), filtro_index, params),
+                                               dtype))
+        equalized = _run_stage(memo, image_path, "equalize", equalize_key,
+                               lambda: to_depth(apply_equalization(filtered, equalizacao_index, params), dtype))
+    return filtered, equalized
+
+
+def process_images(image_paths, filtro_index, equalizacao_index, params=None, memo=None):
+    """Processa várias imagens e devolve a lista de pares (filtrada, equalizada) em uint8.
+
+    Com o filtro de Wiener, as imagens do mesmo tamanho que ainda não estão em memo nem
+    no cache são filtradas juntas, com uma FFT sobre a pilha; o resto é como process_image.
+    """
+    params = resolve_params(params)
+    if filtro_index == 1 and not params["tile_size"] and not params["stages"] and len(image_paths) > 1:
+        memo = memo if memo is not None else StageMemo()
+        _wiener_stacks(image_paths, filtro_index, equalizacao_index, params, memo)
+    return [process_image(image_path, filtro_index, equalizacao_index, params, memo) for image_path in image_paths]
+
+
+def _wiener_stacks(image_paths, filtro_index, equalizacao_index, params, memo):
+    # Agrupa por tamanho as imagens cujo filtro precisa ser calculado e deixa o resultado em memo
+    groups = {}
+    for image_path in image_paths:
+        denoise_key, _ = stage_keys(source_key(image_path), filtro_index, equalizacao_index, params)
+        if memo.get(image_path, "denoise", denoise_key) is not None:
+            continue
+        cached = _cache.get(denoise_key) if _cache is not None else None
+        if cached is not None:
+            memo.put(image_path, "denoise", denoise_key, cached)
+            continue
+        with profiling.image(image_path):
+            img = load_image(image_path, working_dtype(params))
+        groups.setdefault(img.shape, []).append((image_path, denoise_key, img))
+
+    for group in groups.values():
+        stack = np.stack([to_float32(img) for _, _, img in group])
+        with profiling.stage("denoise"):
+            filtered = to_depth(denoise.wiener(stack, params["wiener_psf_size"], params["wiener_balance"]),
+                                working_dtype(params))
+        for (image_path, denoise_key, _), result in zip(group, filtered):
+            if _cache is not None:
+                _cache.put(denoise_key, result)
+            memo.put(image_path, "denoise", denoise_key, result)
+
+
+def _process_stages(load, params, memo, item, source=None, use_cache=True, report=None):
+    # Com params["stages"], a lista de etapas substitui o filtro e a equalização fixos.
+    # Importado aqui: graph.py importa este módulo
+    import graph
+    return graph.run(load, params["stages"], params, memo=memo, item=item, source=source, use_cache=use_cache,
+                     report=report)
+
+
+def make_proxy(img, max_size=PROXY_SIZE):
+    """Reduz a imagem para que o maior lado tenha no máximo max_size pixels"""
+    height, width = img.shape[:2]
+    scale = max_size / max(height, width)
+    if scale >= 1:
+        return img
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv.resize(img, size, interpolation=cv.INTER_AREA)
+
+
+def load_proxy(image_path, max_size=PROXY_SIZE, dtype=np.uint8):
+    """Carrega a imagem já reduzida para a pré-visualização, no tipo dtype (ver load_image)"""
+    return make_proxy(load_image(image_path, dtype), max_size)
+
+
+def process_proxy(proxy, filtro_index, equalizacao_index, params=None, memo=None, item="proxy", report=None):
+    """Aplica o pipeline a uma imagem reduzida e devolve as versões filtrada e equalizada em uint8.
+
+    Os filtros usam os mesmos parâmetros da resolução completa, então o resultado é uma
+    aproximação do que será salvo; serve para comparar as opções rapidamente. Com memo,
+    trocar só a equalização não refaz o filtro; item identifica a imagem reduzida no memo.
+    Com params["stages"], report (uma lista) recebe o tempo e o PSNR de cada passo calculado;
+    com o filtro "auto", recebe o filtro escolhido (ver apply_denoise).
+    """
+    params = resolve_params(params)
+    if params["stages"]:
+        return _process_stages(lambda: proxy, params, memo, item, use_cache=False, report=report)
+    dtype = working_dtype(params)
+    denoise_key, equalize_key = stage_keys(item, filtro_index, equalizacao_index, params)
+    filtered = _run_stage(memo, item, "denoise", denoise_key,
+                          lambda: to_depth(apply_denoise(proxy, filtro_index, params, report), dtype),
+                          use_cache=False)
+    equalized = _run_stage(memo, item, "equalize", equalize_key,
+                           lambda: to_depth(apply_equalization(filtered, equalizacao_index, params), dtype),
+                           use_cache=False)
+    return filtered, equalized
+
+
+def output_path_for(save_dir, image_path, output_format="original"):
+    """Monta o caminho de saída mantendo o nome do arquivo original, com a extensão do formato escolhido"""
+    return saving.output_path(save_dir, image_path, output_format)
+
+
+def save_result(save_dir, image_path, img, params=None):
+    """Grava uma imagem processada com o formato e as opções de gravação dos parâmetros.
+
+    Devolve os bytes gravados e o tempo de codificação.
+    """
+    params = resolve_params(params)
+    with profiling.image(image_path):
+        return saving.write(output_path_for(save_dir, image_path, params["output_format"]), img, params)
+
+
+def list_images(in_dir):
+    """Lista as imagens suportadas de uma pasta, em ordem alfabética"""
+    return sorted(os.path.join(in_dir, name) for name in os.listdir(in_dir)
+                  if name.lower().endswith(EXTENSOES))
+
+
+def _init_worker(cache_settings, profile=None):
+    # Cada processo usa uma thread do OpenCV e das FFTs; o paralelismo vem do pool de processos
+    cv.setNumThreads(1)
+    denoise.fft_workers = 1
+    configure_cache(**cache_settings) if cache_settings else configure_cache(enabled=False)
+    # profile: argumentos de profiling.start, ou None para não medir
+    if profile is not None:
+        profiling.start(**profile)
+
+
+def process_and_save(image_path, out_dir, filtro_index, equalizacao_index, params=None):
+    """Processa uma imagem e grava o resultado equalizado em out_dir.
+
+    Devolve as versões filtrada e equalizada, que podem ser descartadas logo em seguida, e
+    os bytes gravados e o tempo de codificação (ver save_result).
+    """
+    filtered, equalized = process_image(image_path, filtro_index, equalizacao_index, params)
+    return filtered, equalized, save_result(out_dir, image_path, equalized, params)
+
+
+def _process_and_save_task(image_paths, out_dir, filtro_index, equalizacao_index, params):
+    # Nos processos do pool só os caminhos voltam, para não copiar as imagens entre processos,
+    # junto com o tempo de cada imagem, o que foi gravado, os acertos e faltas de cache destas
+    # imagens e os eventos medidos (ver profiling.py; vazio com a medição desligada)
+    before = _cache.stats() if _cache else None
+    start = time.perf_counter()
+    if len(image_paths) == 1:
+        *_, (written, encode_seconds) = process_and_save(image_paths[0], out_dir, filtro_index,
+                                                         equalizacao_index, params)
+    else:
+        results = process_images(image_paths, filtro_index, equalizacao_index, params)
+        written = encode_seconds = 0
+        for image_path, (_, equalized) in zip(image_paths, results):
+            image_written, image_encode_seconds = save_result(out_dir, image_path, equalized, params)
+            written += image_written
+            encode_seconds += image_encode_seconds
+    # Imagens processadas juntas dividem o tempo do grupo
+    seconds = (time.perf_counter() - start) / len(image_paths)
+    if before is None:
+        return image_paths, seconds, written, encode_seconds, 0, 0, profiling.drain()
+    after = _cache.stats()
+    return (image_paths, seconds, written, encode_seconds,
+            after["hits"] - before["hits"], after["misses"] - before["misses"], profiling.drain())
+
+
+def run_batch(image_paths, out_dir, filtro_index, equalizacao_index, params=None, workers=None,
+              max_in_flight=None, cache_settings=None, on_done=None, stack_size=1, profiler=None):
+    """Processa e salva um lote de imagens em um pool de processos, em modo streaming.
+
+    Cada imagem é lida, filtrada, equalizada e gravada pelo próprio processo; no máximo
+    max_in_flight imagens (padrão: 2 por processo) ficam enviadas ao pool ao mesmo tempo,
+    então o uso de memória não depende do tamanho do lote. Com stack_size > 1, cada
+    processo recebe grupos de até stack_size imagens, que o filtro de Wiener processa
+    juntas quando têm o mesmo tamanho (ver process_images).
+
+    cache_settings são os argumentos de configure_cache para os processos; None desativa o cache.
+
+    Devolve um dicionário com o número de imagens, o tempo total, a vazão (imagens/s), o
+    tempo de cada imagem (image_seconds), os bytes gravados e o tempo gasto codificando
+    (somado entre os processos) e os acertos e faltas de cache. on_done, se informado, é
+    chamado com o caminho e o tempo de cada imagem concluída. Com profiler (ver
+    profiling.start), os processos medem as etapas e os eventos vão para ele. Levanta
+    ValueError, antes de processar, se duas imagens fossem gravadas no mesmo arquivo.
+    """
+    saving.check_outputs(out_dir, image_paths, resolve_params(params)["output_format"])
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max(max_in_flight or 2 * workers, 1)
+    stack_size = max(stack_size, 1)
+    pending = (image_paths[i:i + stack_size] for i in range(0, len(image_paths), stack_size))
+    in_flight = set()
+    cache_hits = cache_misses = 0
+    bytes_written = encode_seconds = 0
+    image_seconds = {}
+    start = time.perf_counter()
+
+    profile = {"memory": profiler.memory} if profiler is not None else None
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cache_settings, profile)) as executor:
+        # O histograma compartilhado é feito nos mesmos processos, que deixam o filtro no cache
+        params = batch_params(image_paths, filtro_index, equalizacao_index, params, executor=executor)
+
+        def submit_next():
+            group = next(pending, None)
+            if group is not None:
+                in_flight.add(executor.submit(_process_and_save_task, group, out_dir,
+                                              filtro_index, equalizacao_index, params))
+
+        for _ in range(max(max_in_flight // stack_size, 1)):
+            submit_next()
+
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                in_flight.remove(future)
+                group, seconds, written, group_encode_seconds, hits, misses, events = future.result()
+                if profiler is not None:
+                    profiler.add(events)
+                bytes_written += written
+                encode_seconds += group_encode_seconds
+                cache_hits += hits
+                cache_misses += misses
+                submit_next()
+                for image_path in group:
+                    image_seconds[image_path] = seconds
+                    if on_done:
+                        on_done(image_path, seconds)
+
+    elapsed = time.perf_counter() - start
+    n = len(image_paths)
+    return {
+        "images": n,
+        "workers": workers,
+        "seconds": elapsed,
+        "images_per_sec": n / elapsed if elapsed > 0 else 0.0,
+        "image_seconds": image_seconds,
+        "bytes_written": bytes_written,
+        "encode_seconds": encode_seconds,
+        "cache_hits": cache_hits,
+        "cache_misses": cache_misses,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m pipeline",
+                                     description="Redução de ruído e ajuste de contraste em lote")
+    parser.add_argument("in_dir", help="pasta com as imagens de entrada")
+    parser.add_argument("out_dir", help="pasta onde as imagens processadas serão salvas")
+    parser.add_argument("--filter", choices=FILTROS, default=FILTROS[0],
+                        help="filtro de redução de ruído (padrão: %(default)s)")
+    parser.add_argument("--equalize", choices=EQUALIZACOES, default=EQUALIZACOES[0],
+                        help="técnica de ajuste de contraste (padrão: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="número de processos (padrão: número de núcleos)")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="máximo de imagens em processamento ao mesmo tempo (padrão: 2 por processo)")
+    parser.add_argument("--wavelet", choices=WAVELETS, default=DEFAULT_PARAMS["wavelet"],
+                        help="família da wavelet (padrão: %(default)s)")
+    parser.add_argument("--wavelet-levels", type=int, default=DEFAULT_PARAMS["wavelet_levels"],
+                        help="níveis de decomposição; 0 escolhe pelo tamanho da imagem (padrão: %(default)s)")
+    parser.add_argument("--wavelet-method", choices=WAVELET_METHODS, default=DEFAULT_PARAMS["wavelet_method"],
+                        help="método de limiarização (padrão: %(default)s)")
+    parser.add_argument("--wavelet-sigma", type=float, default=None,
+                        help="desvio padrão do ruído, em [0, 1] (padrão: estimado em cada imagem)")
+    parser.add_argument("--share-sigma", action="store_true",
+                        help="estima o ruído só na primeira imagem e usa o mesmo valor no lote todo")
+    parser.add_argument("--wiener-psf-size", type=int, default=DEFAULT_PARAMS["wiener_psf_size"],
+                        help="lado da PSF média do filtro de Wiener, em pixels (padrão: %(default)s)")
+    parser.add_argument("--wiener-balance", type=float, default=DEFAULT_PARAMS["wiener_balance"],
+                        help="regularização do filtro de Wiener; valores maiores suavizam mais "
+                             "(padrão: %(default)s)")
+    parser.add_argument("--stack-size", type=int, default=1,
+                        help="imagens do mesmo tamanho filtradas juntas pelo Wiener em cada processo "
+                             "(padrão: %(default)s)")
+    parser.add_argument("--median-radius", type=int, default=DEFAULT_PARAMS["median_radius"],
+                        help="raio da janela da mediana, em pixels (padrão: %(default)s)")
+    parser.add_argument("--aniso-alpha", type=float, default=DEFAULT_PARAMS["aniso_alpha"],
+                        help="passo de cada iteração da difusão anisotrópica, até "
+                             f"{denoise.MAX_ANISO_ALPHA} (padrão: %(default)s)")
+    parser.add_argument("--aniso-k", type=float, default=DEFAULT_PARAMS["aniso_k"],
+                        help="sensibilidade a bordas da difusão anisotrópica; valores menores preservam "
+                             "mais as bordas (padrão: %(default)s)")
+    parser.add_argument("--aniso-niters", type=int, default=DEFAULT_PARAMS["aniso_niters"],
+                        help="iterações da difusão anisotrópica (padrão: %(default)s)")
+    parser.add_argument("--auto-candidates", nargs="+", choices=FILTROS[:-1],
+                        default=list(DEFAULT_PARAMS["auto_candidates"]),
+                        help="filtros comparados por --filter auto, dos mais rápidos para os mais lentos "
+                             "(padrão: %(default)s)")
+    parser.add_argument("--auto-budget", type=float, default=DEFAULT_PARAMS["auto_budget"],
+                        help="com --filter auto, tempo máximo do filtro por imagem em segundos, escolha "
+                             "incluída; 0 sem limite (padrão: %(default)s)")
+    parser.add_argument("--shared-histogram", action="store_true",
+                        help="equaliza o lote todo com o histograma somado das imagens filtradas "
+                             "(com --equalize hist; as imagens são filtradas antes do lote, e sem o cache, "
+                             "filtradas de novo nele)")
+    parser.add_argument("--clahe-clip-limit", type=float, default=DEFAULT_PARAMS["clahe_clip_limit"],
+                        help="limite de contraste do CLAHE (padrão: %(default)s)")
+    parser.add_argument("--clahe-tile-grid", type=int, default=DEFAULT_PARAMS["clahe_tile_grid"],
+                        help="número de blocos do CLAHE em cada direção (padrão: %(default)s)")
+    parser.add_argument("--tile-size", type=int, default=0,
+                        help="processa imagens maiores que este lado em blocos (padrão: desativado)")
+    parser.add_argument("--tile-workers", type=int, default=None,
+                        help="threads por imagem, para os blocos, a wavelet e o CLAHE "
+                             "(padrão: núcleos / processos)")
+    parser.add_argument("--keep-16bit", action="store_true",
+                        help="processa imagens de 16 bits sem reduzi-las para 8 e grava em 16 bits "
+                             "(PNG e TIFF; JPEG e WebP continuam em 8 bits)")
+    parser.add_argument("--format", choices=saving.OUTPUT_FORMATS, default=DEFAULT_PARAMS["output_format"],
+                        help="formato das imagens gravadas; original mantém a extensão de entrada "
+                             "(padrão: %(default)s)")
+    parser.add_argument("--png-compression", type=int, choices=range(-1, 10), metavar="{-1..9}",
+                        default=DEFAULT_PARAMS["png_compression"],
+                        help="nível de compressão do PNG; -1 usa o padrão do OpenCV (padrão: %(default)s)")
+    parser.add_argument("--jpeg-quality", type=int, default=DEFAULT_PARAMS["jpeg_quality"],
+                        help="qualidade do JPEG, de 0 a 100 (padrão: %(default)s)")
+    parser.add_argument("--webp-quality", type=int, default=None,
+                        help="qualidade do WebP, de 1 a 100; sem esta opção o WebP é gravado sem perdas")
+    parser.add_argument("--tiff-compression", choices=tuple(saving.TIFF_COMPRESSIONS),
+                        default=DEFAULT_PARAMS["tiff_compression"],
+                        help="compressão sem perdas do TIFF (padrão: %(default)s)")
+    parser.add_argument("--preset", default=None,
+                        help="arquivo JSON com a lista de etapas (ver graph.py); substitui --filter e --equalize")
+    parser.add_argument("--watch", action="store_true",
+                        help="monitora in_dir e processa cada imagem nova assim que ela termina de ser gravada")
+    parser.add_argument("--watch-interval", type=float, default=0.5,
+                        help="intervalo entre leituras da pasta monitorada, em segundos (padrão: %(default)s)")
+    parser.add_argument("--watch-settle", type=float, default=1.0,
+                        help="tempo sem mudanças para um arquivo ser considerado completo, em segundos "
+                             "(padrão: %(default)s)")
+    parser.add_argument("--status-interval", type=float, default=5.0,
+                        help="intervalo entre as linhas de estado do modo monitorado, em segundos "
+                             "(padrão: %(default)s)")
+    parser.add_argument("--profile", action="store_true",
+                        help="mede tempo, CPU e pico de memória de cada etapa e mostra um resumo ao final")
+    parser.add_argument("--profile-json", default=None,
+                        help="grava as medições de cada etapa e imagem neste arquivo JSON (implica --profile)")
+    parser.add_argument("--profile-trace", default=None,
+                        help="grava as medições como trace do Chrome (chrome://tracing ou ui.perfetto.dev) "
+                             "neste arquivo (implica --profile)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="pasta do cache de resultados (padrão: pasta de cache do usuário)")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // 1024 ** 2,
+                        help="tamanho máximo do cache em MB (padrão: %(default)s)")
+    parser.add_argument("--no-cache", action="store_true", help="não consulta nem grava o cache")
+    return parser
+
+
+def _watch(args, params, workers, cache_settings):
+    # Importado aqui: watch.py importa este módulo
+    import watch
+
+    last_status = 0.0
+
+    def on_done(image_path, latency, seconds):
+        print(f"{os.path.basename(image_path)}: {seconds:.2f} s de processamento, {latency:.2f} s desde a chegada")
+
+    def on_error(image_path, message):
+        print(f"{os.path.basename(image_path)}: erro: {message}", file=sys.stderr)
+
+    def on_status(snapshot):
+        # A fila e as latências aparecem a cada poucos segundos, sem encher o terminal
+        nonlocal last_status
+        if time.monotonic() - last_status >= args.status_interval:
+            last_status = time.monotonic()
+            print(watch.describe(snapshot))
+
+    print(f"Monitorando {args.in_dir} (Ctrl+C para parar)")
+    try:
+        snapshot = watch.watch_folder(args.in_dir, args.out_dir, FILTROS.index(args.filter),
+                                      EQUALIZACOES.index(args.equalize), params=params, workers=workers,
+                                      max_in_flight=args.max_in_flight, cache_settings=cache_settings,
+                                      interval=args.watch_interval, settle=args.watch_settle,
+                                      on_done=on_done, on_error=on_error, on_status=on_status)
+    except ValueError as exc:
+        print(exc, file=sys.stderr)
+        return 1
+    print(watch.describe(snapshot))
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not 0 < args.aniso_alpha <= denoise.MAX_ANISO_ALPHA:
+        # Acima de 1/8 a difusão deixa de ser estável e amplifica o ruído em vez de reduzi-lo
+        parser.error(f"--aniso-alpha deve estar entre 0 e {denoise.MAX_ANISO_ALPHA}")
+
+    cache_settings = None
+    if not args.no_cache:
+        cache_settings = {"directory": args.cache_dir, "max_bytes": args.cache_size * 1024 ** 2}
+
+    workers = args.workers or os.cpu_count() or 1
+    params = {
+        "wavelet": args.wavelet,
+        "wavelet_levels": args.wavelet_levels,
+        "wavelet_method": args.wavelet_method,
+        "wavelet_sigma": args.wavelet_sigma,
+        "wavelet_share_sigma": args.share_sigma,
+        "wiener_psf_size": args.wiener_psf_size,
+        "wiener_balance": args.wiener_balance,
+        "median_radius": args.median_radius,
+        "aniso_alpha": args.aniso_alpha,
+        "aniso_k": args.aniso_k,
+        "aniso_niters": args.aniso_niters,
+        "auto_candidates": args.auto_candidates,
+        "auto_budget": args.auto_budget,
+        "hist_shared": args.shared_histogram,
+        "clahe_clip_limit": args.clahe_clip_limit,
+        "clahe_tile_grid": args.clahe_tile_grid,
+        "output_format": args.format,
+        "png_compression": args.png_compression,
+        "jpeg_quality": args.jpeg_quality,
+        "webp_lossless": args.webp_quality is None,
+        "webp_quality": args.webp_quality or DEFAULT_PARAMS["webp_quality"],
+        "tiff_compression": args.tiff_compression,
+        "tile_size": args.tile_size,
+        "keep_16bit": args.keep_16bit,
+        # Os processos já dividem os núcleos entre si; cada um usa só a sua parte para os blocos
+        "tile_workers": args.tile_workers or max(1, (os.cpu_count() or 1) // workers),
+    }
+
+    if args.preset:
+        # Importado aqui: graph.py importa este módulo
+        import graph
+        try:
+            params["stages"] = graph.load_preset(args.preset)
+        except (OSError, ValueError) as exc:
+            print(f"Preset inválido: {exc}", file=sys.stderr)
+            return 1
+
+    if args.watch:
+        return _watch(args, params, workers, cache_settings)
+
+    image_paths = list_images(args.in_dir)
+    if not image_paths:
+        print(f"Nenhuma imagem encontrada em {args.in_dir}", file=sys.stderr)
+        return 1
+    try:
+        saving.check_outputs(args.out_dir, image_paths, params["output_format"])
+    except ValueError as exc:
+        print(exc, file=sys.stderr)
+        return 1
+
+    profiler = None
+    if args.profile or args.profile_json or args.profile_trace:
+        profiler = profiling.start()
+
+    done = 0
+
+    def on_done(image_path, seconds):
+        nonlocal done
+        done += 1
+        print(f"[{done}/{len(image_paths)}] {os.path.basename(image_path)} ({seconds:.2f} s)")
+
+    stats = run_batch(image_paths, args.out_dir, FILTROS.index(args.filter),
+                      EQUALIZACOES.index(args.equalize), params=params, workers=workers,
+                      max_in_flight=args.max_in_flight, cache_settings=cache_settings, on_done=on_done,
+                      stack_size=args.stack_size, profiler=profiler)
+
+    print(f"{stats['images']} imagens em {stats['seconds']:.2f} s "
+          f"({stats['images_per_sec']:.2f} imagens/s, {stats['workers']} processos)")
+    if stats["image_seconds"]:
+        seconds = sorted(stats["image_seconds"].values())
+        print(f"Por imagem: média {sum(seconds) / len(seconds):.2f} s, "
+              f"mediana {seconds[len(seconds) // 2]:.2f} s, máximo {seconds[-1]:.2f} s")
+    if stats["encode_seconds"] > 0:
+        megabytes = stats["bytes_written"] / 1024 ** 2
+        print(f"Gravação: {megabytes:.1f} MB, {stats['encode_seconds']:.2f} s codificando "
+              f"({stats['images'] / stats['encode_seconds']:.1f} imagens/s, "
+              f"{megabytes / stats['encode_seconds']:.1f} MB/s por processo)")
+    if cache_settings:
+        print(f"Cache: {stats['cache_hits']} acertos, {stats['cache_misses']} faltas")
+    if profiler is not None:
+        profiling.stop()
+        print("\n".join(profiling.report_lines(profiler)))
+        if args.profile_json:
+            profiler.write_json(args.profile_json)
+        if args.profile_trace:
+            profiler.write_chrome_trace(args.profile_trace)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""Exibição de imagens numpy nas labels de pré-visualização.
+
+As imagens são reduzidas ao tamanho de exibição com o OpenCV antes de chegar ao Qt; o
+QImage usa o buffer do array reduzido sem copiar e o QPixmap já nasce no tamanho final.
+Nenhum arquivo temporário e nenhum pixmap em resolução completa são criados.
+"""
+import os
+
+import cv2 as cv
+import numpy as np
+from PySide6.QtGui import QImage, QImageReader, QPixmap
+
+import profiling
+import tiff
+
+"""Lado máximo das imagens nas labels de pré-visualização da janela principal, em pixels"""
+PREVIEW_SIZE = 250
+
+"""Fatores de redução que o decodificador JPEG do OpenCV aplica direto na leitura"""
+_REDUCED_FLAGS = ((8, cv.IMREAD_REDUCED_COLOR_8), (4, cv.IMREAD_REDUCED_COLOR_4), (2, cv.IMREAD_REDUCED_COLOR_2))
+
+_FORMATS = {1: QImage.Format.Format_Grayscale8, 3: QImage.Format.Format_BGR888, 4: QImage.Format.Format_ARGB32}
+
+
+def downscale(img, size):
+    """Reduz a imagem para que o maior lado tenha no máximo size pixels, mantendo a proporção"""
+    scale = size / max(img.shape[:2])
+    if scale >= 1:
+        return img
+    width, height = max(round(img.shape[1] * scale), 1), max(round(img.shape[0] * scale), 1)
+    return cv.resize(img, (width, height), interpolation=cv.INTER_AREA)
+
+
+def decode_reduced(image_path, size):
+    """Lê uma imagem em BGR uint8 com o maior lado de no máximo size pixels.
+
+    Em JPEG a redução é feita pelo decodificador, com o maior fator que ainda deixa a
+    imagem com pelo menos size pixels no maior lado; o ajuste final é feito com
+    cv.resize. TIFFs grandes sem compressão (ver tiff.memmap) são amostrados direto do
+    arquivo e devolvidos em cinza uint8. Outros formatos são lidos inteiros e reduzidos depois.
+    """
+    if image_path.lower().endswith((".tif", ".tiff")) and os.path.getsize(image_path) >= tiff.MMAP_MIN_BYTES:
+        img = tiff.memmap(image_path)
+        if img is not None:
+            # Só as linhas amostradas são lidas do disco
+            step = max(max(img.shape) // size, 1)
+            img = np.ascontiguousarray(img[::step, ::step])
+            return downscale(img if img.dtype == np.uint8 else cv.convertScaleAbs(img, alpha=1 / 257), size)
+
+    flag = cv.IMREAD_COLOR
+    reader = QImageReader(image_path)
+    if reader.format() == b"jpeg":
+        longest = max(reader.size().width(), reader.size().height())
+        for factor, reduced_flag in _REDUCED_FLAGS:
+            if longest // factor >= size:
+                flag = reduced_flag
+                break
+
+    # np.fromfile + imdecode aceita caminhos com acentos no Windows, ao contrário de cv.imread
+    img = cv.imdecode(np.fromfile(image_path, dtype=np.uint8), flag)
+    if img is None:
+        raise ValueError(f"Não foi possível ler a imagem {image_path}")
+    return downscale(img, size)
+
+
+def to_qimage(img, rgb=False):
+    """QImage que usa os pixels de uma imagem uint8 (cinza, BGR ou BGRA) ou cinza uint16 sem copiar.
+
+    O array fica guardado no próprio QImage, então o buffer vive enquanto ele existir.
+    Com rgb=True os canais são lidos na ordem RGB (imagens do Pillow, por exemplo).
+    Para usar o QImage em outra thread ou fora do objeto Python, faça uma cópia (copy()).
+    """
+    if img.dtype == np.uint16 and img.ndim == 2:
+        img = np.ascontiguousarray(img)
+        image_format = QImage.Format.Format_Grayscale16
+    else:
+        img = np.ascontiguousarray(img, dtype=np.uint8)
+        channels = 1 if img.ndim == 2 else img.shape[2]
+        image_format = QImage.Format.Format_RGB888 if rgb and channels == 3 else _FORMATS[channels]
+    image = QImage(img.data, img.shape[1], img.shape[0], img.strides[0], image_format)
+    image._array = img
+    return image
+
+
+def to_pixmap(img, size=PREVIEW_SIZE, rgb=False):
+    """QPixmap já no tamanho de exibição: reduz o array e só então passa ao Qt"""
+    return QPixmap.fromImage(to_qimage(downscale(img, size), rgb))
+
+
+def show(label, img, size=PREVIEW_SIZE, rgb=False):
+    """Exibe uma imagem numpy em uma QLabel, ajustada ao tamanho da label"""
+    with profiling.stage("preview"):
+        label.setPixmap(to_pixmap(img, size, rgb))
+    label.setScaledContents(True)
+
+
+def show_file(label, image_path, size=PREVIEW_SIZE):
+    """Exibe um arquivo de imagem em uma QLabel, lido já em tamanho reduzido"""
+    with profiling.stage("preview"):
+        show(label, decode_reduced(image_path, size), size)
@@ -0,0 +1,243 @@
+"""Medição do tempo e da memória de cada etapa do processamento.
+
+Com a medição ligada (start), cada trecho marcado com stage() registra um evento com o
+tempo de parede, o tempo de CPU da thread e o pico de memória alocada durante o trecho,
+junto com a imagem em processamento (ver image()). Desligada, stage() não mede nada e
+custa só uma comparação. Os eventos são resumidos por etapa (Profiler.summary) e podem
+ser exportados em JSON ou como trace do Chrome (chrome://tracing ou ui.perfetto.dev), em
+que cada thread de cada processo vira uma linha do tempo.
+
+Etapas podem ficar uma dentro da outra (as conversões para uint8 dentro do filtro, por
+exemplo): o tempo de um evento inclui o das etapas internas e "self" é só o tempo
+próprio, sem elas; somando os tempos próprios nada é contado duas vezes. O tempo de CPU
+é o da thread que executou a etapa; o trabalho de threads auxiliares (blocos, faixas do
+CLAHE) aparece nos eventos dessas threads.
+
+A memória vem do tracemalloc, que acompanha os arrays do numpy (inclusive os devolvidos
+pelo OpenCV), mas não os buffers internos do OpenCV. O pico é o do processo: nos
+processos do pipeline em lote cada um trata uma imagem por vez e o valor é o da etapa;
+com várias imagens em threads ao mesmo tempo, como na interface, os valores se misturam.
+"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+"""Medição em andamento neste processo; None quando desligada"""
+_active = None
+_started_tracemalloc = False
+
+_local = threading.local()
+_NOTHING = nullcontext()
+
+
+class Profiler:
+    """Eventos medidos enquanto a medição está ligada, um dicionário por trecho"""
+
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.events = []
+        self._lock = threading.Lock()
+
+    def add(self, events):
+        """Acrescenta eventos, por exemplo os medidos em um processo do pool (ver drain)"""
+        with self._lock:
+            self.events.extend(events)
+
+    def drain(self):
+        """Devolve os eventos registrados até agora e esvazia a lista"""
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+    def summary(self):
+        """Totais por etapa, da que tomou mais tempo próprio para a que tomou menos.
+
+        Cada etapa tem o número de eventos, os tempos de parede, próprio e de CPU somados,
+        em segundos, e o maior pico de memória, em bytes.
+        """
+        stages = {}
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            totals = stages.setdefault(event["stage"], {"count": 0, "wall": 0.0, "self": 0.0, "cpu": 0.0, "peak": 0})
+            totals["count"] += 1
+            totals["wall"] += event["wall"]
+            totals["self"] += event["self"]
+            totals["cpu"] += event["cpu"]
+            totals["peak"] = max(totals["peak"], event["peak"])
+        return dict(sorted(stages.items(), key=lambda item: item[1]["self"], reverse=True))
+
+    def image_seconds(self):
+        """Tempo medido de cada imagem (soma dos tempos próprios das suas etapas), da mais lenta para a mais rápida"""
+        images = {}
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            if event["image"] is not None:
+                images[event["image"]] = images.get(event["image"], 0.0) + event["self"]
+        return dict(sorted(images.items(), key=lambda item: item[1], reverse=True))
+
+    def to_dict(self):
+        """Relatório completo: eventos (início em segundos desde o primeiro), etapas e imagens"""
+        with self._lock:
+            events = sorted(self.events, key=lambda event: event["start"])
+        origin = events[0]["start"] if events else 0.0
+        return {
+            "events": [dict(event, start=event["start"] - origin) for event in events],
+            "stages": self.summary(),
+            "images": self.image_seconds(),
+        }
+
+    def chrome_trace(self):
+        """Eventos no formato de trace do Chrome (eventos completos, tempos em microssegundos)"""
+        with self._lock:
+            events = list(self.events)
+        origin = min((event["start"] for event in events), default=0.0)
+        trace = []
+        for event in events:
+            args = {"cpu_ms": event["cpu"] * 1000, "self_ms": event["self"] * 1000,
+                    "peak_mb": event["peak"] / 1024 ** 2}
+            if event["image"] is not None:
+                args["image"] = event["image"]
+            trace.append({"name": event["stage"], "cat": "etapa", "ph": "X",
+                          "ts": (event["start"] - origin) * 1e6, "dur": event["wall"] * 1e6,
+                          "pid": event["pid"], "tid": event["tid"], "args": args})
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, ensure_ascii=False, indent=1)
+
+    def write_chrome_trace(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.chrome_trace(), file, ensure_ascii=False)
+
+
+def start(memory=True):
+    """Liga a medição neste processo e devolve o Profiler que recebe os eventos.
+
+    Chamar de novo começa uma medição nova. Com memory, o tracemalloc é ligado (se ainda
+    não estiver) e os picos de memória são medidos; isso deixa as etapas um pouco mais lentas.
+    """
+    global _active, _started_tracemalloc
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracemalloc = True
+    _active = Profiler(memory)
+    return _active
+
+
+def stop():
+    """Desliga a medição e devolve o Profiler com os eventos (None se não estava ligada)"""
+    global _active, _started_tracemalloc
+    profiler, _active = _active, None
+    if _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+    return profiler
+
+
+def active():
+    """Profiler da medição em andamento, ou None"""
+    return _active
+
+
+def drain():
+    """Eventos medidos neste processo desde a última chamada; [] com a medição desligada"""
+    return _active.drain() if _active is not None else []
+
+
+def stage(name):
+    """Marca um trecho como etapa: with profiling.stage("decode"): ..."""
+    if _active is None:
+        return _NOTHING
+    return _measure(_active, name)
+
+
+def image(image_path):
+    """Associa as etapas executadas nesta thread, dentro do with, à imagem image_path"""
+    if _active is None:
+        return _NOTHING
+    return _current_image(image_path)
+
+
+@contextmanager
+def _current_image(image_path):
+    previous = getattr(_local, "image", None)
+    _local.image = image_path
+    try:
+        yield
+    finally:
+        _local.image = previous
+
+
+@contextmanager
+def _measure(profiler, name):
+    stack = _local.__dict__.setdefault("stack", [])
+    memory = profiler.memory and tracemalloc.is_tracing()
+    current = 0
+    if memory:
+        # O pico é zerado a cada etapa; a etapa de fora guarda o pico que já tinha visto
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1][1] = max(stack[-1][1], peak)
+        tracemalloc.reset_peak()
+    # memória no início, pico visto, tempo das etapas internas
+    frame = [current, current, 0.0]
+    stack.append(frame)
+    cpu_start = time.thread_time()
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - start_time
+        cpu = time.thread_time() - cpu_start
+        stack.pop()
+        if memory:
+            frame[1] = max(frame[1], tracemalloc.get_traced_memory()[1])
+        if stack:
+            stack[-1][1] = max(stack[-1][1], frame[1])
+            stack[-1][2] += wall
+        profiler.add([{
+            "stage": name,
+            "image": getattr(_local, "image", None),
+            "start": start_time,
+            "wall": wall,
+            "self": wall - frame[2],
+            "cpu": cpu,
+            "peak": frame[1] - frame[0],
+            "pid": os.getpid(),
+            "tid": threading.get_native_id(),
+        }])
+
+
+def describe(summary, top=4):
+    """Resumo de uma linha das etapas que mais tomaram tempo, para a barra de status"""
+    total = sum(totals["self"] for totals in summary.values())
+    if not total:
+        return "nenhuma etapa medida"
+    parts = [f"{name} {totals['self'] / total:.0%} ({totals['self']:.2f} s)"
+             for name, totals in list(summary.items())[:top]]
+    peak = max(totals["peak"] for totals in summary.values())
+    if peak:
+        parts.append(f"pico de memória {peak / 1024 ** 2:.0f} MB")
+    return ", ".join(parts)
+
+
+def report_lines(profiler, slowest=3):
+    """Tabela por etapa e as imagens mais lentas, para o terminal"""
+    summary = profiler.summary()
+    total = sum(totals["self"] for totals in summary.values()) or 1.0
+    width = max([len(name) for name in summary] + [12])
+    lines = [f"{'etapa':<{width}} {'vezes':>6} {'total s':>9} {'próprio s':>10} {'%':>5} {'CPU s':>8} {'pico MB':>8}"]
+    for name, totals in summary.items():
+        lines.append(f"{name:<{width}} {totals['count']:>6} {totals['wall']:>9.3f} {totals['self']:>10.3f} "
+                     f"{totals['self'] / total:>5.0%} {totals['cpu']:>8.3f} {totals['peak'] / 1024 ** 2:>8.1f}")
+    images = list(profiler.image_seconds().items())[:slowest]
+    if images:
+        lines.append("Imagens mais lentas: " + ", ".join(f"{os.path.basename(path)} ({seconds:.2f} s)"
+                                                         for path, seconds in images))
+    return lines
@@ -0,0 +1,92 @@
+"""Gravação das imagens processadas no formato e com a compressão escolhidos.
+
+As imagens são codificadas com cv.imencode e o resultado é gravado com tofile, o que
+aceita caminhos com acentos no Windows (ao contrário de cv.imwrite) e permite medir
+separadamente o tempo de codificação e o tamanho gravado. Os valores padrão das opções
+ficam em pipeline.DEFAULT_PARAMS, junto com os parâmetros dos filtros.
+"""
+import os
+import time
+
+import cv2 as cv
+import numpy as np
+
+import profiling
+
+"""Formatos de saída; "original" mantém a extensão da imagem de entrada"""
+OUTPUT_FORMATS = ("original", "png", "jpg", "webp", "tiff")
+
+"""Compressões sem perdas oferecidas para TIFF"""
+TIFF_COMPRESSIONS = {
+    "lzw": cv.IMWRITE_TIFF_COMPRESSION_LZW,
+    "deflate": cv.IMWRITE_TIFF_COMPRESSION_ADOBE_DEFLATE,
+    "none": cv.IMWRITE_TIFF_COMPRESSION_NONE,
+}
+
+"""Parâmetros que só mudam a gravação; trocá-los não exige reprocessar as imagens"""
+SAVE_PARAMS = ("output_format", "png_compression", "jpeg_quality", "webp_lossless", "webp_quality",
+               "tiff_compression")
+
+
+def output_path(save_dir, image_path, output_format="original"):
+    """Caminho de saída com o nome do arquivo original e a extensão do formato escolhido"""
+    stem, ext = os.path.splitext(os.path.basename(image_path))
+    if output_format != "original":
+        ext = "." + output_format
+    return os.path.join(save_dir, stem + ext)
+
+
+def check_outputs(save_dir, image_paths, output_format="original"):
+    """Levanta ValueError se duas entradas fossem gravadas no mesmo arquivo de saída.
+
+    Com um formato escolhido, scan.png e scan.jpg viram ambas scan.png; sem esta
+    verificação uma delas seria sobrescrita sem aviso.
+    """
+    outputs = {}
+    for image_path in image_paths:
+        key = os.path.normcase(output_path(save_dir, image_path, output_format))
+        outputs.setdefault(key, []).append(os.path.basename(image_path))
+    duplicates = ["/".join(names) for names in outputs.values() if len(names) > 1]
+    if duplicates:
+        raise ValueError(f"Imagens com o mesmo nome seriam gravadas no mesmo arquivo {output_format.upper()}: "
+                         f"{', '.join(duplicates)}. Use o formato original ou renomeie as imagens")
+
+
+def encode_flags(ext, params):
+    """Opções do cv.imencode para a extensão, a partir dos parâmetros de gravação"""
+    ext = ext.lower()
+    if ext == ".png":
+        # -1 mantém o padrão do OpenCV, a compressão mais rápida
+        return [] if params["png_compression"] < 0 else [cv.IMWRITE_PNG_COMPRESSION, params["png_compression"]]
+    if ext in (".jpg", ".jpeg"):
+        return [cv.IMWRITE_JPEG_QUALITY, params["jpeg_quality"]]
+    if ext == ".webp":
+        # Qualidade acima de 100 faz o codificador WebP trabalhar sem perdas
+        return [cv.IMWRITE_WEBP_QUALITY, 101 if params["webp_lossless"] else params["webp_quality"]]
+    if ext in (".tif", ".tiff"):
+        return [cv.IMWRITE_TIFF_COMPRESSION, TIFF_COMPRESSIONS[params["tiff_compression"]]]
+    return []
+
+
+def encode(img, ext, params):
+    """Codifica a imagem no formato da extensão; devolve o buffer (array uint8).
+
+    Imagens uint16 são gravadas em 16 bits em PNG e TIFF; os outros formatos só têm 8 bits.
+    """
+    if img.dtype == np.uint16 and ext.lower() not in (".png", ".tif", ".tiff"):
+        img = cv.convertScaleAbs(img, alpha=1 / 257)
+    ok, buffer = cv.imencode(ext, img, encode_flags(ext, params))
+    if not ok:
+        raise ValueError(f"Não foi possível codificar a imagem como {ext}")
+    return buffer
+
+
+def write(path, img, params):
+    """Codifica e grava a imagem em path; devolve os bytes gravados e o tempo de codificação"""
+    start = time.perf_counter()
+    with profiling.stage("encode"):
+        buffer = encode(img, os.path.splitext(path)[1], params)
+    encode_seconds = time.perf_counter() - start
+    with profiling.stage("write"):
+        buffer.tofile(path)
+    return buffer.size, encode_seconds
@@ -0,0 +1,49 @@
+"""Tempo de abertura do editor, por fase.
+
+main.py importa este módulo antes de todos os outros e marca cada fase da abertura:
+imports (módulos do editor carregados), window (janela montada), shown (janela exibida,
+com o laço de eventos rodando) e warm (aquecimento em segundo plano concluído, ver
+pipeline.warm_up). Com --startup-report, o editor grava os tempos em JSON e fecha assim
+que o aquecimento termina:
+
+    python main.py --startup-report abertura.json
+    main.exe --startup-report abertura.json
+
+Os tempos contam a partir do primeiro import; a partida do interpretador e, no executável
+de arquivo único, a extração dos arquivos ficam de fora. python -m benchmark --startup
+mede também esse trecho, lançando o editor como um processo novo.
+"""
+import json
+import sys
+import time
+
+STARTED = time.perf_counter()
+
+"""Módulos pesados; o relatório mostra quais já estavam carregados em cada fase"""
+HEAVY_MODULES = ("numpy", "cv2", "pywt", "scipy.fft")
+
+_phases = {}
+_modules = {}
+
+
+def mark(phase):
+    """Registra o fim de uma fase, em segundos desde o início"""
+    _phases[phase] = time.perf_counter() - STARTED
+    _modules[phase] = [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+def report_path(argv):
+    """Arquivo pedido com --startup-report, ou None"""
+    if "--startup-report" not in argv:
+        return None
+    index = argv.index("--startup-report") + 1
+    return argv[index] if index < len(argv) else None
+
+
+def report():
+    return {"frozen": bool(getattr(sys, "frozen", False)), "phases": dict(_phases), "modules": dict(_modules)}
+
+
+def write_report(path):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report(), file, ensure_ascii=False, indent=1)
@@ -0,0 +1,338 @@
+"""Varredura de parâmetros: uma grade de valores aplicada a uma amostra de imagens.
+
+Cada imagem é lida uma vez e passa por todos os pontos da grade no mesmo processo. Os
+pontos são percorridos com os parâmetros das primeiras etapas variando mais devagar, e
+o resultado de cada passo fica guardado enquanto o ponto seguinte ainda puder usá-lo
+(mesma chave, ver graph.step_keys): mudar só a equalização não refaz o filtro. As imagens
+são divididas entre processos, como em pipeline.run_batch.
+
+    python -m sweep amostra resultado --filter wiener --equalize clahe \\
+        --grid wiener_psf_size=3,5,7 --grid wiener_balance=0.05,0.1,0.2 --grid clahe_clip_limit=1,2,4
+
+A nota de cada ponto segue a ideia de autofilter.py: o ruído da imagem é somado à versão
+reduzida dela, quase sem ruído, e a nota é o SSIM entre o resultado do ponto nessa versão
+ruidosa e o resultado das mesmas etapas, sem as de redução de ruído, na versão sem
+ruído. Um filtro fraco deixa ruído e um filtro forte demais apaga detalhes; os dois
+baixam a nota. Entropia do histograma, ruído restante e tempo (em resolução completa)
+completam a tabela. Em resultado ficam varredura.csv (médias por ponto, do melhor para o
+pior), miniaturas.png (uma coluna por ponto, na mesma ordem) e melhor_preset.json.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2 as cv
+import numpy as np
+
+import autofilter
+import equalization
+import graph
+import pipeline
+import saving
+
+"""Métricas de cada ponto e se valores maiores são melhores"""
+METRICS = {"score": True, "psnr": True, "entropy": True, "noise": False, "seconds": False}
+
+"""Lado das miniaturas e número de imagens (linhas) na folha de miniaturas"""
+SHEET_SIZE = 160
+SHEET_ROWS = 4
+
+"""Altura da faixa com o rótulo de cada coluna, em pixels"""
+_LABEL_HEIGHT = 20
+
+
+def parse_grid(items):
+    """Converte "nome=v1,v2,..." em {nome: [valores]}; números e true/false viram números e bool"""
+    grid = {}
+    for item in items:
+        name, _, values = item.partition("=")
+        if not name or not values:
+            raise ValueError(f"Grade inválida: {item!r} (use nome=v1,v2,...)")
+        grid[name.strip()] = [_parse_value(value.strip()) for value in values.split(",")]
+    return grid
+
+
+def _parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def apply_point(stages, params, point):
+    """Etapas e parâmetros de um ponto da grade.
+
+    Cada valor vai para os parâmetros e também, explicitamente, para as etapas que o usam;
+    assim as etapas devolvidas sozinhas já reproduzem o ponto (ver graph.save_preset).
+    """
+    params = {**params, **point}
+    result = []
+    for stage in stages:
+        # As opções próprias da etapa (filtro, método...) vêm antes: elas decidem quais parâmetros a etapa usa
+        defaults = graph.STAGES[stage["stage"]][1]
+        stage = {**stage, **{name: value for name, value in point.items() if name in defaults}}
+        used = graph.plan([stage], params)[0][3][0][1]
+        result.append({**stage, **{name: value for name, value in point.items() if name in used}})
+    return result, params
+
+
+def grid_points(stages, params, grid):
+    """Pontos da grade, os parâmetros das primeiras etapas variando mais devagar.
+
+    Devolve a lista de pontos ({nome: valor}); levanta ValueError se algum nome da grade
+    não for usado por nenhuma etapa.
+    """
+    names = list(grid)
+    first_use = dict.fromkeys(names, len(stages))
+    for values in itertools.product(*grid.values()):
+        point_stages, _ = apply_point(stages, params, dict(zip(names, values)))
+        for name in names:
+            position = next((i for i, stage in enumerate(point_stages) if name in stage), len(stages))
+            first_use[name] = min(first_use[name], position)
+    unused = [name for name in names if first_use[name] == len(stages)]
+    if unused:
+        raise ValueError(f"Parâmetros não usados pelas etapas: {', '.join(unused)}")
+    names.sort(key=first_use.get)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+class _Chain:
+    """Resultados dos passos do último ponto calculado; o ponto seguinte reaproveita o prefixo em comum"""
+
+    def __init__(self, source, img):
+        self.source = source
+        self.img = img
+        self.path = []
+        self.computed = 0
+
+    def run(self, steps):
+        """Saída do último passo e tempo somado de todos os passos, também dos reaproveitados"""
+        current, seconds = self.img, 0.0
+        for depth, (step, key) in enumerate(zip(steps, graph.step_keys(self.source, steps))):
+            if depth < len(self.path) and self.path[depth][0] == key:
+                _, current, step_seconds = self.path[depth]
+            else:
+                del self.path[depth:]
+                start = time.perf_counter()
+                current = graph._run_step(step, current)
+                step_seconds = time.perf_counter() - start
+                self.path.append((key, current, step_seconds))
+                self.computed += 1
+            seconds += step_seconds
+        return current, seconds
+
+
+def entropy(img):
+    """Entropia do histograma em 8 bits, em bits por pixel"""
+    hist = equalization.histogram(pipeline.to_uint8(img))
+    probabilities = hist[hist > 0] / hist.sum()
+    return float(-(probabilities * np.log2(probabilities)).sum())
+
+
+def _plan(stages, params):
+    return graph.plan(stages, params) if stages else []
+
+
+def sweep_image(image_path, points, params, thumbnail_size=0):
+    """Aplica todos os pontos a uma imagem, lida uma vez só.
+
+    points é a lista de (etapas, parâmetros) de cada ponto (ver apply_point). Devolve um
+    dicionário com as métricas de cada ponto (rows), as miniaturas dos resultados (com
+    thumbnail_size > 0), os passos calculados em resolução completa, de quantos seriam
+    sem reaproveitamento, e o tempo da imagem.
+    """
+    start = time.perf_counter()
+    dtype = pipeline.working_dtype(params)
+    img = pipeline.load_image(image_path, dtype)
+    reference = pipeline.to_float32(pipeline.make_proxy(img, autofilter.PROXY_SIZE))
+    noisy = np.clip(reference + autofilter.noise_sample(img, reference.shape), 0, 1)
+    full = _Chain(image_path, img)
+    noisy_chain = _Chain(image_path, pipeline.to_depth(noisy, dtype))
+    clean_chain = _Chain(image_path, pipeline.to_depth(reference, dtype))
+
+    rows, thumbnails, steps_total = [], [], 0
+    for stages, point_params in points:
+        steps = _plan(stages, point_params)
+        steps_total += len(steps)
+        output, seconds = full.run(steps)
+        noisy_output = pipeline.to_float32(noisy_chain.run(steps)[0])
+        clean_stages = [stage for stage in stages if stage["stage"] != "denoise"]
+        target = pipeline.to_float32(clean_chain.run(_plan(clean_stages, point_params))[0])
+        rows.append({"score": autofilter.ssim(target, noisy_output), "psnr": autofilter.psnr(target, noisy_output),
+                     "entropy": entropy(output), "noise": autofilter.estimate_noise(output) * 255,
+                     "seconds": seconds})
+        if thumbnail_size:
+            thumbnails.append(pipeline.make_proxy(pipeline.to_uint8(output), thumbnail_size))
+    return {"image": image_path, "rows": rows, "thumbnails": thumbnails, "steps_computed": full.computed,
+            "steps_total": steps_total, "seconds": time.perf_counter() - start}
+
+
+def run_sweep(image_paths, stages, params, grid, workers=None, sheet_rows=SHEET_ROWS, sheet_size=SHEET_SIZE,
+              on_done=None):
+    """Varre a grade nas imagens, uma imagem por tarefa em um pool de processos.
+
+    Devolve um dicionário com os pontos ({nome: valor}), as etapas e os parâmetros de cada
+    ponto, as médias das métricas por ponto, as miniaturas das primeiras sheet_rows imagens
+    (uma lista por imagem, na ordem dos pontos), os passos calculados e o total sem
+    reaproveitamento, e o tempo total. on_done, se informado, é chamado com o caminho e o
+    tempo de cada imagem concluída.
+    """
+    params = pipeline.resolve_params(params)
+    points = grid_points(stages, params, grid)
+    configs = [apply_point(stages, params, point) for point in points]
+    workers = workers or os.cpu_count() or 1
+
+    start = time.perf_counter()
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=pipeline._init_worker, initargs=(None,)) as executor:
+        submitted = {executor.submit(sweep_image, path, configs, params, sheet_size if i < sheet_rows else 0): path
+                     for i, path in enumerate(image_paths)}
+        for future in as_completed(submitted):
+            path = submitted[future]
+            results[path] = future.result()
+            if on_done is not None:
+                on_done(path, results[path]["seconds"])
+
+    ordered = [results[path] for path in image_paths]
+    metrics = [{name: float(np.mean([result["rows"][index][name] for result in ordered])) for name in METRICS}
+               for index in range(len(points))]
+    return {
+        "points": points,
+        "configs": configs,
+        "metrics": metrics,
+        "thumbnails": [result["thumbnails"] for result in ordered if result["thumbnails"]],
+        "steps_computed": sum(result["steps_computed"] for result in ordered),
+        "steps_total": sum(result["steps_total"] for result in ordered),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def rank(metrics, metric="score"):
+    """Índices dos pontos, do melhor para o pior pela métrica escolhida"""
+    return sorted(range(len(metrics)), key=lambda index: metrics[index][metric], reverse=METRICS[metric])
+
+
+def contact_sheet(thumbnails, order, labels, size=SHEET_SIZE):
+    """Folha de miniaturas: uma linha por imagem e uma coluna por ponto, na ordem order"""
+    cell = size + 4
+    sheet = np.full((_LABEL_HEIGHT + cell * len(thumbnails), cell * len(order)), 255, dtype=np.uint8)
+    for column, index in enumerate(order):
+        x = column * cell
+        cv.putText(sheet, labels[index], (x + 2, _LABEL_HEIGHT - 6), cv.FONT_HERSHEY_SIMPLEX, 0.4, 0, 1,
+                   cv.LINE_AA)
+        for row, row_thumbnails in enumerate(thumbnails):
+            thumbnail = row_thumbnails[index]
+            y = _LABEL_HEIGHT + row * cell + (size - thumbnail.shape[0]) // 2
+            left = x + 2 + (size - thumbnail.shape[1]) // 2
+            sheet[y:y + thumbnail.shape[0], left:left + thumbnail.shape[1]] = thumbnail
+    return sheet
+
+
+def write_csv(path, points, metrics, order):
+    names = list(points[0]) if points else []
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["rank", "point"] + names + list(METRICS))
+        for position, index in enumerate(order, 1):
+            writer.writerow([position, index] + [points[index][name] for name in names]
+                            + [f"{metrics[index][name]:.6g}" for name in METRICS])
+
+
+def describe_point(point):
+    return ", ".join(f"{name}={value}" for name, value in point.items())
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m sweep", description="Varredura de parâmetros do pipeline")
+    parser.add_argument("in_dir", help="pasta com as imagens de amostra")
+    parser.add_argument("out_dir", help="pasta onde a tabela, as miniaturas e o melhor preset serão gravados")
+    parser.add_argument("--grid", action="append", default=[], metavar="NOME=V1,V2,...",
+                        help="valores de um parâmetro (de pipeline.DEFAULT_PARAMS ou de uma etapa, como "
+                             "filter, method, factor ou gamma); pode ser repetido")
+    parser.add_argument("--filter", choices=pipeline.FILTROS, default=pipeline.FILTROS[0],
+                        help="filtro de redução de ruído (padrão: %(default)s)")
+    parser.add_argument("--equalize", choices=pipeline.EQUALIZACOES, default=pipeline.EQUALIZACOES[0],
+                        help="equalização (padrão: %(default)s)")
+    parser.add_argument("--preset", default=None,
+                        help="lista de etapas salva pelo editor (ver graph.py); substitui --filter e --equalize")
+    parser.add_argument("--sample", type=int, default=0,
+                        help="usa só N imagens, espaçadas ao longo da pasta; 0 usa todas (padrão: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None, help="número de processos (padrão: um por núcleo)")
+    parser.add_argument("--keep-16bit", action="store_true", help="processa imagens de 16 bits sem reduzi-las para 8")
+    parser.add_argument("--rank-by", choices=tuple(METRICS), default="score",
+                        help="métrica que ordena os pontos e escolhe o melhor preset (padrão: %(default)s)")
+    parser.add_argument("--sheet-rows", type=int, default=SHEET_ROWS,
+                        help="imagens (linhas) na folha de miniaturas (padrão: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        grid = parse_grid(args.grid)
+        if args.preset:
+            stages = graph.load_preset(args.preset)
+        else:
+            stages = graph.stages_for(pipeline.FILTROS.index(args.filter), pipeline.EQUALIZACOES.index(args.equalize))
+    except (OSError, ValueError) as exc:
+        parser.error(str(exc))
+    if not grid:
+        parser.error("informe ao menos um --grid")
+
+    image_paths = pipeline.list_images(args.in_dir)
+    if args.sample and len(image_paths) > args.sample:
+        image_paths = image_paths[::len(image_paths) // args.sample][:args.sample]
+    if not image_paths:
+        print(f"Nenhuma imagem encontrada em {args.in_dir}", file=sys.stderr)
+        return 1
+
+    workers = min(args.workers or os.cpu_count() or 1, len(image_paths))
+    # Os processos já dividem os núcleos entre si; cada um usa só a sua parte para os blocos
+    params = {"keep_16bit": args.keep_16bit, "tile_workers": max(1, (os.cpu_count() or 1) // workers)}
+    done = 0
+
+    def on_done(image_path, seconds):
+        nonlocal done
+        done += 1
+        print(f"[{done}/{len(image_paths)}] {os.path.basename(image_path)} ({seconds:.2f} s)")
+
+    try:
+        result = run_sweep(image_paths, stages, params, grid, workers=workers, sheet_rows=args.sheet_rows,
+                           on_done=on_done)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    points, metrics = result["points"], result["metrics"]
+    order = rank(metrics, args.rank_by)
+    os.makedirs(args.out_dir, exist_ok=True)
+    write_csv(os.path.join(args.out_dir, "varredura.csv"), points, metrics, order)
+    if result["thumbnails"]:
+        labels = {index: f"{position}. #{index} {metrics[index][args.rank_by]:.3g}"
+                  for position, index in enumerate(order, 1)}
+        saving.write(os.path.join(args.out_dir, "miniaturas.png"),
+                     contact_sheet(result["thumbnails"], order, labels), pipeline.resolve_params())
+    best = order[0]
+    graph.save_preset(os.path.join(args.out_dir, "melhor_preset.json"), result["configs"][best][0],
+                      name=describe_point(points[best]))
+
+    reused = 1 - result["steps_computed"] / max(result["steps_total"], 1)
+    print(f"{len(points)} pontos x {len(image_paths)} imagens em {result['seconds']:.2f} s "
+          f"({workers} processos); {result['steps_computed']} de {result['steps_total']} passos calculados "
+          f"({reused:.0%} reaproveitados)")
+    for position, index in enumerate(order[:5], 1):
+        values = metrics[index]
+        print(f"{position}. #{index} nota {values['score']:.4f}, PSNR {values['psnr']:.2f} dB, "
+              f"entropia {values['entropy']:.2f}, ruído {values['noise']:.2f}, {values['seconds']:.3f} s: "
+              f"{describe_point(points[index])}")
+    print(f"Resultados gravados em {args.out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
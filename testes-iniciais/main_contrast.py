@@ -1,9 +1,16 @@
+import os
 import sys
 import cv2 as cv
-from PySide6.QtGui import QPixmap
 from PySide6.QtWidgets import QApplication, QMainWindow, QFileDialog, QListWidgetItem
 from ui_contrast_window import Ui_MainWindow
 
+"""O renderizador da pré-visualização (preview.py) fica na pasta do projeto, um nível acima"""
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import preview  # noqa: E402
+
+"""Lado da área de pré-visualização, em pixels"""
+PREVIEW_SIZE = 500
+
 
 class ImageEditor(QMainWindow):
     def __init__(self):
@@ -41,8 +48,7 @@ class ImageEditor(QMainWindow):
 
         """Atualiza a pré visualização da primeira imagem"""
         if self.selected_images:
-            pixmap = QPixmap(self.selected_images[0])
-            self.ui.imagePreview.setPixmap(pixmap)
+            preview.show_file(self.ui.imagePreview, self.selected_images[0], PREVIEW_SIZE)
 
     def apply_histogram(self):
         """Equaliza o histograma das imagens selecionadas"""
@@ -81,12 +87,8 @@ class ImageEditor(QMainWindow):
 
         """Pegar o caminho da imagem clicada"""
         image_path = item.text()
-        """Carregar a imagem"""
-        pixmap = QPixmap(image_path)
-        """Define no QLabel"""
-        self.ui.imagePreview.setPixmap(pixmap)
-        """Ajusta o tamanho ao QLabel"""
-        self.ui.imagePreview.setScaledContents(True)
+        """Carrega a imagem já reduzida ao tamanho do QLabel e ajusta a ele"""
+        preview.show_file(self.ui.imagePreview, image_path, PREVIEW_SIZE)
 
     def preview_filtered_image(self):
         """Se não houver nenhuma imagem filtrada, ele não dá retorno."""
@@ -96,13 +98,8 @@ class ImageEditor(QMainWindow):
         """Pega o caminho e a imagem filtrada mais recente"""
         last_image_path, last_filtered_image = list(self.filtered_images.items())[-1]
 
-        """Salva a imagem filtrada em um arquivo temporário para exibição"""
-        temp_path = "../temp_preview.png"
-        cv.imwrite(temp_path, last_filtered_image)
-
-        """Cria um QPixmap da imagem salva e ajusta para o tamanho da pré-visualização"""
-        pixmap = QPixmap(temp_path).scaled(600, 600)
-        self.ui.imagePreview.setPixmap(pixmap)
+        """Reduz a imagem filtrada ao tamanho da pré-visualização e exibe, sem arquivo temporário"""
+        preview.show(self.ui.imagePreview, last_filtered_image, PREVIEW_SIZE)
 
 
 if __name__ == "__main__":
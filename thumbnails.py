@@ -0,0 +1,99 @@
+"""Miniaturas das imagens selecionadas, geradas em segundo plano e guardadas em disco.
+
+Cada miniatura é decodificada já em tamanho reduzido (em JPEG, o próprio decodificador
+reduz a resolução em 2, 4 ou 8 vezes, sem montar a imagem inteira) e guardada no cache
+em disco pelo caminho, data de modificação e tamanho do arquivo; abrir de novo a mesma
+pasta só lê as miniaturas prontas.
+"""
+import os
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from PySide6.QtGui import QImage
+
+from cache import ResultCache, default_cache_dir, make_key
+from preview import decode_reduced, to_qimage
+
+"""Lado máximo das miniaturas da lista de imagens, em pixels"""
+THUMBNAIL_SIZE = 64
+
+"""Limite do cache de miniaturas em disco (cada uma ocupa cerca de 12 kB)"""
+THUMBNAIL_CACHE_BYTES = 256 * 1024 ** 2
+
+
+def thumbnail_cache_dir():
+    """Pasta das miniaturas, ao lado da pasta de resultados do pipeline"""
+    return os.path.join(os.path.dirname(default_cache_dir()), "miniaturas")
+
+
+class ThumbnailCache:
+    """Miniaturas guardadas em disco, identificadas pelo caminho e pelo estado do arquivo"""
+
+    def __init__(self, directory=None, max_bytes=THUMBNAIL_CACHE_BYTES, size=THUMBNAIL_SIZE):
+        self.size = size
+        self._cache = ResultCache(directory or thumbnail_cache_dir(), max_bytes)
+
+    def key(self, image_path):
+        stat = os.stat(image_path)
+        return make_key("miniatura", os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size, self.size)
+
+    def get(self, image_path):
+        """Miniatura BGR uint8 da imagem, lida do cache ou gerada e guardada"""
+        return self._cache.get_or_compute(self.key(image_path), lambda: decode_reduced(image_path, self.size))
+
+    def stats(self):
+        return self._cache.stats()
+
+
+class ThumbnailSignals(QObject):
+    """Sinais das tarefas de miniatura; são entregues na thread da interface"""
+    loaded = Signal(int, str, QImage)  # geração, caminho, miniatura
+
+
+class ThumbnailTask(QRunnable):
+    """Gera (ou lê do cache) a miniatura de uma imagem"""
+
+    def __init__(self, loader, generation, image_path):
+        super().__init__()
+        self.loader = loader
+        self.generation = generation
+        self.image_path = image_path
+
+    def run(self):
+        # Uma seleção nova torna as tarefas da anterior inúteis
+        if self.generation != self.loader.generation:
+            return
+        try:
+            thumbnail = self.loader.cache.get(self.image_path)
+        except (OSError, ValueError):
+            # Arquivo que não abre fica sem miniatura; o erro aparece se ele for processado
+            return
+        # O QImage atravessa threads pelo sinal, então leva uma cópia própria dos pixels
+        self.loader.signals.loaded.emit(self.generation, self.image_path, to_qimage(thumbnail).copy())
+
+
+class ThumbnailLoader(QObject):
+    """Carrega as miniaturas de uma seleção em um pool próprio, sem disputar com o processamento.
+
+    Cada chamada de load() começa uma nova geração: tarefas ainda na fila da seleção
+    anterior são descartadas e resultados que chegarem atrasados são ignorados.
+    """
+    loaded = Signal(str, QImage)  # caminho, miniatura
+
+    def __init__(self, cache=None, threads=2, parent=None):
+        super().__init__(parent)
+        self.cache = cache or ThumbnailCache()
+        self.generation = 0
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(threads)
+        self.signals = ThumbnailSignals()
+        self.signals.loaded.connect(self._on_loaded)
+
+    def load(self, image_paths):
+        self.generation += 1
+        self.pool.clear()
+        for image_path in image_paths:
+            self.pool.start(ThumbnailTask(self, self.generation, image_path))
+
+    def _on_loaded(self, generation, image_path, image):
+        if generation == self.generation:
+            self.loaded.emit(image_path, image)
@@ -0,0 +1,85 @@
+"""Leitura de TIFFs sem compressão direto do disco, com np.memmap.
+
+As imagens dos detectores costumam ser TIFFs de 16 bits, em tons de cinza, sem
+compressão e com as linhas gravadas em sequência. Nesse caso os pixels já estão no
+arquivo exatamente como em um array numpy, e memmap devolve um array que só lê do disco
+as partes acessadas: o processamento em blocos (ver tiling.process_tiled) lê um bloco de
+cada vez, sem carregar a imagem inteira na memória. Qualquer outra variante (compressão,
+blocos, vários canais, ordem de bytes diferente da máquina, BigTIFF) é lida pelo
+cv.imdecode, como as demais imagens.
+"""
+import struct
+
+import numpy as np
+
+"""Tamanho a partir do qual vale abrir um TIFF com memmap em vez de decodificá-lo inteiro"""
+MMAP_MIN_BYTES = 64 * 1024 ** 2
+
+"""Tags do TIFF usadas aqui"""
+_WIDTH, _HEIGHT, _BITS, _COMPRESSION, _PHOTOMETRIC = 256, 257, 258, 259, 262
+_STRIP_OFFSETS, _SAMPLES, _STRIP_COUNTS, _TILE_WIDTH, _SAMPLE_FORMAT = 273, 277, 279, 322, 339
+
+"""Tipos de valor das tags: código -> formato do struct (SHORT e LONG)"""
+_TYPES = {3: "H", 4: "I"}
+
+
+def _read_tags(file):
+    """Tags da primeira imagem do arquivo, {tag: valores}; None se não for um TIFF clássico"""
+    header = file.read(8)
+    if header[:4] == b"II*\0":
+        order = "<"
+    elif header[:4] == b"MM\0*":
+        order = ">"
+    else:
+        return None, None
+    (ifd_offset,) = struct.unpack(order + "I", header[4:])
+    file.seek(ifd_offset)
+    (count,) = struct.unpack(order + "H", file.read(2))
+    entries = file.read(12 * count)
+
+    tags = {}
+    for index in range(count):
+        tag, value_type, n, value = struct.unpack(order + "HHI4s", entries[12 * index:12 * index + 12])
+        if value_type not in _TYPES:
+            continue
+        size = struct.calcsize(_TYPES[value_type]) * n
+        if size > 4:
+            # Valores que não cabem na entrada ficam em outro ponto do arquivo
+            file.seek(struct.unpack(order + "I", value)[0])
+            value = file.read(size)
+        tags[tag] = struct.unpack(f"{order}{n}{_TYPES[value_type]}", value[:size])
+    return order, tags
+
+
+def memmap(path):
+    """Array somente leitura com os pixels de um TIFF simples, ou None se o arquivo não for desse tipo.
+
+    Simples: um canal de 8 ou 16 bits sem sinal, sem compressão, preto no zero, em faixas
+    (strips) gravadas uma logo depois da outra e na ordem de bytes desta máquina.
+    """
+    try:
+        with open(path, "rb") as file:
+            order, tags = _read_tags(file)
+    except (OSError, struct.error):
+        return None
+    if tags is None or _TILE_WIDTH in tags:
+        return None
+
+    try:
+        width, height = tags[_WIDTH][0], tags[_HEIGHT][0]
+        offsets, counts = tags[_STRIP_OFFSETS], tags[_STRIP_COUNTS]
+    except KeyError:
+        return None
+    bits = tags.get(_BITS, (1,))[0]
+    if (bits not in (8, 16) or tags.get(_SAMPLES, (1,))[0] != 1 or tags.get(_COMPRESSION, (1,))[0] != 1
+            or tags.get(_PHOTOMETRIC, (1,))[0] != 1 or tags.get(_SAMPLE_FORMAT, (1,))[0] != 1):
+        return None
+    if any(offset + count != following for offset, count, following in zip(offsets, counts, offsets[1:])):
+        return None
+    dtype = np.dtype(order + ("u1" if bits == 8 else "u2"))
+    if not dtype.isnative and dtype.itemsize > 1:
+        # O OpenCV só trabalha na ordem de bytes da máquina; converter exigiria ler tudo
+        return None
+    if sum(counts) < width * height * dtype.itemsize:
+        return None
+    return np.memmap(path, dtype=dtype.newbyteorder("="), mode="r", offset=offsets[0], shape=(height, width))
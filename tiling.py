@@ -0,0 +1,76 @@
+"""Processamento de imagens grandes em blocos (tiles) com margem de sobreposição (halo).
+
+Cada bloco é processado junto com uma margem de pixels vizinhos e só o seu interior é
+copiado para a saída, então filtros de vizinhança limitada (mediana, difusão anisotrópica)
+dão o mesmo resultado da imagem inteira, sem emendas; só a faixa junto à borda externa da
+imagem pode variar, porque depende do tratamento de borda de cada filtro. A memória
+intermediária de cada filtro fica limitada ao tamanho do bloco, e os blocos podem ser
+processados em paralelo.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+
+def iter_tiles(shape, tile_size, halo):
+    """Gera (região na saída, região lida com halo, interior dentro do bloco lido)"""
+    height, width = shape[:2]
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            bottom = min(top + tile_size, height)
+            right = min(left + tile_size, width)
+
+            read_top, read_left = max(top - halo, 0), max(left - halo, 0)
+            read_bottom, read_right = min(bottom + halo, height), min(right + halo, width)
+
+            out_region = (slice(top, bottom), slice(left, right))
+            read_region = (slice(read_top, read_bottom), slice(read_left, read_right))
+            inner = (slice(top - read_top, bottom - read_top), slice(left - read_left, right - read_left))
+            yield out_region, read_region, inner
+
+
+def process_tiled(img, func, tile_size=1024, halo=16, workers=None, out_dtype=None):
+    """Aplica func a cada bloco (com halo) e monta o resultado.
+
+    func recebe um bloco 2D e devolve um array do mesmo tamanho. Só os blocos em
+    processamento e a imagem de saída ficam em memória; img pode ser um memmap, e
+    cada bloco é lido apenas quando chega a sua vez.
+    """
+    workers = workers or os.cpu_count() or 1
+    tiles = list(iter_tiles(img.shape, tile_size, halo))
+    out = None
+
+    def run(tile):
+        out_region, read_region, inner = tile
+        result = func(np.ascontiguousarray(img[read_region]))
+        return out_region, result[inner]
+
+    def store(out_region, result):
+        nonlocal out
+        if out is None:
+            # O tipo da saída é o do primeiro bloco processado, a não ser que out_dtype seja informado
+            out = np.empty(img.shape[:2], dtype=out_dtype or result.dtype)
+        out[out_region] = result
+
+    if workers == 1 or len(tiles) == 1:
+        for tile in tiles:
+            store(*run(tile))
+        return out
+
+    pending = iter(tiles)
+    in_flight = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # No máximo dois blocos por thread ficam em memória ao mesmo tempo
+        for tile in pending:
+            in_flight.add(executor.submit(run, tile))
+            if len(in_flight) >= 2 * workers:
+                break
+        while in_flight:
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                store(*future.result())
+                tile = next(pending, None)
+                if tile is not None:
+                    in_flight.add(executor.submit(run, tile))
+    return out
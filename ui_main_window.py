@@ -64,6 +64,7 @@ class Ui_mainWindow(object):
         self.filterBox.addItem("")
         self.filterBox.addItem("")
         self.filterBox.addItem("")
+        self.filterBox.addItem("")
         self.filterBox.setObjectName(u"filterBox")
         self.filterBox.setGeometry(QRect(710, 400, 231, 23))
         self.filterBox.setFont(font1)
@@ -130,6 +131,7 @@ class Ui_mainWindow(object):
         self.filterBox.setItemText(1, QCoreApplication.translate("mainWindow", u"Filtro de Wiener", None))
         self.filterBox.setItemText(2, QCoreApplication.translate("mainWindow", u"Filtro de Mediana", None))
         self.filterBox.setItemText(3, QCoreApplication.translate("mainWindow", u"Difus\u00e3o Anisotr\u00f3pica", None))
+        self.filterBox.setItemText(4, QCoreApplication.translate("mainWindow", u"Autom\u00e1tico", None))
 
         self.groupBox_3.setTitle(QCoreApplication.translate("mainWindow", u"Com ajuste de contraste", None))
         self.imgEqualizada.setText(QCoreApplication.translate("mainWindow", u"Equalizada", None))
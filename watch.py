@@ -0,0 +1,238 @@
+"""Pasta monitorada: processa as imagens à medida que elas chegam em uma pasta.
+
+As estações de aquisição gravam as imagens em uma pasta compartilhada. A pasta é lida a
+cada poucos instantes, e uma imagem só entra na fila depois que o seu tamanho e a sua
+data de modificação ficam parados por `settle` segundos; arquivos que ainda estão sendo
+copiados esperam. Cada imagem é processada e gravada por um pool de processos, como em
+pipeline.run_batch, e o tempo entre a chegada e a gravação (latência) é acompanhado.
+
+    python -m pipeline pasta_entrada pasta_saida --watch --filter median --equalize clahe
+
+Parâmetros calculados sobre o lote inteiro (histograma ou estimativa de ruído
+compartilhados, ver pipeline.batch_params) não se aplicam a uma pasta que não para de
+receber imagens; aqui cada imagem usa os seus.
+"""
+import math
+import os
+import time
+from collections import deque
+import signal
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+import pipeline
+
+"""Intervalo entre leituras da pasta e tempo sem mudanças para um arquivo ser considerado completo, em segundos"""
+DEFAULT_INTERVAL = 0.5
+DEFAULT_SETTLE = 1.0
+
+"""Número de imagens recentes usadas nas estatísticas de latência"""
+_LATENCY_WINDOW = 200
+
+
+class FolderWatcher:
+    """Encontra imagens novas e completas em uma pasta, lendo a pasta periodicamente.
+
+    A leitura periódica funciona também em pastas de rede, onde as notificações do
+    sistema de arquivos não são confiáveis. Uma imagem já gravada em out_dir depois da
+    última modificação da entrada é considerada processada (retomar o monitoramento não
+    refaz a pasta toda); uma imagem sobrescrita na entrada é processada de novo. Uma imagem
+    que seria gravada no mesmo arquivo de saída de outra ainda presente na pasta (scan.png
+    e scan.jpg com um formato escolhido) não é entregue: vai para take_conflicts.
+    """
+
+    def __init__(self, in_dir, out_dir=None, settle=DEFAULT_SETTLE, output_format="original"):
+        self.in_dir = in_dir
+        self.out_dir = out_dir
+        self.settle = settle
+        self.output_format = output_format
+        # caminho -> (tamanho, modificação, quando apareceu, desde quando está parado)
+        self._candidates = {}
+        # (caminho, tamanho, modificação) das imagens já entregues que ainda estão na pasta
+        self._delivered = set()
+        # Arquivo de saída -> imagem de entrada que o ocupa, e as entradas recusadas por conflito
+        self._outputs = {}
+        self._conflicts = []
+
+    def take_conflicts(self):
+        """Imagens recusadas desde a última chamada, por conflito de saída: [(caminho, mensagem)]"""
+        conflicts, self._conflicts = self._conflicts, []
+        return conflicts
+
+    def _already_processed(self, image_path, stat):
+        if not self.out_dir:
+            return False
+        try:
+            output = os.stat(pipeline.output_path_for(self.out_dir, image_path, self.output_format))
+        except OSError:
+            return False
+        return output.st_mtime_ns >= stat.st_mtime_ns
+
+    def poll(self, now=None):
+        """Imagens que ficaram completas desde a última leitura: [(caminho, quando apareceu)]"""
+        now = time.monotonic() if now is None else now
+        try:
+            entries = list(os.scandir(self.in_dir))
+        except OSError:
+            # Pasta de rede fora do ar: tenta de novo na próxima leitura
+            return []
+
+        ready = []
+        present = set()
+        for entry in entries:
+            if not entry.name.lower().endswith(pipeline.EXTENSOES):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            present.add(entry.path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if (entry.path, *signature) in self._delivered:
+                continue
+
+            candidate = self._candidates.get(entry.path)
+            if candidate is None or candidate[:2] != signature:
+                # Arquivo novo ou ainda mudando: o tempo parado recomeça a contar
+                arrived = candidate[2] if candidate else now
+                self._candidates[entry.path] = (*signature, arrived, now)
+                continue
+            if stat.st_size == 0 or now - candidate[3] < self.settle:
+                continue
+
+            del self._candidates[entry.path]
+            self._delivered.add((entry.path, *signature))
+            output = pipeline.output_path_for(self.out_dir or "", entry.path, self.output_format)
+            owner = self._outputs.setdefault(os.path.normcase(output), entry.path)
+            if owner != entry.path:
+                self._conflicts.append((entry.path, f"seria gravada em {os.path.basename(output)}, "
+                                                    f"a saída de {os.path.basename(owner)}"))
+                continue
+            if not self._already_processed(entry.path, stat):
+                ready.append((entry.path, candidate[2]))
+
+        # Arquivos apagados ou renomeados antes de ficarem completos
+        for image_path in self._candidates.keys() - present:
+            del self._candidates[image_path]
+        # Imagens que saíram da pasta: esquecidas, para a memória não crescer com pastas que giram por
+        # dias; as saídas delas ficam livres para outra entrada
+        self._delivered = {delivered for delivered in self._delivered if delivered[0] in present}
+        self._outputs = {output: owner for output, owner in self._outputs.items() if owner in present}
+        return sorted(ready)
+
+
+class WatchStats:
+    """Profundidade da fila, imagens concluídas e latências do modo monitorado"""
+
+    def __init__(self):
+        self.queued = 0
+        self.in_flight = 0
+        self.done = 0
+        self.failed = 0
+        self._latencies = deque(maxlen=_LATENCY_WINDOW)
+        self._seconds = deque(maxlen=_LATENCY_WINDOW)
+
+    def record(self, latency, seconds):
+        """Registra uma imagem gravada: latência desde a chegada e tempo de processamento"""
+        self.done += 1
+        self._latencies.append(latency)
+        self._seconds.append(seconds)
+
+    def snapshot(self):
+        latencies = sorted(self._latencies)
+        return {
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "done": self.done,
+            "failed": self.failed,
+            "latency_mean": sum(latencies) / len(latencies) if latencies else 0.0,
+            "latency_p95": latencies[math.ceil(0.95 * len(latencies)) - 1] if latencies else 0.0,
+            "latency_max": latencies[-1] if latencies else 0.0,
+            "seconds_mean": sum(self._seconds) / len(self._seconds) if self._seconds else 0.0,
+        }
+
+
+def describe(snapshot):
+    """Linha de estado do monitoramento, para a barra de status ou o terminal"""
+    return (f"Fila: {snapshot['queued']}, em processamento: {snapshot['in_flight']}, "
+            f"concluídas: {snapshot['done']}, com erro: {snapshot['failed']} - latência média "
+            f"{snapshot['latency_mean']:.2f} s, p95 {snapshot['latency_p95']:.2f} s, "
+            f"máxima {snapshot['latency_max']:.2f} s")
+
+
+def _init_worker(cache_settings):
+    # O Ctrl+C chega a todo o grupo de processos; quem para é o processo principal, que espera
+    # as imagens já enviadas terminarem
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    pipeline._init_worker(cache_settings)
+
+
+def watch_folder(in_dir, out_dir, filtro_index, equalizacao_index, params=None, workers=None,
+                 max_in_flight=None, cache_settings=None, interval=DEFAULT_INTERVAL, settle=DEFAULT_SETTLE,
+                 on_done=None, on_error=None, on_status=None, should_stop=None):
+    """Monitora in_dir e processa cada imagem completa assim que ela aparece, até should_stop().
+
+    No máximo max_in_flight imagens (padrão: 2 por processo) ficam enviadas ao pool; as
+    demais esperam na fila. on_done é chamado com o caminho, a latência e o tempo de
+    processamento de cada imagem gravada, on_error com o caminho e a mensagem de erro e
+    on_status com as estatísticas (WatchStats.snapshot) a cada leitura da pasta. Sem
+    should_stop, roda até ser interrompido (Ctrl+C); as imagens já enviadas terminam e são
+    informadas como as outras, e as que ainda estavam na fila aparecem em "queued".
+    Devolve as estatísticas finais.
+    """
+    if os.path.abspath(in_dir) == os.path.abspath(out_dir):
+        raise ValueError("A pasta de saída precisa ser diferente da pasta monitorada")
+    os.makedirs(out_dir, exist_ok=True)
+    params = pipeline.resolve_params(params)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max(max_in_flight or 2 * workers, 1)
+    watcher = FolderWatcher(in_dir, out_dir, settle, params["output_format"])
+    stats = WatchStats()
+    queue = deque()
+    in_flight = {}
+
+    def collect(finished):
+        for future in finished:
+            image_path, arrived = in_flight.pop(future)
+            try:
+                _, seconds, *_ = future.result()
+            except Exception as exc:
+                stats.failed += 1
+                if on_error:
+                    on_error(image_path, str(exc))
+                continue
+            latency = time.monotonic() - arrived
+            stats.record(latency, seconds)
+            if on_done:
+                on_done(image_path, latency, seconds)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cache_settings,)) as executor:
+        try:
+            while not (should_stop and should_stop()):
+                queue.extend(watcher.poll())
+                for image_path, message in watcher.take_conflicts():
+                    stats.failed += 1
+                    if on_error:
+                        on_error(image_path, message)
+                while queue and len(in_flight) < max_in_flight:
+                    image_path, arrived = queue.popleft()
+                    future = executor.submit(pipeline._process_and_save_task, [image_path], out_dir,
+                                             filtro_index, equalizacao_index, params)
+                    in_flight[future] = (image_path, arrived)
+                stats.queued, stats.in_flight = len(queue), len(in_flight)
+                if on_status:
+                    on_status(stats.snapshot())
+
+                # Espera o próximo resultado ou a próxima leitura da pasta, o que vier primeiro
+                if not in_flight:
+                    time.sleep(interval)
+                    continue
+                finished, _ = wait(in_flight, timeout=interval, return_when=FIRST_COMPLETED)
+                collect(finished)
+        except KeyboardInterrupt:
+            pass
+        # As imagens já enviadas terminam e entram nas estatísticas; as da fila ficam como pendentes
+        collect(list(as_completed(in_flight)))
+
+    stats.queued, stats.in_flight = len(queue), 0
+    return stats.snapshot()
@@ -0,0 +1,498 @@
+"""Processamento em segundo plano para a interface, usando QThreadPool.
+
+Cada imagem é uma tarefa (QRunnable); os resultados voltam para a thread da
+interface por sinais Qt, assim a janela continua respondendo durante o lote.
+A gravação de imagens já processadas (SaveProcessor) e o monitoramento de uma pasta
+(FolderMonitor) seguem o mesmo modelo.
+"""
+import os
+import time
+from collections import deque
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, QTimer, Signal
+
+import pipeline
+import saving
+import watch
+
+
+class BatchSignals(QObject):
+    """Sinais emitidos pelas tarefas; são entregues na thread da interface"""
+    # caminho, filtrada, equalizada, segundos, (bytes gravados, segundos codificando) ou None
+    image_done = Signal(str, object, object, float, object)
+    image_failed = Signal(str, str)  # caminho, mensagem de erro
+    image_skipped = Signal(str)  # caminho (lote cancelado antes de começar)
+
+
+class BatchParamsSignals(QObject):
+    finished = Signal(object, str)  # parâmetros do lote (None em caso de erro), mensagem de erro
+
+
+class BatchParamsTask(QRunnable):
+    """Calcula os parâmetros do lote (ver pipeline.batch_params), que podem ler todas as imagens"""
+
+    def __init__(self, batch):
+        super().__init__()
+        self.batch = batch
+        self.signals = BatchParamsSignals()
+
+    def run(self):
+        batch = self.batch
+        try:
+            params = pipeline.batch_params(batch.image_paths, batch.filtro_index, batch.equalizacao_index,
+                                           batch.params, memo=batch.memo)
+        except Exception as exc:
+            self.signals.finished.emit(None, str(exc))
+        else:
+            self.signals.finished.emit(params, "")
+
+
+class ImageTask(QRunnable):
+    """Processa uma única imagem com o filtro e a equalização escolhidos"""
+
+    def __init__(self, batch, image_path):
+        super().__init__()
+        self.batch = batch
+        self.image_path = image_path
+        self.signals = batch.signals
+
+    def run(self):
+        if self.batch.cancelled:
+            self.signals.image_skipped.emit(self.image_path)
+            return
+        start = time.perf_counter()
+        saved = None
+        try:
+            if self.batch.out_dir:
+                filtered, equalized, saved = pipeline.process_and_save(self.image_path, self.batch.out_dir,
+                                                                self.batch.filtro_index,
+                                                                self.batch.equalizacao_index, self.batch.task_params)
+                # No modo streaming só a imagem de pré-visualização volta para a interface
+                if self.image_path != self.batch.preview_path:
+                    filtered = equalized = None
+            else:
+                filtered, equalized = pipeline.process_image(self.image_path, self.batch.filtro_index,
+                                                             self.batch.equalizacao_index, self.batch.task_params,
+                                                             memo=self.batch.memo)
+        except Exception as exc:
+            self.signals.image_failed.emit(self.image_path, str(exc))
+        else:
+            self.signals.image_done.emit(self.image_path, filtered, equalized, time.perf_counter() - start, saved)
+
+
+class BatchProcessor(QObject):
+    """Distribui um lote de imagens pelo QThreadPool e acompanha o progresso.
+
+    Se out_dir for informado, cada imagem é salva assim que fica pronta (modo streaming)
+    e apenas a imagem preview_path é devolvida pelo sinal result; as demais chegam com
+    None no lugar das imagens. Em qualquer modo, no máximo max_in_flight tarefas são
+    enviadas ao pool ao mesmo tempo. memo (pipeline.StageMemo) permite reaproveitar as
+    etapas que não mudaram desde o último lote. Os parâmetros do lote são calculados antes,
+    também no pool (ver BatchParamsTask). Com out_dir, levanta ValueError se duas imagens
+    fossem gravadas no mesmo arquivo (ver saving.check_outputs).
+    """
+    result = Signal(str, object, object)  # caminho, filtrada, equalizada
+    progress = Signal(int, int, float)  # concluídas, total, imagens/s
+    finished = Signal(dict)  # estatísticas do lote
+
+    def __init__(self, image_paths, filtro_index, equalizacao_index, params=None, memo=None, out_dir=None,
+                 preview_path=None, max_in_flight=None, pool=None, parent=None):
+        super().__init__(parent)
+        self.image_paths = list(image_paths)
+        self.filtro_index = filtro_index
+        self.equalizacao_index = equalizacao_index
+        self.params = pipeline.resolve_params(params)
+        if out_dir:
+            saving.check_outputs(out_dir, self.image_paths, self.params["output_format"])
+        # Parâmetros efetivos das tarefas (ver pipeline.batch_params), definidos depois de start()
+        self.task_params = self.params
+        self.memo = memo
+        self.out_dir = out_dir
+        self.preview_path = preview_path
+        self.pool = pool or QThreadPool.globalInstance()
+        self.max_in_flight = max(max_in_flight or 2 * self.pool.maxThreadCount(), 1)
+        self.cancelled = False
+
+        self.pending = iter(self.image_paths)
+        self.done = 0
+        self.image_seconds = {}
+        self.bytes_written = 0
+        self.encode_seconds = 0.0
+        self.failed = []
+        self.skipped = 0
+        self.start_time = None
+        self.cache_start = None
+
+        # Os sinais são criados na thread da interface, então as conexões abaixo são enfileiradas
+        self.signals = BatchSignals()
+        self.signals.image_done.connect(self._on_image_done)
+        self.signals.image_failed.connect(self._on_image_failed)
+        self.signals.image_skipped.connect(self._on_image_skipped)
+
+    @property
+    def total(self):
+        return len(self.image_paths)
+
+    @property
+    def running(self):
+        return self.start_time is not None and self._finished_count() < self.total
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        if self.out_dir:
+            os.makedirs(self.out_dir, exist_ok=True)
+        # O histograma compartilhado lê e filtra todas as imagens: as tarefas só começam depois, fora
+        # da thread da interface
+        # A referência mantém os sinais da tarefa vivos até a resposta chegar
+        self.params_task = BatchParamsTask(self)
+        self.params_task.signals.finished.connect(self._on_params_ready)
+        self.pool.start(self.params_task)
+
+    def _on_params_ready(self, params, message):
+        if params is None:
+            self.failed = [(image_path, message) for image_path in self.image_paths]
+            self.pending = iter(())
+            self._report()
+            return
+        self.task_params = params
+        cache = pipeline.get_cache()
+        self.cache_start = cache.stats() if cache else None
+        if self.cancelled:
+            self._report()
+            return
+        for _ in range(self.max_in_flight):
+            self._submit_next()
+
+    def cancel(self):
+        """Tarefas que ainda não começaram são descartadas; as que estão rodando terminam normalmente"""
+        self.cancelled = True
+
+    def images_per_sec(self):
+        elapsed = time.perf_counter() - self.start_time
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def _submit_next(self):
+        image_path = next(self.pending, None)
+        if image_path is not None:
+            self.pool.start(ImageTask(self, image_path))
+
+    def _finished_count(self):
+        return self.done + len(self.failed) + self.skipped
+
+    def _on_image_done(self, image_path, filtered, equalized, seconds, saved):
+        self.done += 1
+        self.image_seconds[image_path] = seconds
+        if saved is not None:
+            self.bytes_written += saved[0]
+            self.encode_seconds += saved[1]
+        self.result.emit(image_path, filtered, equalized)
+        self._report()
+
+    def _on_image_failed(self, image_path, message):
+        self.failed.append((image_path, message))
+        self._report()
+
+    def _on_image_skipped(self, image_path):
+        self.skipped += 1
+        self._report()
+
+    def _report(self):
+        if self.cancelled:
+            # Imagens que nem chegaram a ser enviadas ao pool contam como puladas
+            self.skipped += sum(1 for _ in self.pending)
+        else:
+            self._submit_next()
+
+        self.progress.emit(self._finished_count(), self.total, self.images_per_sec())
+        if self._finished_count() == self.total:
+            elapsed = time.perf_counter() - self.start_time
+            cache_hits = cache_misses = 0
+            cache = pipeline.get_cache()
+            if cache and self.cache_start:
+                # O cache é compartilhado pelas threads; conta só o que mudou durante este lote
+                cache_stats = cache.stats()
+                cache_hits = cache_stats["hits"] - self.cache_start["hits"]
+                cache_misses = cache_stats["misses"] - self.cache_start["misses"]
+            self.finished.emit({
+                "images": self.done,
+                "failed": self.failed,
+                "skipped": self.skipped,
+                "cancelled": self.cancelled,
+                "out_dir": self.out_dir,
+                "seconds": elapsed,
+                "images_per_sec": self.done / elapsed if elapsed > 0 else 0.0,
+                "image_seconds": self.image_seconds,
+                "bytes_written": self.bytes_written,
+                "encode_seconds": self.encode_seconds,
+                "cache_hits": cache_hits,
+                "cache_misses": cache_misses,
+            })
+
+
+class WarmUpSignals(QObject):
+    finished = Signal()
+
+
+class WarmUpTask(QRunnable):
+    """Carrega em segundo plano o que o primeiro processamento usaria (ver pipeline.warm_up)"""
+
+    def __init__(self):
+        super().__init__()
+        self.signals = WarmUpSignals()
+
+    def run(self):
+        try:
+            pipeline.warm_up()
+        finally:
+            self.signals.finished.emit()
+
+
+class ProxySignals(QObject):
+    loaded = Signal(str, object)  # caminho, imagem reduzida
+    failed = Signal(str, str)  # caminho, mensagem de erro
+
+
+class ProxyTask(QRunnable):
+    """Lê e reduz a imagem da pré-visualização (ver pipeline.load_proxy) fora da thread da interface"""
+
+    def __init__(self, signals, image_path, dtype):
+        super().__init__()
+        self.signals = signals
+        self.image_path = image_path
+        self.dtype = dtype
+
+    def run(self):
+        try:
+            proxy = pipeline.load_proxy(self.image_path, dtype=self.dtype)
+        except Exception as exc:
+            self.signals.failed.emit(self.image_path, str(exc))
+        else:
+            self.signals.loaded.emit(self.image_path, proxy)
+
+
+class SaveSignals(QObject):
+    """Sinais das tarefas de gravação; são entregues na thread da interface"""
+    image_saved = Signal(str, int, float)  # caminho, bytes gravados, segundos codificando
+    image_failed = Signal(str, str)  # caminho, mensagem de erro
+    image_skipped = Signal(str)  # caminho (gravação cancelada antes de começar)
+
+
+class SaveTask(QRunnable):
+    """Codifica e grava uma imagem já processada"""
+
+    def __init__(self, saver, image_path, img):
+        super().__init__()
+        self.saver = saver
+        self.image_path = image_path
+        self.img = img
+        self.signals = saver.signals
+
+    def run(self):
+        if self.saver.cancelled:
+            self.signals.image_skipped.emit(self.image_path)
+            return
+        try:
+            written, encode_seconds = pipeline.save_result(self.saver.save_dir, self.image_path, self.img,
+                                                           self.saver.params)
+        except Exception as exc:
+            self.signals.image_failed.emit(self.image_path, str(exc))
+        else:
+            self.signals.image_saved.emit(self.image_path, written, encode_seconds)
+
+
+class SaveProcessor(QObject):
+    """Grava em segundo plano imagens já processadas, usando o QThreadPool.
+
+    images é um dicionário {caminho de entrada: imagem}; o formato e as opções de
+    gravação vêm de params (ver saving.py). A codificação do OpenCV libera o GIL, então
+    as imagens são codificadas em paralelo nas threads do pool. Levanta ValueError se duas
+    imagens fossem gravadas no mesmo arquivo (ver saving.check_outputs).
+    """
+    progress = Signal(int, int, float)  # concluídas, total, MB/s gravados
+    finished = Signal(dict)  # estatísticas da gravação
+
+    def __init__(self, images, save_dir, params=None, pool=None, parent=None):
+        super().__init__(parent)
+        self.images = dict(images)
+        self.save_dir = save_dir
+        self.params = pipeline.resolve_params(params)
+        saving.check_outputs(save_dir, self.images, self.params["output_format"])
+        self.pool = pool or QThreadPool.globalInstance()
+        self.cancelled = False
+
+        self.done = 0
+        self.failed = []
+        self.skipped = 0
+        self.bytes_written = 0
+        self.encode_seconds = 0.0
+        self.start_time = None
+
+        self.signals = SaveSignals()
+        self.signals.image_saved.connect(self._on_image_saved)
+        self.signals.image_failed.connect(self._on_image_failed)
+        self.signals.image_skipped.connect(self._on_image_skipped)
+
+    @property
+    def total(self):
+        return len(self.images)
+
+    @property
+    def running(self):
+        return self.start_time is not None and self._finished_count() < self.total
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        os.makedirs(self.save_dir, exist_ok=True)
+        if not self.images:
+            self._report()
+        # As imagens já estão em memória, então todas podem ir para a fila do pool de uma vez
+        for image_path, img in self.images.items():
+            self.pool.start(SaveTask(self, image_path, img))
+
+    def cancel(self):
+        """Imagens que ainda não começaram a ser gravadas são descartadas"""
+        self.cancelled = True
+
+    def _finished_count(self):
+        return self.done + len(self.failed) + self.skipped
+
+    def _on_image_saved(self, image_path, written, encode_seconds):
+        self.done += 1
+        self.bytes_written += written
+        self.encode_seconds += encode_seconds
+        self._report()
+
+    def _on_image_failed(self, image_path, message):
+        self.failed.append((image_path, message))
+        self._report()
+
+    def _on_image_skipped(self, image_path):
+        self.skipped += 1
+        self._report()
+
+    def _report(self):
+        elapsed = time.perf_counter() - self.start_time
+        megabytes_per_sec = self.bytes_written / 1024 ** 2 / elapsed if elapsed > 0 else 0.0
+        self.progress.emit(self._finished_count(), self.total, megabytes_per_sec)
+        if self._finished_count() == self.total:
+            self.finished.emit({
+                "images": self.done,
+                "failed": self.failed,
+                "skipped": self.skipped,
+                "cancelled": self.cancelled,
+                "save_dir": self.save_dir,
+                "seconds": elapsed,
+                "bytes_written": self.bytes_written,
+                "encode_seconds": self.encode_seconds,
+                "images_per_sec": self.done / elapsed if elapsed > 0 else 0.0,
+            })
+
+
+class FolderMonitor(QObject):
+    """Monitora uma pasta e processa cada imagem nova no QThreadPool assim que ela fica completa.
+
+    A pasta é lida por um QTimer na thread da interface (ver watch.FolderWatcher); as
+    imagens prontas vão para uma fila e no máximo max_in_flight ficam no pool ao mesmo
+    tempo. Cada imagem é processada e gravada em out_dir por um ImageTask, como no modo
+    streaming do BatchProcessor. O sinal status traz a profundidade da fila e as
+    latências (watch.WatchStats.snapshot) a cada leitura e a cada imagem concluída.
+    """
+    status = Signal(dict)
+    image_saved = Signal(str, float)  # caminho, latência desde a chegada
+    image_failed = Signal(str, str)  # caminho, mensagem de erro
+
+    def __init__(self, in_dir, out_dir, filtro_index, equalizacao_index, params=None, max_in_flight=None,
+                 interval=watch.DEFAULT_INTERVAL, settle=watch.DEFAULT_SETTLE, pool=None, parent=None):
+        super().__init__(parent)
+        if os.path.abspath(in_dir) == os.path.abspath(out_dir):
+            raise ValueError("A pasta de saída precisa ser diferente da pasta monitorada")
+        self.in_dir = in_dir
+        self.out_dir = out_dir
+        self.filtro_index = filtro_index
+        self.equalizacao_index = equalizacao_index
+        # Atributos lidos pelo ImageTask; cada imagem usa os próprios parâmetros (ver watch.py)
+        self.params = self.task_params = pipeline.resolve_params(params)
+        self.memo = None
+        self.preview_path = None
+        self.cancelled = False
+        self.pool = pool or QThreadPool.globalInstance()
+        self.max_in_flight = max(max_in_flight or 2 * self.pool.maxThreadCount(), 1)
+
+        self.watcher = watch.FolderWatcher(in_dir, out_dir, settle, self.params["output_format"])
+        self.stats = watch.WatchStats()
+        self.queue = deque()
+        # Chegadas das imagens em processamento, por caminho: um arquivo regravado pode voltar à fila
+        # com a primeira versão ainda rodando
+        self.arrivals = {}
+        self.in_flight = 0
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(int(interval * 1000))
+        self.timer.timeout.connect(self._poll)
+
+        self.signals = BatchSignals()
+        self.signals.image_done.connect(self._on_image_done)
+        self.signals.image_failed.connect(self._on_image_failed)
+        self.signals.image_skipped.connect(self._on_image_skipped)
+
+    @property
+    def running(self):
+        return self.timer.isActive()
+
+    def start(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.timer.start()
+        self._poll()
+
+    def stop(self):
+        """Para de ler a pasta; imagens na fila são descartadas e as que estão rodando terminam"""
+        self.timer.stop()
+        self.cancelled = True
+        self.queue.clear()
+        self._report()
+
+    def _poll(self):
+        self.queue.extend(self.watcher.poll())
+        for image_path, message in self.watcher.take_conflicts():
+            self.stats.failed += 1
+            self.image_failed.emit(image_path, message)
+        self._submit()
+        self._report()
+
+    def _submit(self):
+        while self.queue and self.in_flight < self.max_in_flight and not self.cancelled:
+            image_path, arrived = self.queue.popleft()
+            self.arrivals.setdefault(image_path, deque()).append(arrived)
+            self.in_flight += 1
+            self.pool.start(ImageTask(self, image_path))
+
+    def _finish(self, image_path):
+        # As tarefas de um mesmo caminho terminam em geral na ordem em que foram enviadas
+        self.in_flight -= 1
+        arrivals = self.arrivals[image_path]
+        arrived = arrivals.popleft()
+        if not arrivals:
+            del self.arrivals[image_path]
+        return arrived
+
+    def _report(self):
+        self.stats.queued, self.stats.in_flight = len(self.queue), self.in_flight
+        self.status.emit(self.stats.snapshot())
+
+    def _on_image_done(self, image_path, filtered, equalized, seconds, saved):
+        latency = time.monotonic() - self._finish(image_path)
+        self.stats.record(latency, seconds)
+        self.image_saved.emit(image_path, latency)
+        self._submit()
+        self._report()
+
+    def _on_image_failed(self, image_path, message):
+        self._finish(image_path)
+        self.stats.failed += 1
+        self.image_failed.emit(image_path, message)
+        self._submit()
+        self._report()
+
+    def _on_image_skipped(self, image_path):
+        self._finish(image_path)
+        self._report()